@@ -7,26 +7,141 @@ Verze: 1.0
 import sys
 import json
 import os
+import re
 import subprocess
+import threading
+import time
+import queue
+import calendar
+import weakref
+import shlex
+import sqlite3
+import hashlib
+import uuid
+import codecs
+import socket
+import tarfile
+import collections
+import ctypes
+import struct
+import concurrent.futures
+import functools
+import multiprocessing
+from contextlib import closing
 from pathlib import Path
 from PyQt5.QtWidgets import (
     QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout,
     QTreeWidget, QTreeWidgetItem, QListWidget, QPushButton, QLabel,
     QLineEdit, QTabWidget, QSplitter, QMessageBox, QFileDialog,
     QDialog, QFormLayout, QComboBox, QSpinBox, QTextEdit, QMenu,
-    QInputDialog, QProgressDialog, QCheckBox, QGroupBox
+    QInputDialog, QProgressDialog, QCheckBox, QGroupBox, QPlainTextEdit,
+    QTreeView
 )
-from PyQt5.QtCore import Qt, QThread, pyqtSignal, QSize
-from PyQt5.QtGui import QIcon, QFont
+from PyQt5.QtCore import (
+    Qt, QThread, QObject, QTimer, pyqtSignal, QSize, QAbstractTableModel, QModelIndex,
+    QFileSystemWatcher
+)
+from PyQt5.QtGui import QIcon, QFont, QTextCursor
 import ftplib
 from ftplib import FTP, FTP_TLS
 import paramiko
 from io import BytesIO
 import stat
 
+try:
+    # Volitelné - komprese zstd při hromadném nahrání přes tar
+    import zstandard
+except ImportError:
+    zstandard = None
+
 # Soubor pro ukládání prostředí
 CONFIG_FILE = "forte_environments.json"
 
+# Manifest posledních nahrání (vedle CONFIG_FILE)
+MANIFEST_FILE = os.path.join(os.path.dirname(CONFIG_FILE), "forte_manifest.sqlite")
+
+# Výchozí počet souběžných spojení při synchronizaci
+DEFAULT_PARALLEL_CONNECTIONS = 4
+
+# Po kolika nahráních podle manifestu se server ověří celý
+DEFAULT_MANIFEST_VERIFY_EVERY = 10
+
+# Kolik bajtů před místem navázání přenosu se porovná s druhou stranou
+RESUME_TAIL_SIZE = 64 * 1024
+
+# Od jaké velikosti (MB) se soubor přes SFTP přenáší po částech více kanály
+DEFAULT_SEGMENT_THRESHOLD_MB = 64
+
+# Výchozí nastavení SFTP přenosů: okno a paket kanálu, velikost jednoho
+# požadavku a počet nepotvrzených požadavků (zápis) / čtení dopředu (stažení)
+SFTP_DEFAULT_TUNING = {
+    'window_size': 2 * 1024 * 1024,
+    'max_packet_size': 32 * 1024,
+    'request_size': 32 * 1024,
+    'max_requests': 64
+}
+
+# Kombinace, které vyzkouší "Vyladit SFTP", a velikost zkušebního souboru
+SFTP_TUNING_CANDIDATES = [
+    SFTP_DEFAULT_TUNING,
+    {'window_size': 4 * 1024 * 1024, 'max_packet_size': 32 * 1024, 'request_size': 32 * 1024, 'max_requests': 128},
+    {'window_size': 8 * 1024 * 1024, 'max_packet_size': 64 * 1024, 'request_size': 64 * 1024, 'max_requests': 128},
+    {'window_size': 16 * 1024 * 1024, 'max_packet_size': 64 * 1024, 'request_size': 64 * 1024, 'max_requests': 256},
+    {'window_size': 32 * 1024 * 1024, 'max_packet_size': 128 * 1024, 'request_size': 128 * 1024, 'max_requests': 256}
+]
+SFTP_PROBE_SIZE = 4 * 1024 * 1024
+
+# Interval (s) keepalive zpráv sdíleného SSH spojení
+SSH_KEEPALIVE_INTERVAL = 30
+
+# Pool spojení: rozestup NOOP/kontrol (s) a jak dlouho čeká nepoužívané spojení
+POOL_KEEPALIVE_INTERVAL = 60
+POOL_IDLE_TIMEOUT = 15 * 60
+
+# Terminál: počet řádků historie a nejkratší rozestup překreslení (ms)
+TERMINAL_SCROLLBACK_LINES = 5000
+TERMINAL_FLUSH_INTERVAL_MS = 16
+
+# Hromadné nahrání přes tar: nejmenší počet souborů a největší soubor, který se do archivu přibalí
+TAR_UPLOAD_MIN_FILES = 20
+TAR_UPLOAD_MAX_FILE_SIZE = 4 * 1024 * 1024
+
+# Délka front mezi skenem, porovnáním a nahráváním při průběžné synchronizaci
+STREAM_QUEUE_SIZE = 64
+
+# Panely souborů: velikost dávky položek přidaných do modelu a časový díl GUI vlákna (s)
+FILE_LIST_BATCH = 500
+FILE_LIST_SLICE = 0.01
+
+# Automatické obnovení lokálního panelu po změně ve složce - odstup po poslední změně (ms)
+LOCAL_REFRESH_DELAY_MS = 500
+
+# Lokální index pro synchronizaci: jak často vyzvednout události inotify (ms), jak často
+# index celý ověřit procházením složek (ms) a největší počet souborů držených v paměti
+LOCAL_INDEX_EVENTS_MS = 2000
+LOCAL_INDEX_RECONCILE_MS = 5 * 60 * 1000
+LOCAL_INDEX_MAX_FILES = 500000
+
+# Jak dlouho platí uložený výpis vzdálené složky (s), 0 = bez cache
+DEFAULT_LISTING_CACHE_TTL = 60
+
+# Přednačítání podsložek: hloubka a nejvýše složek/položek na jednu navigaci
+PREFETCH_MAX_DEPTH = 2
+PREFETCH_MAX_DIRS = 40
+PREFETCH_MAX_ENTRIES = 20000
+# Limit přenosu přednačítání (B/s) a odhad velikosti jedné položky výpisu (B)
+PREFETCH_BANDWIDTH = 256 * 1024
+PREFETCH_ENTRY_BYTES = 100
+
+# Git diff/log: řádků na stránku (načte se při posunu ke konci), řádků v jedné dávce pro GUI,
+# strop řádků v okně (nejstarší se zahodí) a zkrácení extrémně dlouhých řádků (minifikace)
+GIT_VIEW_PAGE_LINES = 2000
+GIT_VIEW_BATCH_LINES = 200
+GIT_VIEW_MAX_LINES = 50000
+GIT_VIEW_MAX_LINE_CHARS = 2000
+# Počet commitů na jednu stránku logu
+GIT_LOG_PAGE = 200
+
 
 class EnvironmentDialog(QDialog):
     """Dialog pro vytvoření/editaci FTP/SSH prostředí"""
@@ -73,6 +188,75 @@ class EnvironmentDialog(QDialog):
         self.remote_path_input.setText("/")
         layout.addRow("Výchozí složka:", self.remote_path_input)
         
+        # Počet souběžných spojení pro synchronizaci
+        self.parallel_input = QSpinBox()
+        self.parallel_input.setRange(1, 16)
+        self.parallel_input.setValue(DEFAULT_PARALLEL_CONNECTIONS)
+        self.parallel_input.setToolTip("Kolik spojení se při \"Nahrát změny\" otevře najednou")
+        layout.addRow("Souběžná spojení:", self.parallel_input)
+        
+        # Rychlé načtení vzdáleného stromu jedním příkazem find (jen SFTP)
+        self.fast_scan_checkbox = QCheckBox("Rychlé skenování serveru přes SSH (find)")
+        self.fast_scan_checkbox.setChecked(True)
+        self.fast_scan_checkbox.setEnabled(False)
+        layout.addRow("", self.fast_scan_checkbox)
+        
+        # Hromadné nahrání mnoha malých souborů jedním proudem tar (jen SFTP)
+        self.tar_upload_combo = QComboBox()
+        self.tar_upload_combo.addItem("vypnuto", "")
+        self.tar_upload_combo.addItem("tar", "plain")
+        self.tar_upload_combo.addItem("tar + gzip", "gzip")
+        self.tar_upload_combo.addItem("tar + zstd", "zstd")
+        self.tar_upload_combo.setCurrentIndex(1)
+        self.tar_upload_combo.setEnabled(False)
+        self.tar_upload_combo.setToolTip("Malé soubory se při \"Nahrát změny\" pošlou jedním archivem přes SSH")
+        layout.addRow("Hromadné nahrání:", self.tar_upload_combo)
+        
+        # Velké soubory přes SFTP po částech souběžně (počet částí = souběžná spojení)
+        self.segment_input = QSpinBox()
+        self.segment_input.setRange(0, 100000)
+        self.segment_input.setValue(DEFAULT_SEGMENT_THRESHOLD_MB)
+        self.segment_input.setSpecialValueText("nikdy")
+        self.segment_input.setSuffix(" MB")
+        self.segment_input.setEnabled(False)
+        self.segment_input.setToolTip("Větší soubory se přenesou po částech přes více SFTP kanálů najednou")
+        layout.addRow("Dělit soubory nad:", self.segment_input)
+        
+        # Navazování přerušených přenosů
+        self.resume_combo = QComboBox()
+        self.resume_combo.addItem("vypnuto", "")
+        self.resume_combo.addItem("zapnuto", "resume")
+        self.resume_combo.addItem("zapnuto, ověřit konec souboru", "verify")
+        self.resume_combo.setCurrentIndex(2)
+        self.resume_combo.setToolTip(
+            "Částečně přenesený soubor se dokončí od místa přerušení.\n"
+            "Ruční nahrání a stažení naváže jen na soubor novější než zdroj a vždy ověří jeho konec.\n"
+            f"Ověření porovná jen posledních {RESUME_TAIL_SIZE // 1024} KiB před místem přerušení, ne celý soubor."
+        )
+        layout.addRow("Navazování přenosů:", self.resume_combo)
+        
+        # Platnost uložených výpisů vzdálených složek
+        self.listing_ttl_input = QSpinBox()
+        self.listing_ttl_input.setRange(0, 3600)
+        self.listing_ttl_input.setValue(DEFAULT_LISTING_CACHE_TTL)
+        self.listing_ttl_input.setSpecialValueText("vypnuto")
+        self.listing_ttl_input.setSuffix(" s")
+        self.listing_ttl_input.setToolTip("Navštívená složka se po tuto dobu zobrazí bez dotazu na server, 🔄 ji načte vždy znovu")
+        layout.addRow("Pamatovat výpisy složek:", self.listing_ttl_input)
+        
+        # Přednačítání podsložek přes další spojení
+        self.prefetch_checkbox = QCheckBox("Předem načítat podsložky (další spojení)")
+        self.prefetch_checkbox.setToolTip("Podsložky otevřené složky se na pozadí načtou do paměti, otevření je pak okamžité")
+        layout.addRow("", self.prefetch_checkbox)
+        
+        # Jak často při nahrávání podle manifestu ověřit celý server
+        self.verify_every_input = QSpinBox()
+        self.verify_every_input.setRange(0, 1000)
+        self.verify_every_input.setValue(DEFAULT_MANIFEST_VERIFY_EVERY)
+        self.verify_every_input.setSpecialValueText("nikdy")
+        self.verify_every_input.setSuffix(" nahrání")
+        layout.addRow("Ověřit server každých:", self.verify_every_input)
+        
         # Tlačítka
         btn_layout = QHBoxLayout()
         self.save_btn = QPushButton("Uložit")
@@ -91,6 +275,9 @@ class EnvironmentDialog(QDialog):
     
     def on_type_changed(self, index):
         """Změna výchozího portu podle typu"""
+        self.fast_scan_checkbox.setEnabled(index == 2)
+        self.tar_upload_combo.setEnabled(index == 2)
+        self.segment_input.setEnabled(index == 2)
         if index == 0:  # FTP
             self.port_input.setValue(21)
         elif index == 1:  # FTPS
@@ -110,6 +297,18 @@ class EnvironmentDialog(QDialog):
         self.user_input.setText(data.get('user', ''))
         self.pass_input.setText(data.get('password', ''))
         self.remote_path_input.setText(data.get('remote_path', '/'))
+        self.parallel_input.setValue(data.get('parallel_connections', DEFAULT_PARALLEL_CONNECTIONS))
+        self.fast_scan_checkbox.setChecked(data.get('ssh_fast_scan', True))
+        tar_index = self.tar_upload_combo.findData(data.get('ssh_tar_upload', 'plain'))
+        if tar_index >= 0:
+            self.tar_upload_combo.setCurrentIndex(tar_index)
+        self.segment_input.setValue(data.get('segment_threshold_mb', DEFAULT_SEGMENT_THRESHOLD_MB))
+        resume_index = self.resume_combo.findData(data.get('resume_transfers', 'verify'))
+        if resume_index >= 0:
+            self.resume_combo.setCurrentIndex(resume_index)
+        self.listing_ttl_input.setValue(data.get('listing_cache_ttl', DEFAULT_LISTING_CACHE_TTL))
+        self.prefetch_checkbox.setChecked(data.get('prefetch_listings', False))
+        self.verify_every_input.setValue(data.get('manifest_verify_every', DEFAULT_MANIFEST_VERIFY_EVERY))
     
     def get_data(self):
         """Získat data z formuláře"""
@@ -120,7 +319,15 @@ class EnvironmentDialog(QDialog):
             'port': self.port_input.value(),
             'user': self.user_input.text(),
             'password': self.pass_input.text(),
-            'remote_path': self.remote_path_input.text()
+            'remote_path': self.remote_path_input.text(),
+            'parallel_connections': self.parallel_input.value(),
+            'ssh_fast_scan': self.fast_scan_checkbox.isChecked(),
+            'ssh_tar_upload': self.tar_upload_combo.currentData(),
+            'resume_transfers': self.resume_combo.currentData(),
+            'segment_threshold_mb': self.segment_input.value(),
+            'listing_cache_ttl': self.listing_ttl_input.value(),
+            'prefetch_listings': self.prefetch_checkbox.isChecked(),
+            'manifest_verify_every': self.verify_every_input.value()
         }
 
 
@@ -131,14 +338,23 @@ class SSHTerminal(QWidget):
         super().__init__(parent)
         self.ssh_client = None
         self.channel = None
+        self.reader = None
+        
+        # Výstup čtený na pozadí, do widgetu se přenáší po dávkách
+        self._pending = []
+        self._pending_lock = threading.Lock()
+        self._flush_timer = QTimer(self)
+        self._flush_timer.setInterval(TERMINAL_FLUSH_INTERVAL_MS)
+        self._flush_timer.timeout.connect(self.flush_output)
         
         layout = QVBoxLayout()
         
-        # Terminálový výstup
-        self.terminal_output = QTextEdit()
+        # Terminálový výstup s omezenou historií
+        self.terminal_output = QPlainTextEdit()
         self.terminal_output.setReadOnly(True)
+        self.terminal_output.setMaximumBlockCount(TERMINAL_SCROLLBACK_LINES)
         self.terminal_output.setStyleSheet("""
-            QTextEdit {
+            QPlainTextEdit {
                 background-color: #1e1e1e;
                 color: #00ff00;
                 font-family: 'Consolas', 'Courier New', monospace;
@@ -160,30 +376,74 @@ class SSHTerminal(QWidget):
         
         self.setLayout(layout)
     
+    @staticmethod
+    def open_shell(ssh_client):
+        """Otevřít kanál se shellem na SSH spojení (volá se mimo GUI vlákno)"""
+        return ssh_client.invoke_shell()
+
+    def attach(self, ssh_client, channel, host, port):
+        """Převzít shell na sdíleném SSH spojení do terminálu"""
+        self.ssh_client = ssh_client
+        self.terminal_output.appendPlainText(f"Připojeno k {host}:{port}\n")
+        self.start_reader(channel)
+
+    def start_reader(self, channel):
+        """Spustit čtení výstupu kanálu na pozadí"""
+        self.channel = channel
+        self.reader = threading.Thread(target=self.read_channel, args=(channel,), daemon=True)
+        self.reader.start()
+        self._flush_timer.start()
+
+    def read_channel(self, channel):
+        """Číst výstup shellu, jakmile přijde (vlastní vlákno)"""
+        # Přírůstkové dekódování - znak rozdělený mezi dva bloky se neztratí
+        decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+        try:
+            while True:
+                data = channel.recv(65536)
+                if not data:
+                    break
+                text = decoder.decode(data)
+                if text:
+                    with self._pending_lock:
+                        self._pending.append(text)
+        except Exception:
+            pass
+        with self._pending_lock:
+            self._pending.append(decoder.decode(b'', final=True))
+            if channel is self.channel:
+                self._pending.append("\n[Shell byl ukončen]\n")
+
+    def flush_output(self):
+        """Přenést nashromážděný výstup do widgetu (nejvýš jednou za interval časovače)"""
+        with self._pending_lock:
+            if not self._pending:
+                return
+            text = ''.join(self._pending)
+            self._pending = []
+        
+        scrollbar = self.terminal_output.verticalScrollBar()
+        at_bottom = scrollbar.value() == scrollbar.maximum()
+        cursor = self.terminal_output.textCursor()
+        cursor.movePosition(QTextCursor.End)
+        cursor.insertText(text.replace('\r\n', '\n'))
+        if at_bottom:
+            scrollbar.setValue(scrollbar.maximum())
+
     def connect(self, host, port, username, password):
         """Připojení k SSH serveru"""
         try:
-            self.ssh_client = paramiko.SSHClient()
-            self.ssh_client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-            self.ssh_client.connect(host, port=port, username=username, password=password)
-            
-            self.channel = self.ssh_client.invoke_shell()
-            self.terminal_output.append(f"Připojeno k {host}:{port}\n")
-            
-            # Přečíst uvítací zprávu
-            import time
-            time.sleep(0.5)
-            if self.channel.recv_ready():
-                output = self.channel.recv(4096).decode('utf-8', errors='ignore')
-                self.terminal_output.append(output)
-            
+            session = SSHSession({'host': host, 'port': port, 'user': username, 'password': password})
+            session.connect()
+            channel = self.open_shell(session)
+            self.attach(session, channel, host, port)
             return True
         except Exception as e:
             QMessageBox.critical(self, "Chyba SSH", f"Nepodařilo se připojit:\n{str(e)}")
             return False
     
     def execute_command(self):
-        """Vykonat příkaz"""
+        """Odeslat příkaz, výstup se zobrazuje průběžně"""
         if not self.channel:
             QMessageBox.warning(self, "SSH Terminal", "Nejste připojeni k SSH serveru!")
             return
@@ -193,193 +453,3729 @@ class SSHTerminal(QWidget):
             return
         
         try:
-            self.terminal_output.append(f"$ {command}\n")
-            self.channel.send(command + '\n')
-            
-            # Počkat na odpověď
-            import time
-            time.sleep(0.3)
-            
-            output = ""
-            while self.channel.recv_ready():
-                output += self.channel.recv(4096).decode('utf-8', errors='ignore')
-            
-            if output:
-                self.terminal_output.append(output)
+            # Po obnovení spojení je starý shell zavřený - otevřít nový
+            if self.channel.closed:
+                self.start_reader(self.open_shell(self.ssh_client))
+                self.terminal_output.appendPlainText("Spojení bylo obnoveno.\n")
             
+            self.channel.send(command + '\n')
             self.command_input.clear()
             
         except Exception as e:
-            self.terminal_output.append(f"Chyba: {str(e)}\n")
+            self.terminal_output.appendPlainText(f"Chyba: {str(e)}\n")
     
     def disconnect(self):
-        """Odpojit SSH"""
+        """Odpojit SSH (spojení sdílené se SFTP zavírá hlavní okno)"""
         if self.ssh_client:
-            self.ssh_client.close()
+            channel = self.channel
             self.ssh_client = None
             self.channel = None
-            self.terminal_output.append("\nOdpojeno.\n")
+            if channel:
+                # recv ve čtecím vlákně vrátí prázdná data a vlákno skončí
+                channel.close()
+            self._flush_timer.stop()
+            self.flush_output()
+            self.terminal_output.appendPlainText("\nOdpojeno.\n")
 
 
-class FileTransferThread(QThread):
-    """Vlákno pro přenos souborů"""
-    progress = pyqtSignal(int)
-    finished = pyqtSignal(bool, str)
-    
-    def __init__(self, operation, source, dest, ftp_client=None, ssh_client=None):
+def format_size(size):
+    """Formátovat velikost souboru"""
+    for unit in ['B', 'KB', 'MB', 'GB']:
+        if size < 1024.0:
+            return f"{size:.1f} {unit}"
+        size /= 1024.0
+    return f"{size:.1f} TB"
+
+
+class FileEntry:
+    """Položka panelu souborů - kompaktní záznam místo widgetu pro každý řádek"""
+    __slots__ = ('name', 'path', 'is_dir', 'size')
+
+    def __init__(self, name, path, is_dir, size=None):
+        self.name = name
+        self.path = path
+        self.is_dir = is_dir
+        self.size = size
+
+
+def local_file_entries(scanner):
+    """Převést výpis os.scandir na FileEntry (velikost se zjišťuje jen u souborů)"""
+    with scanner:
+        for item in scanner:
+            try:
+                is_dir = item.is_dir()
+                size = None if is_dir else item.stat().st_size
+            except OSError:
+                # Rozbitý symlink nebo položka smazaná během výpisu
+                is_dir, size = False, None
+            yield FileEntry(item.name, item.path, is_dir, size)
+
+
+class FileListModel(QAbstractTableModel):
+    """Model panelu souborů, view si řádky vykresluje až při zobrazení
+
+    Položky se přidávají po dávkách během načítání složky. Řazení (složky vždy
+    první) i filtrování podle názvu probíhá v modelu nad seznamem FileEntry.
+    """
+    HEADERS = ["Název", "Velikost", "Typ"]
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.entries = []
+        self.rows = []
+        self.parent_entry = None
+        self.filter_text = ''
+        self.sort_column = 0
+        self.sort_order = Qt.AscendingOrder
+
+    def reset(self, parent_path=None):
+        """Vyprázdnit model, parent_path je cíl odkazu '..' (None = bez odkazu)"""
+        self.beginResetModel()
+        self.entries = []
+        self.parent_entry = FileEntry("..", parent_path, True) if parent_path else None
+        self.rows = [self.parent_entry] if self.parent_entry else []
+        self.endResetModel()
+
+    def append(self, entries):
+        """Přidat dávku načtených položek na konec (seřadí se až ve finish)"""
+        self.entries.extend(entries)
+        visible = [entry for entry in entries if self.matches(entry)]
+        if visible:
+            first = len(self.rows)
+            self.beginInsertRows(QModelIndex(), first, first + len(visible) - 1)
+            self.rows.extend(visible)
+            self.endInsertRows()
+
+    def finish(self):
+        """Seřadit po načtení celé složky"""
+        self.sort(self.sort_column, self.sort_order)
+
+    def matches(self, entry):
+        """Zjistit, zda položka projde filtrem"""
+        return not self.filter_text or self.filter_text in entry.name.casefold()
+
+    def set_filter(self, text):
+        """Zobrazit jen položky, jejichž název obsahuje text"""
+        self.filter_text = text.strip().casefold()
+        self.sort(self.sort_column, self.sort_order)
+
+    def sort_key(self, entry):
+        if self.sort_column == 1:
+            return entry.size or 0, entry.name.casefold()
+        return entry.name.casefold()
+
+    def sort(self, column, order=Qt.AscendingOrder):
+        self.sort_column = column
+        self.sort_order = order
+        reverse = order == Qt.DescendingOrder
+        visible = [entry for entry in self.entries if self.matches(entry)]
+        dirs = sorted((entry for entry in visible if entry.is_dir), key=self.sort_key, reverse=reverse)
+        files = sorted((entry for entry in visible if not entry.is_dir), key=self.sort_key, reverse=reverse)
+
+        self.beginResetModel()
+        self.rows = ([self.parent_entry] if self.parent_entry else []) + dirs + files
+        self.endResetModel()
+
+    def entry(self, index):
+        """FileEntry pro index view nebo None"""
+        if not index.isValid() or index.row() >= len(self.rows):
+            return None
+        return self.rows[index.row()]
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.rows)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.HEADERS)
+
+    def data(self, index, role=Qt.DisplayRole):
+        entry = self.entry(index)
+        if entry is None:
+            return None
+        if role == Qt.DisplayRole:
+            column = index.column()
+            if column == 0:
+                return entry.name
+            if column == 1:
+                return "" if entry.is_dir or entry.size is None else format_size(entry.size)
+            return "📁 Složka" if entry.is_dir else "📄 Soubor"
+        if role == Qt.UserRole:
+            return entry.path
+        return None
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if orientation == Qt.Horizontal and role == Qt.DisplayRole:
+            return self.HEADERS[section]
+        return None
+
+
+class OperationCancelled(Exception):
+    """Operace byla zrušena uživatelem"""
+
+
+class OperationThread(QThread):
+    """Vlákno pro běh síťové nebo Git operace mimo GUI vlákno"""
+    progress = pyqtSignal('qint64', 'qint64', str)
+    partial = pyqtSignal(object)
+    succeeded = pyqtSignal(object)
+    failed = pyqtSignal(str)
+    cancelled = pyqtSignal()
+
+    # Minimální rozestup hlášení průběhu (60 snímků za sekundu)
+    PROGRESS_INTERVAL = 1 / 60
+
+    def __init__(self, func=None, *args, lock=None, **kwargs):
         super().__init__()
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.lock = lock
+        self.generation = 0
+        self._cancel_event = threading.Event()
+        self._last_report = 0.0
+
+    def cancel(self):
+        """Požádat o zrušení operace"""
+        self._cancel_event.set()
+
+    def is_cancelled(self):
+        """Zjistit, zda bylo požádáno o zrušení"""
+        return self._cancel_event.is_set()
+
+    def check_cancelled(self):
+        """Vyhodit OperationCancelled, pokud bylo požádáno o zrušení"""
+        if self._cancel_event.is_set():
+            raise OperationCancelled()
+
+    def pause(self, seconds):
+        """Počkat, zrušení čekání hned přeruší (OperationCancelled)"""
+        if seconds > 0 and self._cancel_event.wait(seconds):
+            raise OperationCancelled()
+
+    def report(self, value, maximum, text="", force=False):
+        """Nahlásit průběh (omezeno na PROGRESS_INTERVAL)"""
+        now = time.monotonic()
+        if force or now - self._last_report >= self.PROGRESS_INTERVAL:
+            self._last_report = now
+            self.progress.emit(value, maximum, text)
+
+    def emit_partial(self, data):
+        """Předat GUI část výsledku ještě před dokončením operace"""
+        self.partial.emit(data)
+
+    def execute(self):
+        """Vlastní práce vlákna, vrací výsledek operace"""
+        return self.func(self, *self.args, **self.kwargs)
+
+    def run(self):
+        try:
+            if self.lock is not None:
+                with self.lock:
+                    self.check_cancelled()
+                    result = self.execute()
+            else:
+                result = self.execute()
+        except OperationCancelled:
+            self.cancelled.emit()
+        except Exception as e:
+            self.failed.emit(str(e))
+        else:
+            self.succeeded.emit(result)
+
+
+class FileTransferThread(OperationThread):
+    """Vlákno pro přenos souborů"""
+
+    def __init__(self, operation, source, dest, ftp_client=None, sftp_client=None, lock=None, resume='', segments=1, segment_threshold=0):
+        super().__init__(lock=lock)
         self.operation = operation
         self.source = source
         self.dest = dest
         self.ftp_client = ftp_client
-        self.ssh_client = ssh_client
-    
-    def run(self):
-        try:
-            if self.operation == "upload":
-                self.upload_file()
-            elif self.operation == "download":
-                self.download_file()
-            self.finished.emit(True, "Úspěšně dokončeno")
-        except Exception as e:
-            self.finished.emit(False, str(e))
-    
+        self.sftp_client = sftp_client
+        # '' - vždy od začátku, 'resume' - navázat na částečný soubor, 'verify' - navázat po ověření konce
+        self.resume = resume
+        # Soubory od segment_threshold bajtů se přes SFTP přenesou po segments částech
+        self.segments = segments
+        self.segment_threshold = segment_threshold
+
+    def use_segments(self, total, partial):
+        """Zjistit, zda soubor přenést po částech (na částečný soubor se raději naváže)"""
+        if not self.sftp_client or self.segments < 2 or not self.segment_threshold:
+            return False
+        if total < self.segment_threshold:
+            return False
+        return not (self.resume and partial and 0 < partial < total)
+
+    def resume_offset(self, partial, partial_mtime, source_mtime):
+        """Pozice, od které navázat na částečný soubor druhé strany, jinak 0
+
+        Kratší soubor starší než zdroj je jiná verze, ne přerušený přenos -
+        navázáním by vznikl mix staré a nové verze.
+        """
+        if not self.resume or not partial or partial_mtime is None or source_mtime is None:
+            return 0
+        if partial_mtime < int(source_mtime):
+            return 0
+        return partial
+
+    def execute(self):
+        if self.operation == "upload":
+            self.upload_file()
+        elif self.operation == "download":
+            self.download_file()
+        return self.dest
+
     def upload_file(self):
-        """Nahrát soubor na FTP"""
-        with open(self.source, 'rb') as f:
-            self.ftp_client.storbinary(f'STOR {self.dest}', f)
-    
+        """Nahrát soubor na FTP/SFTP"""
+        total = os.path.getsize(self.source)
+        label = f"⬆️ {os.path.basename(self.source)}"
+
+        def on_progress(done, size):
+            self.report(done, size, label)
+            self.check_cancelled()
+
+        offset = 0
+        if self.resume or self.sftp_client:
+            partial = remote_file_size(self.dest, self.ftp_client, self.sftp_client)
+            if self.resume and partial:
+                remote_mtime = remote_file_mtime(self.dest, self.ftp_client, self.sftp_client)
+                offset = self.resume_offset(partial, remote_mtime, os.path.getmtime(self.source))
+
+        if self.use_segments(total, offset):
+            transfer_segmented_sftp(self.sftp_client, 'upload', self.source, self.dest, self.segments, on_progress)
+            self.report(total, total, label, force=True)
+            return
+
+        try:
+            # Ruční přenos konec částečného souboru ověří vždy
+            upload_resumable(
+                self.source, self.dest, self.ftp_client, self.sftp_client,
+                offset=offset, verify_tail=True, callback=on_progress
+            )
+        except OperationCancelled:
+            if self.ftp_client:
+                recover_ftp_after_cancel(self.ftp_client, download=False)
+            raise
+
+        self.report(total, total, label, force=True)
+
     def download_file(self):
-        """Stáhnout soubor z FTP"""
-        with open(self.dest, 'wb') as f:
-            self.ftp_client.retrbinary(f'RETR {self.source}', f.write)
+        """Stáhnout soubor z FTP/SFTP"""
+        label = f"⬇️ {os.path.basename(self.dest)}"
 
+        def on_progress(done, size):
+            self.report(done, size, label)
+            self.check_cancelled()
 
-class FORTEftp(QMainWindow):
-    """Hlavní okno aplikace FORTEftp"""
-    
-    def __init__(self):
-        super().__init__()
-        self.setWindowTitle("FORTEftp - FTP/SSH Klient")
-        self.setGeometry(100, 100, 1200, 700)
-        
-        # Nastavit ikonu
-        icon_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "icon.ico")
-        if os.path.exists(icon_path):
-            self.setWindowIcon(QIcon(icon_path))
-        
-        self.ftp_client = None
-        self.ssh_client = None
-        self.sftp_client = None
-        self.current_env = None
-        self.current_remote_path = "/"
-        self.current_local_path = str(Path.home())
-        self.git_repo_root = None
-        
-        self.init_ui()
-        self.load_environments()
-    
-    def init_ui(self):
-        """Inicializace uživatelského rozhraní"""
-        central_widget = QWidget()
-        self.setCentralWidget(central_widget)
-        
-        main_layout = QVBoxLayout()
-        
-        # Horní panel - výběr prostředí
-        top_panel = self.create_top_panel()
-        main_layout.addLayout(top_panel)
-        
-        # Hlavní obsah - záložky
-        self.tabs = QTabWidget()
-        
-        # Záložka FTP správce
-        self.ftp_tab = self.create_ftp_tab()
-        self.tabs.addTab(self.ftp_tab, "📁 FTP Správce")
-        
-        # Záložka SSH terminál
-        self.ssh_terminal = SSHTerminal()
-        self.tabs.addTab(self.ssh_terminal, "💻 SSH Terminál")
+        offset = 0
+        if self.resume and os.path.isfile(self.dest):
+            partial = os.path.getsize(self.dest)
+            if partial:
+                remote_mtime = remote_file_mtime(self.source, self.ftp_client, self.sftp_client)
+                offset = self.resume_offset(partial, os.path.getmtime(self.dest), remote_mtime)
 
-        # Záložka Git
-        self.git_tab = self.create_git_tab()
-        self.tabs.addTab(self.git_tab, "🧩 Git")
-        
-        main_layout.addWidget(self.tabs)
-        
-        # Stavový řádek
-        self.status_label = QLabel("Nepřipojeno")
-        main_layout.addWidget(self.status_label)
-        
-        central_widget.setLayout(main_layout)
-    
-    def create_top_panel(self):
-        """Vytvořit horní panel s ovládáním"""
-        layout = QHBoxLayout()
-        
-        # Výběr prostředí
-        layout.addWidget(QLabel("Prostředí:"))
-        self.env_combo = QComboBox()
-        self.env_combo.setMinimumWidth(200)
-        layout.addWidget(self.env_combo)
-        
-        # Tlačítka pro správu prostředí
-        self.new_env_btn = QPushButton("➕ Nové")
-        self.new_env_btn.clicked.connect(self.new_environment)
-        layout.addWidget(self.new_env_btn)
-        
-        self.edit_env_btn = QPushButton("✏️ Upravit")
-        self.edit_env_btn.clicked.connect(self.edit_environment)
-        layout.addWidget(self.edit_env_btn)
-        
-        self.delete_env_btn = QPushButton("🗑️ Smazat")
-        self.delete_env_btn.clicked.connect(self.delete_environment)
-        layout.addWidget(self.delete_env_btn)
-        
-        layout.addSpacing(20)
-        
-        # Tlačítko připojit/odpojit
-        self.connect_btn = QPushButton("🔌 Připojit")
-        self.connect_btn.clicked.connect(self.toggle_connection)
-        self.connect_btn.setStyleSheet("QPushButton { font-weight: bold; padding: 5px 15px; }")
-        layout.addWidget(self.connect_btn)
-        
-        layout.addStretch()
-        
-        return layout
-    
-    def create_ftp_tab(self):
-        """Vytvořit záložku FTP správce"""
-        widget = QWidget()
-        layout = QVBoxLayout()
-        
-        # Splitter pro rozdělení na levou a pravou část
-        splitter = QSplitter(Qt.Horizontal)
-        
-        # Levá strana - lokální soubory
-        left_panel = QWidget()
-        left_layout = QVBoxLayout()
-        
-        left_layout.addWidget(QLabel("💻 Lokální soubory:"))
-        
-        # Navigace
-        local_nav = QHBoxLayout()
-        self.local_path_input = QLineEdit(self.current_local_path)
-        self.local_path_input.returnPressed.connect(self.refresh_local_files)
-        local_nav.addWidget(self.local_path_input)
-        self.local_refresh_btn = QPushButton("🔄")
-        self.local_refresh_btn.clicked.connect(self.refresh_local_files)
-        local_nav.addWidget(self.local_refresh_btn)
-        left_layout.addLayout(local_nav)
-        
-        # Seznam souborů
-        self.local_tree = QTreeWidget()
-        self.local_tree.setHeaderLabels(["Název", "Velikost", "Typ"])
-        self.local_tree.setContextMenuPolicy(Qt.CustomContextMenu)
-        self.local_tree.customContextMenuRequested.connect(self.local_context_menu)
-        self.local_tree.itemDoubleClicked.connect(self.local_item_double_clicked)
+        if self.sftp_client:
+            total = remote_file_size(self.source, sftp_client=self.sftp_client) or 0
+            if self.use_segments(total, offset):
+                transfer_segmented_sftp(self.sftp_client, 'download', self.source, self.dest, self.segments, on_progress)
+                self.report(total, total, label, force=True)
+                return
+
+        try:
+            download_resumable(
+                self.source, self.dest, self.ftp_client, self.sftp_client,
+                resume=bool(offset), verify_tail=True, callback=on_progress
+            )
+        except OperationCancelled:
+            if self.ftp_client:
+                recover_ftp_after_cancel(self.ftp_client, download=True)
+            raise
+
+
+def recover_ftp_after_cancel(ftp_client, download):
+    """Srovnat řídicí spojení FTP po přerušeném přenosu"""
+    try:
+        if download:
+            ftp_client.abort()
+        else:
+            ftp_client.voidresp()
+    except Exception:
+        pass
+
+
+def remote_file_size(path, ftp_client=None, sftp_client=None):
+    """Velikost vzdáleného souboru, nebo None pokud neexistuje či ji nelze zjistit"""
+    try:
+        if ftp_client:
+            # SIZE vrací přesnou velikost jen v binárním režimu
+            ftp_client.voidcmd('TYPE I')
+            return ftp_client.size(path)
+        return sftp_client.stat(path).st_size
+    except Exception:
+        return None
+
+
+def remote_file_mtime(path, ftp_client=None, sftp_client=None):
+    """Čas změny vzdáleného souboru (UTC timestamp), nebo None pokud ho nelze zjistit"""
+    try:
+        if ftp_client:
+            # Odpověď je ve formátu: "213 YYYYMMDDhhmmss"
+            response = ftp_client.voidcmd(f"MDTM {path}")
+            return parse_mlsd_time(response[4:].strip()) if response.startswith('213 ') else None
+        return sftp_client.stat(path).st_mtime
+    except Exception:
+        return None
+
+
+def read_remote_range(path, offset, length, ftp_client=None, sftp_client=None):
+    """Přečíst length bajtů vzdáleného souboru od pozice offset"""
+    if sftp_client:
+        with sftp_client.open(path, 'rb') as f:
+            f.seek(offset)
+            return f.read(length)
+
+    ftp_client.voidcmd('TYPE I')
+    data = b''
+    with closing(ftp_client.transfercmd(f'RETR {path}', rest=offset)) as conn:
+        while len(data) < length:
+            chunk = conn.recv(min(65536, length - len(data)))
+            if not chunk:
+                break
+            data += chunk
+    try:
+        # Přenos jsme ukončili dřív - server odpoví 226 nebo 426
+        ftp_client.voidresp()
+    except ftplib.all_errors:
+        pass
+    return data
+
+
+def tail_matches(local_path, offset, remote_path, ftp_client=None, sftp_client=None):
+    """Ověřit, že konec částečného souboru před offset souhlasí s druhou stranou"""
+    start = max(0, offset - RESUME_TAIL_SIZE)
+    with open(local_path, 'rb') as f:
+        f.seek(start)
+        local_tail = f.read(offset - start)
+    remote_tail = read_remote_range(remote_path, start, offset - start, ftp_client, sftp_client)
+    return hashlib.blake2b(local_tail).digest() == hashlib.blake2b(remote_tail).digest()
+
+
+def upload_resumable(local_path, remote_path, ftp_client=None, sftp_client=None, offset=None, verify_tail=True, callback=None):
+    """Nahrát soubor, případně navázat na částečně nahraný soubor na serveru
+
+    offset None - zjistit velikost vzdáleného souboru a navázat za ni,
+    0 - nahrát celý soubor. Navazuje se jen na kratší vzdálený soubor;
+    při verify_tail se nejdřív porovná jeho konec. callback(done, total)
+    hlásí průběh v bajtech. Vrací pozici, od které se nahrávalo.
+    """
+    total = os.path.getsize(local_path)
+    if offset is None:
+        offset = remote_file_size(remote_path, ftp_client, sftp_client) or 0
+    if not 0 < offset < total:
+        offset = 0
+    if offset and verify_tail and not tail_matches(local_path, offset, remote_path, ftp_client, sftp_client):
+        offset = 0
+
+    done = offset
+    with open(local_path, 'rb') as f:
+        f.seek(offset)
+
+        if ftp_client:
+            def on_block(block):
+                nonlocal done
+                done += len(block)
+                if callback:
+                    callback(done, total)
+
+            # APPE připojí data na konec vzdáleného souboru
+            command = f'APPE {remote_path}' if offset else f'STOR {remote_path}'
+            ftp_client.storbinary(command, f, callback=on_block)
+
+        else:
+            remote, tuning = sftp_open(sftp_client, remote_path, 'r+b' if offset else 'wb')
+            with remote:
+                remote.seek(offset)
+                sftp_write_from(f, remote, tuning, callback, done, total)
+
+    return offset
+
+
+def download_resumable(remote_path, local_path, ftp_client=None, sftp_client=None, resume=True, verify_tail=True, callback=None):
+    """Stáhnout soubor, případně navázat na částečně stažený lokální soubor
+
+    Navazuje se jen na kratší lokální soubor, při verify_tail po porovnání
+    jeho konce se serverem. Vrací pozici, od které se stahovalo.
+    """
+    total = remote_file_size(remote_path, ftp_client, sftp_client) or 0
+    offset = 0
+    if resume and os.path.isfile(local_path):
+        offset = os.path.getsize(local_path)
+    if not 0 < offset < total:
+        offset = 0
+    if offset and verify_tail and not tail_matches(local_path, offset, remote_path, ftp_client, sftp_client):
+        offset = 0
+
+    done = offset
+    with open(local_path, 'ab' if offset else 'wb') as f:
+        if ftp_client:
+            def on_block(block):
+                nonlocal done
+                f.write(block)
+                done += len(block)
+                if callback:
+                    callback(done, total)
+
+            ftp_client.retrbinary(f'RETR {remote_path}', on_block, rest=offset or None)
+
+        else:
+            remote, tuning = sftp_open(sftp_client, remote_path, 'rb')
+            with remote:
+                sftp_read_into(remote, f, tuning, offset, total, callback, done, total)
+
+    return offset
+
+
+def remote_sha256_ssh(transport, path):
+    """SHA-256 vzdáleného souboru přes sha256sum, nebo None pokud ho server nemá"""
+    try:
+        channel = transport.open_session()
+    except paramiko.SSHException:
+        # Server jen pro SFTP bez příkazů
+        return None
+    try:
+        try:
+            channel.exec_command(f"sha256sum -- {shlex.quote(path)}")
+        except paramiko.SSHException:
+            return None
+        output = b''
+        while True:
+            chunk = channel.recv(65536)
+            if not chunk:
+                break
+            output += chunk
+        if channel.recv_exit_status() != 0:
+            return None
+    finally:
+        channel.close()
+    digest = output.decode('utf-8', errors='ignore').lstrip('\\').split(' ', 1)[0]
+    return digest.lower() or None
+
+
+def sftp_sha256(sftp_client, path, callback=None):
+    """SHA-256 vzdáleného souboru přečteného zpět přes SFTP (server bez sha256sum)"""
+    digest = hashlib.sha256()
+    with sftp_client.open(path, 'rb') as f:
+        total = f.stat().st_size
+        f.prefetch(total)
+        done = 0
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+            done += len(chunk)
+            if callback:
+                callback(done, total)
+    return digest.hexdigest()
+
+
+def segment_ranges(total, segments):
+    """Rozdělit total bajtů na nejvýš segments navazujících úseků [start, end), každý aspoň 1 MiB"""
+    segments = max(1, min(segments, total // (1024 * 1024) or 1))
+    step = -(-total // segments)
+    if not step:
+        # Prázdný soubor - není co přenášet, ověří se jen součet
+        return []
+    return [(start, min(start + step, total)) for start in range(0, total, step)]
+
+
+def transfer_segmented_sftp(sftp_client, direction, source, dest, segments, callback=None):
+    """Přenést velký soubor po částech přes několik SFTP kanálů najednou
+
+    direction je 'upload' nebo 'download'. Každý úsek bajtů má vlastní SFTP
+    kanál na stejném SSH spojení a zapisuje se na své místo v cílovém
+    souboru. Nakonec se porovná SHA-256 obou stran - pokud server nemá
+    sha256sum, vzdálený soubor se pro výpočet přečte zpět přes SFTP.
+    Nesouhlasící součet vyvolá RuntimeError.
+    """
+    transport = sftp_client.get_channel().get_transport()
+    upload = direction == 'upload'
+
+    # Cílový soubor předem vytvořit v plné délce, části se zapíšou na své místo
+    if upload:
+        total = os.path.getsize(source)
+        with sftp_client.open(dest, 'wb') as f:
+            f.truncate(total)
+    else:
+        total = sftp_client.stat(source).st_size
+        with open(dest, 'wb') as f:
+            f.truncate(total)
+
+    ranges = segment_ranges(total, segments)
+
+    stop = threading.Event()
+    errors = []
+    done = 0
+    lock = threading.Lock()
+    tuning = _sftp_tuning.get(sftp_client, SFTP_DEFAULT_TUNING)
+
+    def run(start, end):
+        reported = 0
+
+        def on_chunk(segment_done, _):
+            nonlocal done, reported
+            if stop.is_set():
+                raise OperationCancelled()
+            with lock:
+                done += segment_done - reported
+                reported = segment_done
+                if callback:
+                    callback(done, total)
+
+        client = open_tuned_sftp(transport, tuning)
+        try:
+            if upload:
+                remote_file, _ = sftp_open(client, dest, 'r+b')
+                with open(source, 'rb') as src, remote_file:
+                    src.seek(start)
+                    remote_file.seek(start)
+                    copied = sftp_write_from(src, remote_file, tuning, on_chunk, 0, total, end - start)
+            else:
+                remote_file, _ = sftp_open(client, source, 'rb')
+                with remote_file, open(dest, 'r+b') as dst:
+                    dst.seek(start)
+                    copied = sftp_read_into(remote_file, dst, tuning, start, end, on_chunk, 0, total)
+            if copied != end - start:
+                raise IOError(f"Soubor se během přenosu zkrátil ({source})")
+        except Exception as e:
+            # I zrušení z callbacku - zastavit ostatní části
+            errors.append(e)
+            stop.set()
+        finally:
+            client.close()
+
+    threads = [threading.Thread(target=run, args=segment, daemon=True) for segment in ranges]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    if errors:
+        raise errors[0]
+
+    remote_path = dest if upload else source
+    remote_digest = remote_sha256_ssh(transport, remote_path)
+    if remote_digest is None:
+        # Bez ověření by se nezkontrolovaný přenos hlásil jako úspěšný
+        remote_digest = sftp_sha256(sftp_client, remote_path, callback)
+    if hash_file(source if upload else dest, 'sha256') != remote_digest:
+        raise RuntimeError(f"Kontrolní součet po přenosu po částech nesouhlasí: {os.path.basename(dest)}")
+
+
+class ReusedSessionFTP_TLS(FTP_TLS):
+    """FTPS klient, jehož datová spojení obnovují TLS relaci řídicího spojení
+
+    Obnovená relace ušetří plný handshake u každého LIST/STOR/RETR a řada
+    serverů ji navíc vyžaduje. tls_stats počítá handshaky datových spojení,
+    kolik z nich relaci obnovilo a jejich celkový čas.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.tls_stats = {'handshakes': 0, 'reused': 0, 'handshake_time': 0.0}
+
+    def ntransfercmd(self, cmd, rest=None):
+        conn, size = FTP.ntransfercmd(self, cmd, rest)
+        if self._prot_p:
+            started = time.perf_counter()
+            try:
+                conn = self.context.wrap_socket(conn, server_hostname=self.host, session=self.sock.session)
+            except Exception:
+                conn.close()
+                raise
+            self.tls_stats['handshakes'] += 1
+            self.tls_stats['reused'] += int(conn.session_reused)
+            self.tls_stats['handshake_time'] += time.perf_counter() - started
+        return conn, size
+
+
+def tls_stats_snapshot(ftp_client):
+    """Aktuální počítadla TLS handshaků FTPS spojení (prázdné u FTP)"""
+    return dict(getattr(ftp_client, 'tls_stats', None) or {})
+
+
+def open_ftp_connection(env):
+    """Otevřít a přihlásit nové FTP/FTPS spojení podle prostředí"""
+    if env['type'] == "FTPS":
+        ftp_client = ReusedSessionFTP_TLS()
+    else:
+        ftp_client = FTP()
+
+    try:
+        ftp_client.connect(env['host'], env['port'])
+        ftp_client.login(env['user'], env['password'])
+
+        if env['type'] == "FTPS":
+            ftp_client.prot_p()
+    except Exception:
+        ftp_client.close()
+        raise
+
+    return ftp_client
+
+
+# Nastavení přenosů pro každého SFTP klienta
+_sftp_tuning = weakref.WeakKeyDictionary()
+
+
+def sftp_tuning(env):
+    """Nastavení SFTP přenosů prostředí doplněné o výchozí hodnoty"""
+    tuning = dict(SFTP_DEFAULT_TUNING)
+    tuning.update(env.get('sftp_tuning') or {})
+    return tuning
+
+
+def open_tuned_sftp(transport, tuning):
+    """Otevřít SFTP kanál s daným oknem a velikostí paketu"""
+    sftp_client = paramiko.SFTPClient.from_transport(
+        transport,
+        window_size=tuning['window_size'],
+        max_packet_size=tuning['max_packet_size']
+    )
+    _sftp_tuning[sftp_client] = tuning
+    return sftp_client
+
+
+def sftp_open(sftp_client, path, mode):
+    """Otevřít vzdálený soubor s velikostí požadavků podle nastavení klienta, vrací (soubor, nastavení)"""
+    tuning = _sftp_tuning.get(sftp_client, SFTP_DEFAULT_TUNING)
+    remote_file = sftp_client.open(path, mode)
+    remote_file.MAX_REQUEST_SIZE = tuning['request_size']
+    return remote_file, tuning
+
+
+def can_limit_sftp_writes(remote_file):
+    """Zjistit, zda paramiko odhaluje frontu nepotvrzených zápisů pro wait_sftp_writes"""
+    return (hasattr(getattr(remote_file, '_reqs', None), 'popleft')
+            and hasattr(getattr(remote_file, 'sftp', None), '_read_response'))
+
+
+def wait_sftp_writes(remote_file, limit):
+    """Počkat na potvrzení zápisů, dokud jich nečeká víc než limit"""
+    # paramiko u zřetězeného zápisu potvrzení sbírá až při zavření souboru.
+    # Fronta _reqs a _read_response jsou vnitřnosti SFTPFile/SFTPClient
+    # ověřené s paramiko 3.4.0 z requirements.txt (a 5.0) - při povýšení
+    # paramiko je nutné je zkontrolovat, jinak může nahrávání viset.
+    while len(remote_file._reqs) > limit:
+        request = remote_file._reqs.popleft()
+        response_type, _ = remote_file.sftp._read_response(request)
+        if response_type != paramiko.sftp.CMD_STATUS:
+            raise IOError("Neočekávaná odpověď SFTP serveru na zápis")
+
+
+def sftp_write_from(local_file, remote_file, tuning, callback=None, done=0, total=0, length=None):
+    """Zapisovat z lokálního souboru zřetězeně s omezeným počtem nepotvrzených požadavků
+
+    Zapisuje od aktuálních pozic obou souborů do konce, nebo length bajtů.
+    callback(done, total) hlásí průběh. Vrací done po přenosu.
+    """
+    # Bez přístupu k frontě potvrzení (jiná verze paramiko) zapisovat bez zřetězení
+    pipelined = can_limit_sftp_writes(remote_file)
+    remote_file.set_pipelined(pipelined)
+    remaining = length
+    while remaining is None or remaining > 0:
+        size = tuning['request_size'] if remaining is None else min(tuning['request_size'], remaining)
+        chunk = local_file.read(size)
+        if not chunk:
+            break
+        remote_file.write(chunk)
+        if pipelined:
+            wait_sftp_writes(remote_file, tuning['max_requests'])
+        done += len(chunk)
+        if remaining is not None:
+            remaining -= len(chunk)
+        if callback:
+            callback(done, total)
+    return done
+
+
+def sftp_read_into(remote_file, local_file, tuning, offset, end, callback=None, done=0, total=0):
+    """Číst úsek vzdáleného souboru [offset, end) s čtením dopředu do lokálního souboru"""
+    remote_file.seek(offset)
+    remote_file.prefetch(end, tuning['max_requests'])
+    remaining = end - offset
+    while remaining > 0:
+        chunk = remote_file.read(min(tuning['request_size'], remaining))
+        if not chunk:
+            break
+        local_file.write(chunk)
+        remaining -= len(chunk)
+        done += len(chunk)
+        if callback:
+            callback(done, total)
+    return done
+
+
+def sftp_put(sftp_client, local_path, remote_path, callback=None):
+    """Nahrát celý soubor přes SFTP zřetězeným zápisem"""
+    total = os.path.getsize(local_path)
+    remote_file, tuning = sftp_open(sftp_client, remote_path, 'wb')
+    with open(local_path, 'rb') as f, remote_file:
+        sftp_write_from(f, remote_file, tuning, callback, 0, total)
+
+
+def open_sftp_connection(env):
+    """Otevřít nové SSH spojení se SFTP relací podle prostředí"""
+    ssh_client = paramiko.SSHClient()
+    ssh_client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+    ssh_client.connect(
+        env['host'],
+        port=env['port'],
+        username=env['user'],
+        password=env['password']
+    )
+    try:
+        sftp_client = open_tuned_sftp(ssh_client.get_transport(), sftp_tuning(env))
+    except Exception:
+        ssh_client.close()
+        raise
+    return ssh_client, sftp_client
+
+
+class SSHSession:
+    """Jedno SSH spojení prostředí sdílené terminálem, SFTP a příkazy exec
+
+    Shell, SFTP i exec běží jako kanály jednoho transportu, takže připojení
+    stojí jediný handshake. Transport posílá keepalive a po výpadku se při
+    dalším použití sám znovu připojí. Rozhraní odpovídá paramiko.SSHClient
+    (exec_command, invoke_shell, get_transport, close).
+    """
+
+    def __init__(self, env):
+        self.env = env
+        self.client = None
+        self.closed = False
+        self.reconnects = 0
+        self._sftp = None
+        self._lock = threading.RLock()
+        # Stálý SFTP klient pro aplikaci - po obnovení spojení přejde na nový kanál
+        self.sftp_client = SessionSFTP(self)
+
+    def connect(self):
+        """Navázat spojení a otevřít SFTP kanál"""
+        client = paramiko.SSHClient()
+        client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+        client.connect(
+            self.env['host'],
+            port=self.env['port'],
+            username=self.env['user'],
+            password=self.env['password']
+        )
+        try:
+            transport = client.get_transport()
+            transport.set_keepalive(SSH_KEEPALIVE_INTERVAL)
+            tuning = sftp_tuning(self.env)
+            sftp_client = open_tuned_sftp(transport, tuning)
+        except Exception:
+            client.close()
+            raise
+        self.client, self._sftp = client, sftp_client
+        _sftp_tuning[self.sftp_client] = tuning
+
+    def is_active(self):
+        """Zjistit, zda transport ještě běží"""
+        transport = self.client.get_transport() if self.client else None
+        return bool(transport and transport.is_active())
+
+    def ensure(self):
+        """Znovu se připojit, pokud transport spadl"""
+        with self._lock:
+            if self.closed:
+                raise RuntimeError("SSH spojení bylo ukončeno.")
+            if not self.is_active():
+                self.close_transport()
+                self.connect()
+                self.reconnects += 1
+
+    def sftp(self):
+        """Aktuální SFTP kanál (po výpadku nově otevřený)"""
+        self.ensure()
+        return self._sftp
+
+    def get_transport(self):
+        """Transport spojení (po výpadku obnovený)"""
+        self.ensure()
+        return self.client.get_transport()
+
+    def exec_command(self, command, **kwargs):
+        """Spustit příkaz na serveru v novém kanálu"""
+        self.ensure()
+        try:
+            return self.client.exec_command(command, **kwargs)
+        except (OSError, EOFError, paramiko.SSHException):
+            if self.is_active():
+                raise
+            # Spojení spadlo při otevírání kanálu - obnovit a zopakovat
+            self.ensure()
+            return self.client.exec_command(command, **kwargs)
+
+    def invoke_shell(self, **kwargs):
+        """Otevřít kanál s interaktivním shellem"""
+        self.ensure()
+        return self.client.invoke_shell(**kwargs)
+
+    def is_alive(self):
+        """Zjistit, zda je spojení připravené k použití"""
+        return not self.closed and self.is_active()
+
+    def keepalive(self):
+        """Obnovit spadlé spojení, aby bylo při dalším použití připravené
+
+        Keepalive zprávy posílá sám transport, tady se jen obnoví spojení,
+        které mezitím spadlo. Právě používané spojení se přeskočí.
+        """
+        if not self._lock.acquire(blocking=False):
+            return
+        try:
+            if not self.closed and not self.is_active():
+                self.ensure()
+        except Exception:
+            pass
+        finally:
+            self._lock.release()
+
+    def close_transport(self):
+        """Zavřít SFTP kanál i transport"""
+        try:
+            if self._sftp:
+                self._sftp.close()
+            if self.client:
+                self.client.close()
+        except Exception:
+            pass
+        self.client = None
+        self._sftp = None
+
+    def close(self):
+        """Ukončit spojení, další použití už se znovu nepřipojí"""
+        with self._lock:
+            self.closed = True
+            self.close_transport()
+
+
+class SessionSFTP:
+    """SFTP klient sdíleného SSH spojení, volání předává aktuálnímu kanálu relace"""
+
+    def __init__(self, session):
+        self._session = session
+
+    def __getattr__(self, name):
+        attr = getattr(self._session.sftp(), name)
+        if not callable(attr):
+            return attr
+
+        def call(*args, **kwargs):
+            try:
+                return getattr(self._session.sftp(), name)(*args, **kwargs)
+            except (OSError, EOFError, paramiko.SSHException):
+                if self._session.closed or self._session.is_active():
+                    raise
+                # Spojení spadlo během příkazu - obnovit a zopakovat
+                return getattr(self._session.sftp(), name)(*args, **kwargs)
+        return call
+
+
+def is_ftp_connection_error(error):
+    """Zjistit, zda chyba znamená ztracené řídicí spojení FTP"""
+    if isinstance(error, ftplib.error_temp):
+        # 421 - server spojení ukončil (typicky po nečinnosti)
+        return str(error).startswith('421')
+    return isinstance(error, (EOFError, ConnectionError, socket.timeout))
+
+
+class FTPSession:
+    """FTP/FTPS spojení, které se po výpadku samo znovu přihlásí
+
+    Volání se předávají klientu ftplib. Když řídicí spojení spadne (timeout
+    serveru, 421, přerušené TCP), přihlásí se znovu, vrátí se do poslední
+    složky a příkaz zopakuje. Přenosy dat se neopakují, aby se data
+    nezdvojila - po obnovení spojení se chyba předá volajícímu.
+    """
+
+    # Příkazy přenášející data nebo závislé na rozpracované odpovědi
+    NO_RETRY = {'storbinary', 'storlines', 'retrbinary', 'retrlines', 'transfercmd', 'ntransfercmd',
+                'voidresp', 'getresp', 'abort'}
+    # Ukončení spojení se nikdy neobnovuje
+    NO_RECONNECT = {'quit', 'close'}
+    # Otevření datového spojení a příkazy, které ho uzavřou přečtením odpovědi
+    DATA_OPEN = {'transfercmd', 'ntransfercmd'}
+    DATA_CLOSE = {'voidresp', 'getresp', 'abort'}
+
+    def __init__(self, env):
+        self.env = env
+        self.client = None
+        self.closed = False
+        self.reconnects = 0
+        self.cwd_path = None
+        self.last_used = time.monotonic()
+        self.lock = threading.RLock()
+        # Otevřené datové spojení (transfercmd ... voidresp) - řídicí spojení čeká
+        # na odpověď přenosu a keepalive NOOP by pořadí odpovědí rozbil
+        self.data_open = False
+
+    def connect(self):
+        """Přihlásit se a vrátit se do poslední složky"""
+        self.client = open_ftp_connection(self.env)
+        if self.cwd_path:
+            try:
+                self.client.cwd(self.cwd_path)
+            except ftplib.all_errors:
+                self.cwd_path = None
+
+    def reconnect(self):
+        """Zahodit spadlé spojení a přihlásit se znovu"""
+        try:
+            self.client.close()
+        except Exception:
+            pass
+        self.data_open = False
+        self.connect()
+        self.reconnects += 1
+
+    def __getattr__(self, name):
+        if self.client is None:
+            raise AttributeError(name)
+        attr = getattr(self.client, name)
+        if not callable(attr):
+            return attr
+
+        def call(*args, **kwargs):
+            with self.lock:
+                self.last_used = time.monotonic()
+                try:
+                    result = self.invoke(name, args, kwargs)
+                except Exception as e:
+                    if self.closed or name in self.NO_RECONNECT or not is_ftp_connection_error(e):
+                        raise
+                    self.reconnect()
+                    if name in self.NO_RETRY:
+                        raise
+                    result = self.invoke(name, args, kwargs)
+                finally:
+                    if name in self.DATA_CLOSE:
+                        self.data_open = False
+                if name in self.DATA_OPEN:
+                    self.data_open = True
+                if name == 'cwd':
+                    self.remember_cwd(args[0] if args else kwargs.get('dirname'))
+                return result
+        return call
+
+    def invoke(self, name, args, kwargs):
+        """Zavolat metodu aktuálního klienta"""
+        result = getattr(self.client, name)(*args, **kwargs)
+        if name == 'mlsd':
+            # Generátor načíst celý, aby chyba spojení nastala tady a šla zopakovat
+            result = list(result)
+        return result
+
+    def remember_cwd(self, path):
+        """Zapamatovat si aktuální složku pro obnovení spojení"""
+        if path and path.startswith('/'):
+            self.cwd_path = path
+        else:
+            try:
+                self.cwd_path = self.client.pwd()
+            except ftplib.all_errors:
+                self.cwd_path = None
+
+    def is_alive(self):
+        """Ověřit spojení příkazem NOOP (s nedokončeným přenosem dat je nepoužitelné)"""
+        if self.closed or self.data_open:
+            return False
+        with self.lock:
+            try:
+                self.client.voidcmd('NOOP')
+                self.last_used = time.monotonic()
+                return True
+            except Exception:
+                return False
+
+    def keepalive(self):
+        """Poslat NOOP nečinnému spojení, spadlé obnovit
+
+        Právě používané spojení i spojení s otevřeným datovým přenosem
+        (mezi transfercmd a voidresp) se přeskočí.
+        """
+        if self.closed or self.data_open or not self.lock.acquire(blocking=False):
+            return
+        try:
+            if not self.data_open and time.monotonic() - self.last_used >= POOL_KEEPALIVE_INTERVAL:
+                try:
+                    self.client.voidcmd('NOOP')
+                except Exception:
+                    self.reconnect()
+                self.last_used = time.monotonic()
+        except Exception:
+            pass
+        finally:
+            self.lock.release()
+
+    def close(self):
+        """Odhlásit se a ukončit spojení"""
+        with self.lock:
+            self.closed = True
+            if self.client is None:
+                return
+            try:
+                self.client.quit()
+            except Exception:
+                try:
+                    self.client.close()
+                except Exception:
+                    pass
+
+
+class ConnectionPool:
+    """Teplá spojení podle prostředí, sdílená přepínáním prostředí i operacemi
+
+    Uvolněné spojení se nezavře, ale čeká v poolu prostředí, dokud ho někdo
+    znovu nepotřebuje nebo nevyprší POOL_IDLE_TIMEOUT. Vlákno na pozadí
+    udržuje všechna spojení (i používaná) naživu a obnovuje spadlá.
+    """
+
+    def __init__(self):
+        self._idle = {}
+        self._active = weakref.WeakSet()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    @staticmethod
+    def key(env):
+        """Klíč prostředí - spojení se sdílí jen při stejném serveru a přihlášení"""
+        return (env['type'], env['host'], env['port'], env['user'], env['password'])
+
+    def acquire(self, env):
+        """Vrátit teplé spojení prostředí, nebo otevřít nové (běží na pozadí)"""
+        while True:
+            with self._lock:
+                idle = self._idle.get(self.key(env))
+                session = idle.pop()[0] if idle else None
+            if session is None:
+                break
+            if session.is_alive():
+                session.env = env
+                self._active.add(session)
+                return session
+            session.close()
+
+        if env['type'] == "SFTP (SSH)":
+            session = SSHSession(env)
+        else:
+            session = FTPSession(env)
+        session.connect()
+        with self._lock:
+            self._active.add(session)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self.keepalive_loop, daemon=True)
+                self._thread.start()
+        return session
+
+    def release(self, session):
+        """Vrátit spojení do poolu pro další použití"""
+        if session.closed:
+            return
+        limit = session.env.get('parallel_connections', DEFAULT_PARALLEL_CONNECTIONS) + 1
+        with self._lock:
+            self._active.discard(session)
+            idle = self._idle.setdefault(self.key(session.env), [])
+            idle.append((session, time.monotonic()))
+            surplus = idle[:-limit]
+            del idle[:-limit]
+        for old_session, _ in surplus:
+            old_session.close()
+
+    def keepalive_loop(self):
+        """Udržovat spojení naživu a zavírat dlouho nepoužívaná (vlastní vlákno)"""
+        while not self._stop.wait(POOL_KEEPALIVE_INTERVAL):
+            now = time.monotonic()
+            expired = []
+            with self._lock:
+                for key, idle in self._idle.items():
+                    expired.extend(session for session, released in idle if now - released >= POOL_IDLE_TIMEOUT)
+                    idle[:] = [(session, released) for session, released in idle if now - released < POOL_IDLE_TIMEOUT]
+                sessions = [session for idle in self._idle.values() for session, _ in idle]
+                sessions.extend(self._active)
+            for session in expired:
+                session.close()
+            for session in sessions:
+                session.keepalive()
+
+    def close_all(self):
+        """Zavřít všechna nepoužívaná spojení a zastavit udržování"""
+        self._stop.set()
+        with self._lock:
+            sessions = [session for idle in self._idle.values() for session, _ in idle]
+            self._idle.clear()
+        for session in sessions:
+            session.close()
+
+
+def ensure_remote_dirs_ftp(ftp_client, path, known_dirs=None):
+    """Vytvořit vzdálené složky přes FTP, známé složky přeskočit"""
+    if not path or path == '/':
+        return
+
+    parts = path.strip('/').split('/')
+    current = ''
+
+    for part in parts:
+        current += '/' + part
+        if known_dirs is not None and current in known_dirs:
+            continue
+        try:
+            ftp_client.cwd(current)
+        except:
+            try:
+                ftp_client.mkd(current)
+            except:
+                pass
+        if known_dirs is not None:
+            known_dirs.add(current)
+
+
+def ensure_remote_dirs_sftp(sftp_client, path, known_dirs=None):
+    """Vytvořit vzdálené složky přes SFTP, známé složky přeskočit"""
+    if not path or path == '/':
+        return
+
+    parts = path.strip('/').split('/')
+    current = ''
+
+    for part in parts:
+        current += '/' + part
+        if known_dirs is not None and current in known_dirs:
+            continue
+        try:
+            sftp_client.stat(current)
+        except:
+            try:
+                sftp_client.mkdir(current)
+            except:
+                pass
+        if known_dirs is not None:
+            known_dirs.add(current)
+
+
+# Funkce FTP serverů zjištěné přes FEAT (cache pro každé spojení)
+_ftp_features = weakref.WeakKeyDictionary()
+
+# Měsíce ve výpisu LIST
+_LIST_MONTHS = {
+    'jan': 1, 'feb': 2, 'mar': 3, 'apr': 4, 'may': 5, 'jun': 6,
+    'jul': 7, 'aug': 8, 'sep': 9, 'oct': 10, 'nov': 11, 'dec': 12
+}
+
+# Čas z LIST je v lokální zóně serveru - od UTC se může lišit až o den
+LIST_TIME_SLACK = 86400
+
+# Unixový výpis (ls -l): práva, 0-3 sloupce (počet odkazů, vlastník, skupina), velikost,
+# datum a čas nebo rok. Název začíná za jedinou mezerou, úvodní mezery v názvu zůstanou.
+_UNIX_LIST_RE = re.compile(
+    r'(?P<mode>[-a-zA-Z])[-rwxsStTlL]{9}[.+@]?\s+(?:\S+\s+){0,3}?'
+    r'(?P<size>\d+)\s+(?P<month>\S{3,6})\s+(?P<day>\d{1,2})\s+'
+    r'(?:(?P<hour>\d{1,2}):(?P<minute>\d{2})|(?P<year>\d{4}))\s(?P<name>.+)$'
+)
+
+# Výpis ve stylu DOS (IIS, Windows): 03-15-24  10:05AM  <DIR>  název
+_DOS_LIST_RE = re.compile(
+    r'(?P<month>\d{2})-(?P<day>\d{2})-(?P<year>\d{2}|\d{4})\s+'
+    r'(?P<hour>\d{1,2}):(?P<minute>\d{2})\s*(?P<ampm>[AaPp][Mm])?\s+'
+    r'(?:(?P<dir><DIR>)|(?P<size>\d+))\s+(?P<name>.+)$'
+)
+
+
+def ftp_features(ftp_client):
+    """Zjistit podporované příkazy serveru (FEAT) jako dict název -> parametry, výsledek se cachuje"""
+    features = _ftp_features.get(ftp_client)
+    if features is None:
+        features = {}
+        try:
+            response = ftp_client.sendcmd('FEAT')
+            for line in response.splitlines()[1:-1]:
+                parts = line.strip().split(' ', 1)
+                if parts[0]:
+                    features[parts[0].upper()] = parts[1] if len(parts) > 1 else ''
+        except Exception:
+            pass
+        _ftp_features[ftp_client] = features
+    return features
+
+
+class ListingEntry:
+    """Položka výpisu FTP složky
+
+    kind je 'file', 'dir' nebo 'link' (target = cíl odkazu, pokud ho server uvedl).
+    precision je přesnost mtime v sekundách: LIST udává minuty, u starších
+    souborů jen den, MLSD čas přesně (0).
+    """
+    __slots__ = ('name', 'kind', 'size', 'mtime', 'target', 'precision')
+
+    def __init__(self, name, kind, size=None, mtime=None, target=None, precision=0):
+        self.name = name
+        self.kind = kind
+        self.size = size
+        self.mtime = mtime
+        self.target = target
+        self.precision = precision
+
+    @property
+    def is_dir(self):
+        return self.kind == 'dir'
+
+
+@functools.lru_cache(maxsize=4096)
+def _day_timestamp(year, month, day):
+    """Timestamp půlnoci daného dne v UTC (výpisy obsahují stále stejná data)"""
+    if not (1 <= month <= 12 and 1 <= day <= 31):
+        raise ValueError("neplatné datum")
+    return calendar.timegm((year, month, day, 0, 0, 0))
+
+
+def _list_timestamp(year, month, day, hour=0, minute=0, second=0):
+    if hour > 23 or minute > 59 or second > 60:
+        raise ValueError("neplatný čas")
+    return _day_timestamp(year, month, day) + hour * 3600 + minute * 60 + second
+
+
+def parse_mlsd_time(value):
+    """Převést čas z MLSD (YYYYMMDDhhmmss[.sss] v UTC) na timestamp"""
+    try:
+        if len(value) < 14 or not value[:14].isdigit():
+            return None
+        return _list_timestamp(
+            int(value[0:4]), int(value[4:6]), int(value[6:8]),
+            int(value[8:10]), int(value[10:12]), int(value[12:14])
+        )
+    except (ValueError, TypeError):
+        return None
+
+
+def parse_mlsd_entry(name, facts):
+    """Převést položku MLSD (název, fakta) na ListingEntry, '.' a '..' vrací None"""
+    entry_type = facts.get('type', '').lower()
+    if entry_type in ('cdir', 'pdir') or name in ('.', '..'):
+        return None
+
+    target = None
+    if entry_type == 'dir':
+        kind = 'dir'
+    elif entry_type.startswith(('os.unix=slink', 'os.unix=symlink')):
+        # Některé servery připojí cíl odkazu: OS.unix=slink:/cesta
+        kind = 'link'
+        target = facts['type'].partition(':')[2] or None
+    else:
+        kind = 'file'
+
+    size = None
+    if kind != 'dir' and 'size' in facts:
+        try:
+            size = int(facts['size'])
+        except ValueError:
+            pass
+    return ListingEntry(name, kind, size, parse_mlsd_time(facts.get('modify')), target)
+
+
+@functools.lru_cache(maxsize=4096)
+def _unix_list_time(month, day, hour, minute, year):
+    """Timestamp data z výpisu LIST (řetězce tak, jak přišly - soubory ve složce sdílí data)"""
+    month_number = _LIST_MONTHS.get(month[:3].lower())
+    if not month_number:
+        return None
+    try:
+        return _list_timestamp(int(year), month_number, int(day), int(hour or 0), int(minute or 0))
+    except ValueError:
+        return None
+
+
+def parse_list_line(line, now=None):
+    """Rozebrat řádek výpisu LIST (unixový ls -l nebo DOS/IIS), vrací ListingEntry nebo None
+
+    Časy bez roku (soubory z posledního půlroku) se doplní letošním rokem,
+    případně loňským, pokud by vyšly v budoucnosti.
+    """
+    line = line.rstrip('\r\n')
+    if line[:1].isdigit():
+        return _parse_dos_line(line)
+
+    match = _UNIX_LIST_RE.match(line)
+    if not match:
+        return None
+    mode, size, month, day, hour, minute, year, name = match.groups()
+
+    target = None
+    if mode == 'd':
+        kind = 'dir'
+        size = None
+    elif mode == 'l':
+        kind = 'link'
+        name, _, target = name.partition(' -> ')
+        target = target or None
+        size = int(size)
+    else:
+        kind = 'file'
+        size = int(size)
+    if name in ('.', '..'):
+        return None
+
+    if year:
+        mtime = _unix_list_time(month, day, None, None, year)
+        precision = 86400
+    else:
+        precision = 60
+        now = time.time() if now is None else now
+        this_year = time.gmtime(now).tm_year
+        mtime = _unix_list_time(month, day, hour, minute, this_year)
+        if mtime is not None and mtime > now + 86400:
+            mtime = _unix_list_time(month, day, hour, minute, this_year - 1)
+
+    return ListingEntry(name, kind, size, mtime, target, precision)
+
+
+def _parse_dos_line(line):
+    match = _DOS_LIST_RE.match(line)
+    if not match:
+        return None
+
+    name = match.group('name')
+    if name in ('.', '..'):
+        return None
+
+    mtime = None
+    try:
+        year = int(match.group('year'))
+        if year < 100:
+            year += 2000 if year < 70 else 1900
+        hour = int(match.group('hour'))
+        ampm = (match.group('ampm') or '').upper()
+        if ampm == 'PM' and hour < 12:
+            hour += 12
+        elif ampm == 'AM' and hour == 12:
+            hour = 0
+        mtime = _list_timestamp(year, int(match.group('month')), int(match.group('day')), hour, int(match.group('minute')))
+    except ValueError:
+        pass
+
+    if match.group('dir'):
+        return ListingEntry(name, 'dir', None, mtime, precision=60)
+    return ListingEntry(name, 'file', int(match.group('size')), mtime, precision=60)
+
+
+def parse_ftp_listing(lines):
+    """Rozebrat řádky výpisu LIST, nerozpoznané řádky (total, hlášky serveru) přeskočí"""
+    now = time.time()
+    entries = []
+    for line in lines:
+        entry = parse_list_line(line, now)
+        if entry is not None:
+            entries.append(entry)
+    return entries
+
+
+def read_ftp_directory(ftp_client, path):
+    """Načíst obsah vzdálené složky přes FTP jako seznam ListingEntry
+
+    Pokud server umí MLSD, použije se (přesné velikosti i časy v UTC),
+    jinak se rozebere výpis LIST.
+    """
+    if 'MLST' in ftp_features(ftp_client):
+        entries = []
+        for name, facts in ftp_client.mlsd(path, facts=['type', 'size', 'modify']):
+            entry = parse_mlsd_entry(name, facts)
+            if entry is not None:
+                entries.append(entry)
+        return entries
+
+    ftp_client.cwd(path)
+    lines = []
+    ftp_client.dir(lines.append)
+    return parse_ftp_listing(lines)
+
+
+def list_ftp_directory(ftp_client, path, list_times=None, links=None):
+    """Načíst obsah vzdálené složky přes FTP jedním výpisem, vrací seznam (name, is_dir, size, mtime)
+
+    LIST udává čas serveru v lokální zóně a u starších souborů jen datum,
+    mtime je proto None. Přibližné časy souborů se uloží do list_times
+    (název -> (mtime, přesnost)), pokud je zadán. Symbolické odkazy jsou
+    ve výpisu jako soubory, jejich názvy se přidají do links.
+    """
+    mlsd = 'MLST' in ftp_features(ftp_client)
+    entries = read_ftp_directory(ftp_client, path)
+    if not mlsd and list_times is not None:
+        for entry in entries:
+            if entry.mtime is not None and not entry.is_dir:
+                list_times[entry.name] = (entry.mtime, entry.precision)
+    if links is not None:
+        links.update(entry.name for entry in entries if entry.kind == 'link')
+    return [
+        (entry.name, entry.is_dir, entry.size, entry.mtime if mlsd else None)
+        for entry in entries
+    ]
+
+
+def iter_sftp_directory(sftp_client, path, links=None):
+    """Procházet obsah vzdálené složky přes SFTP průběžně, jak chodí odpovědi serveru
+
+    Vrací (name, is_dir, size, mtime). Symbolické odkazy jsou ve výpisu
+    jako soubory, jejich názvy se přidají do links, pokud je zadán.
+    """
+    for item in sftp_client.listdir_iter(path):
+        is_dir = stat.S_ISDIR(item.st_mode)
+        if links is not None and stat.S_ISLNK(item.st_mode):
+            links.add(item.filename)
+        yield item.filename, is_dir, None if is_dir else item.st_size, item.st_mtime
+
+
+def list_sftp_directory(sftp_client, path, links=None):
+    """Načíst obsah vzdálené složky přes SFTP, vrací seznam (name, is_dir, size, mtime)"""
+    return list(iter_sftp_directory(sftp_client, path, links))
+
+
+def is_missing_remote_dir(error):
+    """Chyba výpisu znamená, že vzdálená složka neexistuje (SFTP ENOENT, FTP 550)"""
+    if isinstance(error, FileNotFoundError):
+        return True
+    return isinstance(error, ftplib.error_perm) and str(error).startswith('550')
+
+
+class RemoteIndex:
+    """Index vzdáleného stromu: relativní cesta -> (size, mtime, is_dir)
+
+    Každá vzdálená složka se načte jen jednou, porovnání lokálních souborů
+    pak probíhá v paměti bez dalších dotazů na server. Symbolické odkazy
+    index nedrží mezi záznamy, jen v links - synchronizace je obchází.
+    """
+
+    def __init__(self, root):
+        self.root = root.rstrip('/') or '/'
+        self.entries = {}
+        self.listings = 0
+        # Relativní cesty složek, jejichž obsah je v indexu celý
+        self.listed = set()
+        # Přibližné časy z FTP LIST: relativní cesta -> (mtime, přesnost)
+        self.list_times = {}
+        # Relativní cesty symbolických odkazů
+        self.links = set()
+
+    def full_path(self, rel_path):
+        """Absolutní vzdálená cesta k relativní cestě"""
+        return f"{self.root.rstrip('/')}/{rel_path}"
+
+    def get(self, rel_path):
+        """Záznam pro relativní cestu nebo None"""
+        return self.entries.get(rel_path)
+
+    def add(self, rel_path, size, mtime, is_dir):
+        """Přidat záznam do indexu"""
+        self.entries[rel_path] = (size, mtime, is_dir)
+
+    def link_for(self, rel_path):
+        """Symbolický odkaz, kterým cesta na serveru vede (ona sama nebo rodič), jinak None"""
+        if not self.links:
+            return None
+        parts = rel_path.split('/')
+        for depth in range(1, len(parts) + 1):
+            link = '/'.join(parts[:depth])
+            if link in self.links:
+                return link
+        return None
+
+    def add_listing(self, rel_dir, entries):
+        """Přidat výpis složky, odkazy zůstanou jen v links"""
+        for name, is_dir, size, mtime in entries:
+            rel_path = f"{rel_dir}/{name}" if rel_dir else name
+            if rel_path not in self.links:
+                self.add(rel_path, size, mtime, is_dir)
+
+    def rel_dir(self, path):
+        """Relativní cesta vzdálené složky pod kořenem indexu"""
+        prefix = self.root.rstrip('/') + '/'
+        return path[len(prefix):] if path.startswith(prefix) else ''
+
+    def list_ftp(self, ftp_client, path):
+        """Načíst složku indexu přes FTP, přibližné časy z LIST a odkazy si index zapamatuje"""
+        rel_dir = self.rel_dir(path)
+        list_times = {}
+        links = set()
+        entries = list_ftp_directory(ftp_client, path, list_times, links)
+        for name, list_time in list_times.items():
+            self.list_times[f"{rel_dir}/{name}" if rel_dir else name] = list_time
+        self.links.update(f"{rel_dir}/{name}" if rel_dir else name for name in links)
+        return entries
+
+    def list_sftp(self, sftp_client, path):
+        """Načíst složku indexu přes SFTP, odkazy si index zapamatuje"""
+        rel_dir = self.rel_dir(path)
+        links = set()
+        entries = list_sftp_directory(sftp_client, path, links)
+        self.links.update(f"{rel_dir}/{name}" if rel_dir else name for name in links)
+        return entries
+
+    def directories(self):
+        """Absolutní cesty vzdálených složek, o kterých index ví, že existují"""
+        dirs = {self.full_path(rel_path) for rel_path, entry in self.entries.items() if entry[2]}
+        if self.listings and self.root != '/':
+            # Kořen a jeho rodiče existují, pokud se kořen podařilo načíst
+            parts = self.root.strip('/').split('/')
+            dirs.update('/' + '/'.join(parts[:depth]) for depth in range(1, len(parts) + 1))
+        return dirs
+
+    def build(self, list_directory, task=None):
+        """Projít celý strom pomocí list_directory(path)"""
+        pending = ['']
+        while pending:
+            if task:
+                task.check_cancelled()
+            rel_dir = pending.pop()
+            path = self.full_path(rel_dir) if rel_dir else self.root
+            try:
+                entries = list_directory(path)
+            except Exception:
+                # Složka neexistuje nebo není čitelná - její obsah bereme jako chybějící
+                continue
+            self.listings += 1
+            self.listed.add(rel_dir)
+            if task:
+                task.report(0, 0, f"Načítám vzdálené soubory... ({self.listings} složek, {len(self.entries)} položek)")
+
+            self.add_listing(rel_dir, entries)
+            for name, is_dir, size, mtime in entries:
+                rel_path = f"{rel_dir}/{name}" if rel_dir else name
+                if is_dir and rel_path not in self.links:
+                    pending.append(rel_path)
+        return self
+
+    @classmethod
+    def from_ftp(cls, ftp_client, root, task=None):
+        """Sestavit index přes FTP (MLSD nebo LIST)"""
+        index = cls(root)
+        return index.build(lambda path: index.list_ftp(ftp_client, path), task)
+
+    @classmethod
+    def from_sftp(cls, sftp_client, root, task=None):
+        """Sestavit index přes SFTP (listdir_attr)"""
+        index = cls(root)
+        return index.build(lambda path: index.list_sftp(sftp_client, path), task)
+
+    @classmethod
+    def from_ssh_find(cls, ssh_client, root, task=None):
+        """Sestavit index jedním příkazem find na serveru
+
+        Vrací None, pokud příkaz nelze spustit (omezený shell, find bez -printf),
+        volající pak použije procházení přes SFTP.
+        """
+        index = cls(root)
+        # Záznamy oddělené nulovým bajtem, aby prošly i názvy s novým řádkem.
+        # -H: kořen bývá symlink na složku (/var/www/current -> releases/42)
+        command = f"find -H {shlex.quote(index.root)} -mindepth 1 -printf '%P\\t%s\\t%T@\\t%y\\0'"
+
+        try:
+            stdin, stdout, stderr = ssh_client.exec_command(command)
+            stdin.close()
+        except Exception:
+            return None
+
+        channel = stdout.channel
+        # Krátký timeout, aby se mezi čekáním na stdout stíhal vybírat stderr
+        channel.settimeout(0.1)
+        buffer = b''
+        errors = b''
+        try:
+            while True:
+                if task and task.is_cancelled():
+                    channel.close()
+                    raise OperationCancelled()
+                # Hlášky Permission denied by jinak zaplnily okno kanálu a find by se zastavil
+                while channel.recv_stderr_ready():
+                    chunk = channel.recv_stderr(65536)
+                    if len(errors) < 65536:
+                        errors += chunk
+                try:
+                    chunk = channel.recv(65536)
+                except socket.timeout:
+                    continue
+                if not chunk:
+                    break
+                buffer += chunk
+                records = buffer.split(b'\0')
+                buffer = records.pop()
+                for record in records:
+                    index.add_find_record(record)
+                if task:
+                    task.report(0, 0, f"Načítám vzdálené soubory přes SSH... ({len(index.entries)} položek)")
+            exit_status = channel.recv_exit_status()
+            channel.settimeout(None)
+            errors = (errors + stderr.read()).decode('utf-8', errors='ignore')
+        finally:
+            channel.close()
+
+        if exit_status != 0 and (not index.entries or '-printf' in errors):
+            return None
+
+        index.listings = 1
+        if exit_status == 0:
+            # find prošel celý strom, nečitelné složky by skončily chybou
+            index.listed = {''}
+            index.listed.update(rel_path for rel_path, entry in index.entries.items() if entry[2])
+        return index
+
+    def add_find_record(self, record):
+        """Přidat záznam z výstupu find -printf '%P\\t%s\\t%T@\\t%y'"""
+        try:
+            rel_path, size, mtime, kind = record.decode('utf-8', errors='surrogateescape').rsplit('\t', 3)
+        except ValueError:
+            return
+        if not rel_path:
+            return
+        if kind == 'l':
+            # -H následuje jen kořen, odkazy pod ním zůstanou odkazy
+            self.links.add(rel_path)
+            return
+        is_dir = kind == 'd'
+        self.add(rel_path, None if is_dir else int(size), float(mtime), is_dir)
+
+
+class RemoteListingCache:
+    """Uložené výpisy vzdálených složek jedné relace: cesta -> {název: (is_dir, size, mtime)}
+
+    Výpis platí ttl sekund. Změny provedené přes FORTEftp (nahrání, mazání,
+    nové složky) se do uložených výpisů promítnou přímo, takže návrat do
+    navštívené složky nestojí žádný dotaz na server. Plní ho i synchronizace.
+    """
+
+    def __init__(self, ttl=DEFAULT_LISTING_CACHE_TTL):
+        self.ttl = ttl
+        self.listings = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def normalize(path):
+        return path.rstrip('/') or '/'
+
+    def get(self, path):
+        """Platný výpis složky jako seznam (name, is_dir, size, mtime) nebo None"""
+        path = self.normalize(path)
+        with self._lock:
+            cached = self.listings.get(path)
+            if cached is None:
+                return None
+            stored, entries = cached
+            if time.monotonic() - stored > self.ttl:
+                del self.listings[path]
+                return None
+            return [(name, is_dir, size, mtime) for name, (is_dir, size, mtime) in entries.items()]
+
+    def put(self, path, entries):
+        """Uložit čerstvě načtený výpis složky"""
+        if self.ttl <= 0:
+            return
+        listing = {name: (is_dir, size, mtime) for name, is_dir, size, mtime in entries}
+        with self._lock:
+            self.listings[self.normalize(path)] = (time.monotonic(), listing)
+
+    def put_index(self, index):
+        """Uložit výpisy všech složek, které RemoteIndex načetl celé"""
+        if self.ttl <= 0 or not index.listed:
+            return
+        listings = {rel_dir: {} for rel_dir in index.listed}
+        for rel_path, (size, mtime, is_dir) in index.entries.items():
+            parent, _, name = rel_path.rpartition('/')
+            if parent in listings:
+                listings[parent][name] = (is_dir, size, mtime)
+
+        now = time.monotonic()
+        with self._lock:
+            for rel_dir, listing in listings.items():
+                path = index.full_path(rel_dir) if rel_dir else index.root
+                self.listings[self.normalize(path)] = (now, listing)
+
+    def add(self, path, is_dir, size=None, mtime=None):
+        """Promítnout nový nebo přepsaný soubor či složku do uložených výpisů
+
+        Nadřazené složky, které mohly vzniknout spolu s ním, se doplní také.
+        """
+        path = self.normalize(path)
+        with self._lock:
+            while path != '/':
+                parent, _, name = path.rpartition('/')
+                parent = parent or '/'
+                cached = self.listings.get(parent)
+                if cached is not None and (not is_dir or name not in cached[1]):
+                    cached[1][name] = (is_dir, size, mtime)
+                path, is_dir, size, mtime = parent, True, None, None
+
+    def remove(self, path):
+        """Odebrat smazanou položku z výpisu rodiče a zahodit výpisy pod ní"""
+        path = self.normalize(path)
+        parent, _, name = path.rpartition('/')
+        with self._lock:
+            cached = self.listings.get(parent or '/')
+            if cached is not None:
+                cached[1].pop(name, None)
+            self._drop_tree(path)
+
+    def invalidate(self, path, recursive=False):
+        """Zahodit výpis složky (recursive - i všech složek pod ní)"""
+        path = self.normalize(path)
+        with self._lock:
+            if recursive:
+                self._drop_tree(path)
+            else:
+                self.listings.pop(path, None)
+
+    def _drop_tree(self, path):
+        prefix = path.rstrip('/') + '/'
+        for cached_path in [p for p in self.listings if p == path or p.startswith(prefix)]:
+            del self.listings[cached_path]
+
+    def clear(self, ttl=None):
+        """Zapomenout všechny výpisy (nové spojení), případně změnit platnost"""
+        with self._lock:
+            self.listings.clear()
+            if ttl is not None:
+                self.ttl = ttl
+
+
+def scan_local_directory(local_root, rel_dir):
+    """Načíst jednu lokální složku jako (soubory, podsložky)
+
+    Soubory jsou dicty s path, rel_path, size, mtime a mtime_ns, podsložky
+    relativní cesty.
+    """
+    path = os.path.join(local_root, rel_dir) if rel_dir else local_root
+    files = []
+    subdirs = []
+
+    with os.scandir(path) as entries:
+        for entry in entries:
+            rel_path = f"{rel_dir}/{entry.name}" if rel_dir else entry.name
+            if entry.is_dir():
+                subdirs.append(rel_path)
+            elif entry.is_file():
+                entry_stat = entry.stat()
+                files.append({
+                    'path': entry.path,
+                    'rel_path': rel_path,
+                    'size': entry_stat.st_size,
+                    'mtime': entry_stat.st_mtime,
+                    'mtime_ns': entry_stat.st_mtime_ns
+                })
+
+    return files, subdirs
+
+
+def iter_local_directories(local_root, task=None):
+    """Procházet lokální strom po složkách
+
+    Pro každou složku vrací (rel_dir, soubory, podsložky) podle
+    scan_local_directory. V paměti je vždy jen jedna složka, takže i strom
+    s miliony souborů nezabere víc paměti.
+    """
+    pending = ['']
+    while pending:
+        if task:
+            task.check_cancelled()
+        rel_dir = pending.pop()
+        files, subdirs = scan_local_directory(local_root, rel_dir)
+        yield rel_dir, files, subdirs
+        pending.extend(reversed(subdirs))
+
+
+class InotifyWatcher:
+    """Sledování složek přes Linux inotify (ctypes)
+
+    Na rozdíl od QFileSystemWatcher hlásí i zápis do existujících souborů,
+    takže na jeho událostech může stát index pro synchronizaci. Každá složka
+    se sleduje zvlášť (watch_dir), události se neblokujícím čtením
+    vyzvedávají v changes().
+    """
+
+    IN_MODIFY = 0x2
+    IN_ATTRIB = 0x4
+    IN_CLOSE_WRITE = 0x8
+    IN_MOVED_FROM = 0x40
+    IN_MOVED_TO = 0x80
+    IN_CREATE = 0x100
+    IN_DELETE = 0x200
+    IN_DELETE_SELF = 0x400
+    IN_MOVE_SELF = 0x800
+    IN_Q_OVERFLOW = 0x4000
+    IN_IGNORED = 0x8000
+    IN_ONLYDIR = 0x1000000
+    # Flagy inotify_init1 jsou O_NONBLOCK a O_CLOEXEC; ve Windows je modul os
+    # nemá, proto výchozí hodnoty z Linuxu (použijí se jen s inotify)
+    IN_NONBLOCK = getattr(os, 'O_NONBLOCK', 0o4000)
+    IN_CLOEXEC = getattr(os, 'O_CLOEXEC', 0o2000000)
+
+    MASK = (IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO
+            | IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR)
+
+    EVENT_HEADER = struct.Struct('iIII')
+
+    _libc = None
+
+    @classmethod
+    def load_libc(cls):
+        """libc s funkcemi inotify, mimo Linux None"""
+        if cls._libc is None:
+            cls._libc = False
+            if sys.platform.startswith('linux'):
+                try:
+                    libc = ctypes.CDLL(None, use_errno=True)
+                    libc.inotify_init1
+                    libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+                    libc.inotify_rm_watch.argtypes = [ctypes.c_int, ctypes.c_int]
+                    cls._libc = libc
+                except (OSError, AttributeError):
+                    pass
+        return cls._libc or None
+
+    def __init__(self, root):
+        self.root = root
+        self.libc = self.load_libc()
+        if self.libc is None:
+            raise OSError("inotify není k dispozici")
+        self.fd = self.libc.inotify_init1(self.IN_NONBLOCK | self.IN_CLOEXEC)
+        if self.fd < 0:
+            error = ctypes.get_errno()
+            raise OSError(error, os.strerror(error))
+        self.alive = True
+        self.wds = {}
+        self.wd_dirs = {}
+        self._lock = threading.Lock()
+
+    def watch_dir(self, rel_dir):
+        """Začít sledovat složku (volá se před jejím načtením)"""
+        path = os.path.join(self.root, rel_dir) if rel_dir else self.root
+        with self._lock:
+            if not self.alive:
+                raise OSError("Sledování složek bylo ukončeno.")
+            # Pro tentýž inode (i přesunutou složku) vrací jádro stejný descriptor
+            wd = self.libc.inotify_add_watch(self.fd, os.fsencode(path), self.MASK)
+            if wd < 0:
+                error = ctypes.get_errno()
+                raise OSError(error, os.strerror(error), path)
+            self.wds[rel_dir] = wd
+            self.wd_dirs[wd] = rel_dir
+
+    def unwatch_dir(self, rel_dir):
+        """Přestat sledovat složku"""
+        with self._lock:
+            wd = self.wds.pop(rel_dir, None)
+            # Přesunutá složka má stále týž descriptor, už pod novou cestou
+            if wd is not None and self.wd_dirs.get(wd) == rel_dir:
+                del self.wd_dirs[wd]
+                if self.alive:
+                    self.libc.inotify_rm_watch(self.fd, wd)
+
+    def changes(self):
+        """Vyzvednout čekající události jako (změněné složky, přetečení)"""
+        dirs = set()
+        overflow = False
+        with self._lock:
+            if not self.alive:
+                return dirs, True
+            while True:
+                try:
+                    data = os.read(self.fd, 65536)
+                except BlockingIOError:
+                    break
+                offset = 0
+                while offset < len(data):
+                    wd, mask, _, name_length = self.EVENT_HEADER.unpack_from(data, offset)
+                    offset += self.EVENT_HEADER.size + name_length
+                    if mask & self.IN_Q_OVERFLOW:
+                        overflow = True
+                    elif not mask & self.IN_IGNORED and wd in self.wd_dirs:
+                        dirs.add(self.wd_dirs[wd])
+        return dirs, overflow
+
+    def close(self):
+        with self._lock:
+            if self.alive:
+                self.alive = False
+                os.close(self.fd)
+
+
+class WindowsDirectoryWatcher:
+    """Sledování celého stromu přes Windows ReadDirectoryChangesW (ctypes)
+
+    Jeden handle sleduje root i všechny podsložky a hlásí i zápis do
+    souborů. Oznámení čte vlastní vlákno a jen je zapíše - watch_dir
+    a unwatch_dir nic nedělají.
+    """
+
+    FILE_LIST_DIRECTORY = 0x1
+    FILE_SHARE_ALL = 0x1 | 0x2 | 0x4
+    OPEN_EXISTING = 3
+    FILE_FLAG_BACKUP_SEMANTICS = 0x02000000
+    FILE_FLAG_OVERLAPPED = 0x40000000
+    NOTIFY_FILTER = (0x1 | 0x2 | 0x8 | 0x10)  # FILE_NAME, DIR_NAME, SIZE, LAST_WRITE
+    WAIT_OBJECT_0 = 0
+    ERROR_NOTIFY_ENUM_DIR = 1022
+    BUFFER_SIZE = 64 * 1024
+    POLL_MS = 500
+
+    class OVERLAPPED(ctypes.Structure):
+        _fields_ = [
+            ('Internal', ctypes.c_void_p),
+            ('InternalHigh', ctypes.c_void_p),
+            ('Offset', ctypes.c_uint32),
+            ('OffsetHigh', ctypes.c_uint32),
+            ('hEvent', ctypes.c_void_p)
+        ]
+
+    NOTIFY_HEADER = struct.Struct('<III')
+
+    def __init__(self, root):
+        if sys.platform != 'win32':
+            raise OSError("ReadDirectoryChangesW je jen ve Windows")
+        from ctypes import wintypes
+        self.root = root
+        kernel32 = ctypes.WinDLL('kernel32', use_last_error=True)
+        kernel32.CreateFileW.restype = wintypes.HANDLE
+        kernel32.CreateFileW.argtypes = [
+            wintypes.LPCWSTR, wintypes.DWORD, wintypes.DWORD, ctypes.c_void_p,
+            wintypes.DWORD, wintypes.DWORD, wintypes.HANDLE
+        ]
+        kernel32.CreateEventW.restype = wintypes.HANDLE
+        kernel32.CreateEventW.argtypes = [ctypes.c_void_p, wintypes.BOOL, wintypes.BOOL, wintypes.LPCWSTR]
+        kernel32.ReadDirectoryChangesW.argtypes = [
+            wintypes.HANDLE, ctypes.c_void_p, wintypes.DWORD, wintypes.BOOL, wintypes.DWORD,
+            ctypes.POINTER(wintypes.DWORD), ctypes.c_void_p, ctypes.c_void_p
+        ]
+        kernel32.GetOverlappedResult.argtypes = [
+            wintypes.HANDLE, ctypes.c_void_p, ctypes.POINTER(wintypes.DWORD), wintypes.BOOL
+        ]
+        kernel32.WaitForSingleObject.argtypes = [wintypes.HANDLE, wintypes.DWORD]
+        kernel32.WaitForSingleObject.restype = wintypes.DWORD
+        kernel32.CancelIoEx.argtypes = [wintypes.HANDLE, ctypes.c_void_p]
+        kernel32.ResetEvent.argtypes = [wintypes.HANDLE]
+        kernel32.CloseHandle.argtypes = [wintypes.HANDLE]
+        self.kernel32 = kernel32
+        self.wintypes = wintypes
+
+        self.handle = kernel32.CreateFileW(
+            root, self.FILE_LIST_DIRECTORY, self.FILE_SHARE_ALL, None, self.OPEN_EXISTING,
+            self.FILE_FLAG_BACKUP_SEMANTICS | self.FILE_FLAG_OVERLAPPED, None
+        )
+        if not self.handle or self.handle == wintypes.HANDLE(-1).value:
+            raise ctypes.WinError(ctypes.get_last_error())
+        self.event = kernel32.CreateEventW(None, True, False, None)
+        if not self.event:
+            kernel32.CloseHandle(self.handle)
+            raise ctypes.WinError(ctypes.get_last_error())
+
+        self.alive = True
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._dirs = set()
+        self._overflow = False
+        self._reading = False
+        self._buffer = ctypes.create_string_buffer(self.BUFFER_SIZE)
+        self._overlapped = self.OVERLAPPED()
+        self._overlapped.hEvent = self.event
+        # První čtení se zadá hned, aby se neztratily změny během prvního průchodu
+        try:
+            self._start_read()
+        except OSError:
+            kernel32.CloseHandle(self.event)
+            kernel32.CloseHandle(self.handle)
+            raise
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _start_read(self):
+        self.kernel32.ResetEvent(self.event)
+        if not self.kernel32.ReadDirectoryChangesW(
+            self.handle, self._buffer, self.BUFFER_SIZE, True, self.NOTIFY_FILTER,
+            None, ctypes.byref(self._overlapped), None
+        ):
+            raise ctypes.WinError(ctypes.get_last_error())
+        self._reading = True
+
+    def _run(self):
+        transferred = self.wintypes.DWORD()
+        try:
+            while not self._stop.is_set():
+                if self.kernel32.WaitForSingleObject(self.event, self.POLL_MS) != self.WAIT_OBJECT_0:
+                    continue
+                # Čtení je dokončené (i chybou), buffer patří zase tomuto vláknu
+                self._reading = False
+                if self.kernel32.GetOverlappedResult(self.handle, ctypes.byref(self._overlapped),
+                                                     ctypes.byref(transferred), False):
+                    if transferred.value:
+                        self._record(self._buffer.raw[:transferred.value])
+                    else:
+                        # Oznámení se nevešla do bufferu
+                        self._mark_overflow()
+                elif ctypes.get_last_error() == self.ERROR_NOTIFY_ENUM_DIR:
+                    self._mark_overflow()
+                else:
+                    break
+                self._start_read()
+        except OSError:
+            pass
+        finally:
+            # Po chybě už změny nikdo nehlásí - index se musí projít celý
+            self.alive = False
+            self._mark_overflow()
+
+    def _record(self, data):
+        dirs = set()
+        offset = 0
+        while True:
+            next_offset, _, name_length = self.NOTIFY_HEADER.unpack_from(data, offset)
+            start = offset + self.NOTIFY_HEADER.size
+            name = data[start:start + name_length].decode('utf-16-le', errors='replace')
+            dirs.add(name.replace('\\', '/').rpartition('/')[0])
+            if not next_offset:
+                break
+            offset += next_offset
+        with self._lock:
+            self._dirs.update(dirs)
+
+    def _mark_overflow(self):
+        with self._lock:
+            self._overflow = True
+
+    def watch_dir(self, rel_dir):
+        if not self.alive:
+            raise OSError("Sledování složek bylo ukončeno.")
+
+    def unwatch_dir(self, rel_dir):
+        pass
+
+    def changes(self):
+        """Vyzvednout zapsané změny jako (změněné složky, přetečení)"""
+        with self._lock:
+            dirs, self._dirs = self._dirs, set()
+            overflow, self._overflow = self._overflow, False
+        return dirs, overflow
+
+    def close(self):
+        if self._stop.is_set():
+            return
+        self._stop.set()
+        self._thread.join()
+        # Zadané čtení zrušit a počkat na jeho dokončení, než se uvolní buffer
+        if self._reading:
+            transferred = self.wintypes.DWORD()
+            self.kernel32.CancelIoEx(self.handle, ctypes.byref(self._overlapped))
+            self.kernel32.GetOverlappedResult(self.handle, ctypes.byref(self._overlapped),
+                                              ctypes.byref(transferred), True)
+        self.kernel32.CloseHandle(self.event)
+        self.kernel32.CloseHandle(self.handle)
+        self.alive = False
+
+
+def create_directory_watcher(root):
+    """Sledování stromu root pro LocalIndex, na nepodporované platformě None"""
+    for watcher_class in (WindowsDirectoryWatcher, InotifyWatcher):
+        try:
+            return watcher_class(root)
+        except OSError:
+            continue
+    return None
+
+
+class LocalIndex:
+    """Stále aktuální obraz lokálního stromu pro synchronizaci
+
+    Drží výsledky scan_local_directory pro všechny složky pod root a změny
+    sleduje přes ReadDirectoryChangesW (Windows) nebo inotify (Linux). Při
+    dalším použití se znovu načtou jen složky, ve kterých se od minula něco
+    změnilo - lokální fáze synchronizace tak stojí úměrně změnám, ne
+    velikosti stromu. Porovnání se serverem nebo manifestem ale dál prochází
+    všechny soubory. Hashe obsahu index nedrží, ty zůstávají v LocalHashCache
+    podle cesty, velikosti a mtime_ns.
+    """
+
+    def __init__(self, root, watcher):
+        self.root = root
+        self.watcher = watcher
+        # rel_dir -> (soubory, podsložky)
+        self.dirs = {}
+        self.dirty = set()
+        self.file_count = 0
+        self.built = False
+        self.building = False
+        # Příliš velký strom nebo vyčerpané limity sledování - index se nepoužije
+        self.unavailable = False
+        self._lock = threading.Lock()
+        # Změny vyzvednuté z GUI vlákna čekají na zpracování v refresh
+        self._events_lock = threading.Lock()
+        self._pending = set()
+        self._overflow = False
+
+    @classmethod
+    def create(cls, root):
+        """Index pro root, bez podpory sledování (jiná platforma, limity) None"""
+        watcher = create_directory_watcher(root)
+        return cls(root, watcher) if watcher else None
+
+    def collect_events(self):
+        """Vyzvednout změny od sledování, aby nepřetekla fronta jádra (rychlé, i z GUI)"""
+        watcher = self.watcher
+        if watcher is None:
+            return
+        dirs, overflow = watcher.changes()
+        with self._events_lock:
+            self._pending.update(dirs)
+            self._overflow = self._overflow or overflow
+
+    def directories(self, task=None):
+        """Lokální strom ve tvaru iter_local_directories, aktualizovaný o změny
+
+        Zámek se drží jen při práci s indexem, složky se vydávají z kopie
+        (při prvním průchodu po jedné), takže porovnání ani sledování
+        během synchronizace nic neblokuje.
+        """
+        with self._lock:
+            if self.building:
+                # Index právě plní jiný průchod - tento projde strom sám
+                mode = 'walk'
+            else:
+                snapshot = self._current(task)
+                mode = 'snapshot' if snapshot is not None else 'build'
+                self.building = mode == 'build'
+
+        if mode == 'walk':
+            yield from iter_local_directories(self.root, task)
+            return
+        if mode == 'snapshot':
+            yield from snapshot
+            return
+
+        # První průchod index teprve plní - složky se vydávají průběžně
+        finished = False
+        try:
+            yield from self._build(task)
+            finished = True
+        finally:
+            with self._lock:
+                self.building = False
+                if finished and not self.unavailable:
+                    self.built = True
+                else:
+                    self._reset()
+            if self.unavailable:
+                self.close()
+
+    def reconcile(self, task=None):
+        """Projít všechny složky znovu - zachytí i změny, které sledování neohlásilo"""
+        with self._lock:
+            if not self.built:
+                return
+            self.dirty.update(self.dirs)
+            try:
+                self._refresh(task)
+            except BaseException:
+                self._reset()
+                raise
+
+    def close(self):
+        watcher = self.watcher
+        self.watcher = None
+        if watcher is not None:
+            watcher.close()
+
+    def _current(self, task):
+        """Aktualizovaná kopie indexu, dosud nenaplněný index None (volá se pod zámkem)"""
+        if not self.built:
+            return None
+        try:
+            self._refresh(task)
+        except OperationCancelled:
+            self._reset()
+            raise
+        except Exception:
+            # Index se nepodařilo dohnat - naplnit znovu
+            self._reset()
+            return None
+        return self._snapshot()
+
+    def _reset(self):
+        if self.watcher is not None:
+            for rel_dir in self.dirs:
+                self.watcher.unwatch_dir(rel_dir)
+        self.dirs.clear()
+        self.dirty.clear()
+        self.file_count = 0
+        self.built = False
+
+    def _build(self, task):
+        with self._lock:
+            self._reset()
+        # Změny nahlášené před prvním průchodem už průchod zachytí
+        self.collect_events()
+        with self._events_lock:
+            self._pending.clear()
+            self._overflow = False
+
+        pending = ['']
+        while pending:
+            if task:
+                task.check_cancelled()
+            rel_dir = pending.pop()
+            with self._lock:
+                files, subdirs = self._scan(rel_dir)
+            yield rel_dir, list(files), list(subdirs)
+            pending.extend(reversed(subdirs))
+
+    def _scan(self, rel_dir):
+        """Začít sledovat a načíst jednu složku (volá se pod zámkem)"""
+        if not self.unavailable:
+            # Sledovat dřív, než se složka načte - změna mezi tím se neztratí
+            try:
+                self.watcher.watch_dir(rel_dir)
+            except (OSError, AttributeError):
+                # Vyčerpaný limit sledování (max_user_watches) nebo ukončené sledování
+                self.unavailable = True
+        files, subdirs = scan_local_directory(self.root, rel_dir)
+        if not self.unavailable:
+            self.dirs[rel_dir] = (files, subdirs)
+            self.file_count += len(files)
+            if self.file_count > LOCAL_INDEX_MAX_FILES:
+                self.unavailable = True
+        return files, subdirs
+
+    def _scan_tree(self, rel_dir, task):
+        """Načíst a začít sledovat složku i s podsložkami (volá se pod zámkem)"""
+        pending = [rel_dir]
+        while pending:
+            if task:
+                task.check_cancelled()
+            current = pending.pop()
+            _, subdirs = self._scan(current)
+            pending.extend(subdirs)
+
+    def _drop_tree(self, rel_dir):
+        """Zapomenout složku i s podsložkami"""
+        pending = [rel_dir]
+        while pending:
+            current = pending.pop()
+            entry = self.dirs.pop(current, None)
+            if entry:
+                self.file_count -= len(entry[0])
+                pending.extend(entry[1])
+            if self.watcher is not None:
+                self.watcher.unwatch_dir(current)
+
+    def _refresh(self, task):
+        """Znovu načíst složky změněné od minula"""
+        self.collect_events()
+        if self.watcher is None or not self.watcher.alive:
+            raise RuntimeError("Sledování složek neběží.")
+        with self._events_lock:
+            pending = self._pending
+            self._pending = set()
+            overflow = self._overflow
+            self._overflow = False
+        if overflow:
+            self.dirty.update(self.dirs)
+        else:
+            self.dirty.update(pending)
+
+        while self.dirty:
+            if task:
+                task.check_cancelled()
+            # Rodiče dřív než podsložky - smazaný podstrom se pak už nenačítá
+            rel_dir = min(self.dirty, key=len)
+            self.dirty.discard(rel_dir)
+            self._rescan(rel_dir, task)
+
+        if self.unavailable:
+            raise RuntimeError("Lokální strom nelze držet v indexu.")
+
+    def _rescan(self, rel_dir, task):
+        old = self.dirs.get(rel_dir)
+        if old is None:
+            return
+        try:
+            files, subdirs = scan_local_directory(self.root, rel_dir)
+        except (FileNotFoundError, NotADirectoryError):
+            if not rel_dir:
+                raise
+            self._drop_tree(rel_dir)
+            self.dirty.add(rel_dir.rpartition('/')[0])
+            return
+
+        new_subdirs = set(subdirs)
+        for subdir in old[1]:
+            if subdir not in new_subdirs:
+                self._drop_tree(subdir)
+        self.dirs[rel_dir] = (files, subdirs)
+        self.file_count += len(files) - len(old[0])
+        for subdir in subdirs:
+            if subdir not in self.dirs:
+                try:
+                    self._scan_tree(subdir, task)
+                except (FileNotFoundError, NotADirectoryError):
+                    # Složka mezitím zmizela - rodiče načíst znovu
+                    self._drop_tree(subdir)
+                    self.dirty.add(rel_dir)
+
+    def _snapshot(self):
+        """Složky v pořadí iter_local_directories (volá se pod zámkem)
+
+        Seznamy souborů se nekopírují - _rescan je nahrazuje novými, nemění je.
+        """
+        snapshot = []
+        pending = ['']
+        while pending:
+            rel_dir = pending.pop()
+            files, subdirs = self.dirs[rel_dir]
+            snapshot.append((rel_dir, files, subdirs))
+            pending.extend(reversed(subdirs))
+        return snapshot
+
+
+def upload_tar_ssh(ssh_client, remote_root, files, task=None, on_progress=None, compression=None):
+    """Nahrát soubory jedním proudem tar do příkazu tar -x na serveru
+
+    files jsou záznamy k nahrání (local, rel_path), archiv se rozbalí do
+    remote_root a zachová časy změn. compression je None, 'gzip' nebo 'zstd'.
+    Vrací (nahrané, chyby), nebo None, pokud server tar (případně zstd) nemá
+    a volající má nahrát soubory přes SFTP jednotlivě. on_progress hlásí
+    odeslání souboru do archivu, nahraný je až po úspěšném konci tar na
+    serveru. Chyba během zápisu souboru do archivu ukončí celý archiv
+    výjimkou - hlavička už slíbila celou délku a další soubory by se
+    rozbalily posunuté.
+    """
+    required = ['tar'] + (['zstd'] if compression == 'zstd' else [])
+    probe = ' && '.join(f"command -v {tool} >/dev/null" for tool in required)
+    try:
+        stdin, stdout, stderr = ssh_client.exec_command(probe)
+        stdin.close()
+        if stdout.channel.recv_exit_status() != 0:
+            return None
+    except Exception:
+        return None
+
+    root = shlex.quote(remote_root.rstrip('/') or '/')
+    # tar při rozbalení zachová časy změn uložené v archivu
+    extract = f"tar -x --no-same-owner -C {root} -f -"
+    if compression == 'gzip':
+        extract = f"tar -xz --no-same-owner -C {root} -f -"
+    elif compression == 'zstd':
+        extract = f"zstd -dc | {extract}"
+
+    stdin, stdout, stderr = ssh_client.exec_command(f"mkdir -p {root} && {extract}")
+    channel = stdout.channel
+    sent = []
+    failed = []
+
+    try:
+        stream = stdin
+        if compression == 'zstd':
+            stream = zstandard.ZstdCompressor().stream_writer(stdin, closefd=False)
+        with tarfile.open(fileobj=stream, mode='w|gz' if compression == 'gzip' else 'w|') as archive:
+            for file_info in files:
+                if task:
+                    task.check_cancelled()
+                # Soubor zmizel nebo není čitelný - do archivu se nic nezapsalo, pokračuje se bez něj
+                try:
+                    f = open(file_info['local'], 'rb')
+                except OSError as e:
+                    failed.append(('Nahrání', file_info['rel_path'], str(e)))
+                    continue
+                try:
+                    file_stat = os.fstat(f.fileno())
+                except OSError as e:
+                    f.close()
+                    failed.append(('Nahrání', file_info['rel_path'], str(e)))
+                    continue
+                with f:
+                    info = tarfile.TarInfo(file_info['rel_path'])
+                    info.size = file_stat.st_size
+                    info.mtime = file_stat.st_mtime
+                    info.mode = file_stat.st_mode & 0o777
+                    # Zkrácený soubor nebo chyba kanálu vyvolá výjimku a ukončí celý archiv
+                    archive.addfile(info, f)
+                sent.append(file_info)
+                if on_progress:
+                    on_progress(file_info)
+        if stream is not stdin:
+            stream.close()
+        stdin.close()
+        channel.shutdown_write()
+
+        exit_status = channel.recv_exit_status()
+        if exit_status != 0:
+            errors = stderr.read().decode('utf-8', errors='ignore').strip()
+            raise RuntimeError(f"tar na serveru skončil s chybou {exit_status}: {errors}")
+    finally:
+        channel.close()
+
+    # Odeslané soubory jsou nahrané, až když je tar na serveru bez chyby rozbalil
+    return sent, failed
+
+
+def hash_file(path, algorithm='blake2b', chunk_size=1024 * 1024):
+    """Spočítat hash obsahu souboru"""
+    digest = hashlib.new(algorithm)
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class LocalHashCache:
+    """Cache hashů lokálních souborů podle (cesta, velikost, mtime_ns)
+
+    Nezměněné soubory se tak znovu nečtou. Chybějící hashe se počítají
+    paralelně v procesech.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS hash_cache (
+            path TEXT NOT NULL,
+            algorithm TEXT NOT NULL,
+            size INTEGER NOT NULL,
+            mtime_ns INTEGER NOT NULL,
+            digest TEXT NOT NULL,
+            PRIMARY KEY (path, algorithm)
+        );
+    """
+
+    # Pod tímto objemem dat se nevyplatí spouštět procesy
+    POOL_THRESHOLD = 8 * 1024 * 1024
+
+    def __init__(self, path=MANIFEST_FILE):
+        self.path = path
+
+    def connect(self):
+        """Otevřít databázi (každé vlákno si otevírá vlastní spojení)"""
+        db = sqlite3.connect(self.path)
+        db.executescript(self.SCHEMA)
+        return db
+
+    def hashes(self, files, algorithm='blake2b', task=None):
+        """Vrátit dict path -> hash pro soubory (dict s path, size, mtime_ns)"""
+        result = {}
+        missing = []
+
+        with closing(self.connect()) as db:
+            for start in range(0, len(files), 500):
+                chunk = files[start:start + 500]
+                placeholders = ','.join('?' * len(chunk))
+                rows = db.execute(
+                    f"SELECT path, size, mtime_ns, digest FROM hash_cache WHERE algorithm = ? AND path IN ({placeholders})",
+                    [algorithm] + [f['path'] for f in chunk]
+                )
+                cached = {path: (size, mtime_ns, digest) for path, size, mtime_ns, digest in rows}
+                for f in chunk:
+                    entry = cached.get(f['path'])
+                    if entry and entry[0] == f['size'] and entry[1] == f['mtime_ns']:
+                        result[f['path']] = entry[2]
+                    else:
+                        missing.append(f)
+
+        if not missing:
+            return result
+
+        computed = []
+        total_size = sum(f['size'] for f in missing)
+        if total_size < self.POOL_THRESHOLD or len(missing) == 1:
+            digests = (self.safe_hash(f['path'], algorithm) for f in missing)
+            for idx, (f, digest) in enumerate(zip(missing, digests)):
+                if task:
+                    task.check_cancelled()
+                    task.report(idx, len(missing), f"Počítám hash: {os.path.basename(f['path'])}")
+                computed.append((f, digest))
+        else:
+            with concurrent.futures.ProcessPoolExecutor() as executor:
+                futures = [executor.submit(self.safe_hash, f['path'], algorithm) for f in missing]
+                try:
+                    for idx, (f, future) in enumerate(zip(missing, futures)):
+                        if task:
+                            task.check_cancelled()
+                            task.report(idx, len(missing), f"Počítám hash: {os.path.basename(f['path'])}")
+                        computed.append((f, future.result()))
+                except OperationCancelled:
+                    for future in futures:
+                        future.cancel()
+                    raise
+
+        with closing(self.connect()) as db, db:
+            db.executemany(
+                "INSERT OR REPLACE INTO hash_cache VALUES (?, ?, ?, ?, ?)",
+                (
+                    (f['path'], algorithm, f['size'], f['mtime_ns'], digest)
+                    for f, digest in computed if digest
+                )
+            )
+
+        for f, digest in computed:
+            if digest:
+                result[f['path']] = digest
+        return result
+
+    @staticmethod
+    def safe_hash(path, algorithm):
+        """Hash souboru, None pokud soubor nejde přečíst"""
+        try:
+            return hash_file(path, algorithm)
+        except OSError:
+            return None
+
+
+# Algoritmy z FTP příkazu HASH -> názvy v hashlib
+FTP_HASH_ALGORITHMS = [('SHA-256', 'sha256'), ('SHA-1', 'sha1'), ('MD5', 'md5')]
+
+
+def remote_hashes_ftp(ftp_client, remote_root, rel_paths, task=None):
+    """Získat hashe vzdálených souborů přes FTP (HASH, XSHA256, XSHA1, XMD5)
+
+    Vrací (algoritmus, dict rel_path -> hash, chyba) nebo None, pokud server hash neumí.
+    Chyba je text první chyby, kvůli které některým souborům hash chybí, jinak None.
+    """
+    features = ftp_features(ftp_client)
+    command = None
+    algorithm = None
+
+    if 'HASH' in features:
+        offered = features['HASH'].upper().replace('*', '').split(';')
+        for ftp_name, hash_name in FTP_HASH_ALGORITHMS:
+            if ftp_name in offered:
+                try:
+                    ftp_client.sendcmd(f'OPTS HASH {ftp_name}')
+                    command, algorithm = 'HASH', hash_name
+                except Exception:
+                    pass
+                break
+    if command is None:
+        for ftp_name, hash_name in [('XSHA256', 'sha256'), ('XSHA1', 'sha1'), ('XMD5', 'md5')]:
+            if ftp_name in features:
+                command, algorithm = ftp_name, hash_name
+                break
+    if command is None:
+        return None
+
+    hashes = {}
+    error = None
+    for idx, rel_path in enumerate(rel_paths):
+        if task:
+            task.check_cancelled()
+            task.report(idx, len(rel_paths), f"Hash na serveru: {rel_path}")
+        try:
+            response = ftp_client.sendcmd(f"{command} {remote_root.rstrip('/')}/{rel_path}")
+        except Exception as e:
+            if error is None:
+                error = str(e)
+            continue
+        # HASH: "213 SHA-256 0-123 <hash> <název>", X*: "213 <hash>" (někdy i s názvem)
+        parts = response.split()
+        if command == 'HASH' and len(parts) >= 4:
+            hashes[rel_path] = parts[3].lower()
+        elif len(parts) >= 2:
+            hashes[rel_path] = parts[1].lower()
+    return algorithm, hashes, error
+
+
+def remote_hashes_ssh(ssh_client, remote_root, rel_paths, task=None):
+    """Získat SHA-256 vzdálených souborů dávkovým sha256sum přes SSH exec
+
+    Vrací ('sha256', dict rel_path -> hash, chyba) nebo None, pokud příkaz nelze spustit.
+    Když selže některá pozdější dávka, vrátí hashe z předchozích dávek a text chyby.
+    """
+    hashes = {}
+    batch = []
+    batch_length = 0
+    done = 0
+
+    def run_batch():
+        command = f"cd -- {shlex.quote(remote_root)} && sha256sum -- " + ' '.join(shlex.quote(p) for p in batch)
+        stdin, stdout, stderr = ssh_client.exec_command(command)
+        stdin.close()
+        output = stdout.read().decode('utf-8', errors='surrogateescape')
+        exit_status = stdout.channel.recv_exit_status()
+        if exit_status in (126, 127) and not output:
+            raise RuntimeError("sha256sum není na serveru k dispozici")
+        for line in output.splitlines():
+            # Názvy se zvláštními znaky sha256sum uvozuje zpětným lomítkem
+            escaped = line.startswith('\\')
+            if escaped:
+                line = line[1:]
+            digest, _, name = line.partition('  ')
+            if escaped:
+                name = name.replace('\\n', '\n').replace('\\\\', '\\')
+            if name:
+                hashes[name] = digest.lower()
+
+    try:
+        for rel_path in rel_paths:
+            batch.append(rel_path)
+            batch_length += len(rel_path) + 3
+            if len(batch) >= 500 or batch_length > 60000:
+                if task:
+                    task.check_cancelled()
+                    task.report(done, len(rel_paths), "Počítám hashe na serveru...")
+                run_batch()
+                done += len(batch)
+                batch, batch_length = [], 0
+        if batch:
+            run_batch()
+    except OperationCancelled:
+        raise
+    except Exception as e:
+        if not hashes:
+            return None
+        return 'sha256', hashes, str(e)
+
+    return 'sha256', hashes, None
+
+
+class SyncManifest:
+    """Záznam o posledním nahrání pro každé prostředí (SQLite vedle forte_environments.json)
+
+    Pro každý nahraný soubor si pamatuje velikost, mtime_ns a hash lokální verze,
+    takže další nahrání může změny určit jen z lokálního skenu bez dotazů na server.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS manifest (
+            env TEXT NOT NULL,
+            remote_root TEXT NOT NULL,
+            rel_path TEXT NOT NULL,
+            size INTEGER NOT NULL,
+            mtime_ns INTEGER NOT NULL,
+            content_hash TEXT,
+            remote_mtime REAL,
+            deploy_id TEXT,
+            PRIMARY KEY (env, remote_root, rel_path)
+        );
+        CREATE TABLE IF NOT EXISTS deploys (
+            deploy_id TEXT PRIMARY KEY,
+            env TEXT NOT NULL,
+            remote_root TEXT NOT NULL,
+            finished REAL NOT NULL,
+            uploaded INTEGER NOT NULL,
+            deleted INTEGER NOT NULL,
+            verified INTEGER NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS deployed_commits (
+            env TEXT NOT NULL,
+            remote_root TEXT NOT NULL,
+            commit_sha TEXT NOT NULL,
+            extra_paths TEXT NOT NULL,
+            finished REAL NOT NULL,
+            PRIMARY KEY (env, remote_root)
+        );
+    """
+
+    def __init__(self, path=MANIFEST_FILE):
+        self.path = path
+
+    def connect(self):
+        """Otevřít databázi (každé vlákno si otevírá vlastní spojení)"""
+        db = sqlite3.connect(self.path)
+        db.executescript(self.SCHEMA)
+        return db
+
+    def has_entries(self, env_name, remote_root):
+        """Zjistit, zda pro prostředí a cílovou složku existuje manifest"""
+        with closing(self.connect()) as db:
+            row = db.execute(
+                "SELECT 1 FROM manifest WHERE env = ? AND remote_root = ? LIMIT 1",
+                (env_name, remote_root)
+            ).fetchone()
+        return row is not None
+
+    def load(self, env_name, remote_root):
+        """Načíst manifest jako dict rel_path -> (size, mtime_ns, content_hash)"""
+        with closing(self.connect()) as db:
+            rows = db.execute(
+                "SELECT rel_path, size, mtime_ns, content_hash FROM manifest WHERE env = ? AND remote_root = ?",
+                (env_name, remote_root)
+            )
+            return {rel_path: (size, mtime_ns, content_hash) for rel_path, size, mtime_ns, content_hash in rows}
+
+    def needs_verification(self, env_name, remote_root, verify_every):
+        """Zjistit, zda je po verify_every nahráních čas na plné ověření serveru"""
+        if verify_every <= 0:
+            return False
+        with closing(self.connect()) as db:
+            last_verified = db.execute(
+                "SELECT MAX(finished) FROM deploys WHERE env = ? AND remote_root = ? AND verified = 1",
+                (env_name, remote_root)
+            ).fetchone()[0] or 0
+            since = db.execute(
+                "SELECT COUNT(*) FROM deploys WHERE env = ? AND remote_root = ? AND finished > ?",
+                (env_name, remote_root, last_verified)
+            ).fetchone()[0]
+        return since >= verify_every
+
+    def record_deploy(self, env_name, remote_root, uploaded, deleted, verified, in_sync=None):
+        """Zapsat výsledek nahrání
+
+        uploaded - nahrané soubory (dict s rel_path, size, mtime_ns, content_hash)
+        deleted  - relativní cesty smazané na serveru
+        verified - změny byly určeny plným porovnáním se serverem; manifest
+                   se pak přestaví z in_sync (souhlasící soubory) a uploaded,
+                   při in_sync=None je volající přestavěl průběžně (reset + add_entries)
+        """
+        deploy_id = uuid.uuid4().hex[:16]
+        now = time.time()
+
+        with closing(self.connect()) as db, db:
+            if verified and in_sync is not None:
+                # Hash nezměněného souboru z dřívějška se při přestavění neztratí
+                previous = {
+                    rel_path: (size, mtime_ns, content_hash)
+                    for rel_path, size, mtime_ns, content_hash in db.execute(
+                        "SELECT rel_path, size, mtime_ns, content_hash FROM manifest WHERE env = ? AND remote_root = ?",
+                        (env_name, remote_root)
+                    )
+                }
+                db.execute("DELETE FROM manifest WHERE env = ? AND remote_root = ?", (env_name, remote_root))
+                db.executemany(
+                    "INSERT OR REPLACE INTO manifest VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (
+                        (env_name, remote_root, f['rel_path'], f['size'], f['mtime_ns'],
+                         f.get('content_hash') or self.previous_hash(previous, f),
+                         f.get('remote_mtime'), deploy_id)
+                        for f in in_sync
+                    )
+                )
+            db.executemany(
+                "INSERT OR REPLACE INTO manifest VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    (env_name, remote_root, f['rel_path'], f['size'], f['mtime_ns'],
+                     f.get('content_hash'), f.get('remote_mtime'), deploy_id)
+                    for f in uploaded
+                )
+            )
+            db.executemany(
+                "DELETE FROM manifest WHERE env = ? AND remote_root = ? AND (rel_path = ? OR rel_path LIKE ? ESCAPE '\\')",
+                (
+                    (env_name, remote_root, rel_path, self.escape_like(rel_path) + '/%')
+                    for rel_path in deleted
+                )
+            )
+            db.execute(
+                "INSERT INTO deploys VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (deploy_id, env_name, remote_root, now, len(uploaded), len(deleted), int(verified))
+            )
+        return deploy_id
+
+    def deployed_commit(self, env_name, remote_root):
+        """Naposledy nahraný Git commit jako (sha, necommitnuté cesty nahrané navíc) nebo None"""
+        with closing(self.connect()) as db:
+            row = db.execute(
+                "SELECT commit_sha, extra_paths FROM deployed_commits WHERE env = ? AND remote_root = ?",
+                (env_name, remote_root)
+            ).fetchone()
+        if row is None:
+            return None
+        return row[0], json.loads(row[1])
+
+    def record_commit(self, env_name, remote_root, commit_sha, extra_paths):
+        """Zapsat commit, jehož stav (plus extra_paths z pracovní složky) je na serveru"""
+        with closing(self.connect()) as db, db:
+            db.execute(
+                "INSERT OR REPLACE INTO deployed_commits VALUES (?, ?, ?, ?, ?)",
+                (env_name, remote_root, commit_sha, json.dumps(sorted(extra_paths)), time.time())
+            )
+
+    def reset(self, env_name, remote_root):
+        """Smazat manifest prostředí před průběžným přestavěním"""
+        with closing(self.connect()) as db, db:
+            db.execute("DELETE FROM manifest WHERE env = ? AND remote_root = ?", (env_name, remote_root))
+
+    def add_entries(self, env_name, remote_root, files):
+        """Přidat soubory souhlasící se serverem (průběžné přestavění manifestu)"""
+        with closing(self.connect()) as db, db:
+            db.executemany(
+                "INSERT OR REPLACE INTO manifest VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    (env_name, remote_root, f['rel_path'], f['size'], f['mtime_ns'],
+                     f.get('content_hash'), f.get('remote_mtime'), None)
+                    for f in files
+                )
+            )
+
+    def touch(self, env_name, remote_root, files):
+        """Aktualizovat mtime_ns souborů, jejichž obsah se nezměnil"""
+        with closing(self.connect()) as db, db:
+            db.executemany(
+                "UPDATE manifest SET mtime_ns = ? WHERE env = ? AND remote_root = ? AND rel_path = ?",
+                ((f['mtime_ns'], env_name, remote_root, f['rel_path']) for f in files)
+            )
+
+    @staticmethod
+    def previous_hash(previous, f):
+        """Hash z dřívějšího záznamu (rel_path -> (size, mtime_ns, hash)), pokud se soubor nezměnil"""
+        entry = previous.get(f['rel_path'])
+        if entry and entry[0] == f['size'] and entry[1] == f['mtime_ns']:
+            return entry[2]
+        return None
+
+    @staticmethod
+    def escape_like(value):
+        """Escapovat zástupné znaky pro LIKE"""
+        return value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+class TransferPool:
+    """Skupina souběžných spojení, která společně vyprázdní frontu souborů k nahrání
+
+    Fronta je omezená, takže producent (kontrola změn) čeká, když nahrávání
+    nestíhá, a paměť zůstává konstantní.
+    """
+
+    def __init__(self, env, size, remote_root, ftp_client=None, sftp_client=None, use_primary=True, queue_size=0, known_dirs=None, connections=None):
+        self.env = env
+        # Pool teplých spojení - pracovníci si spojení půjčí a po synchronizaci vrátí
+        self.connections = connections
+        self.size = max(1, int(size))
+        self.remote_root = remote_root
+        # Hlavní spojení aplikace se použije jako první pracovník (pokud ho nepotřebuje někdo jiný)
+        self.primary_ftp = ftp_client
+        self.primary_sftp = sftp_client
+        self.use_primary = use_primary
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.threads = []
+        self.failed_files = []
+        self.warnings = []
+        self.uploaded = 0
+        self.uploaded_files = []
+        self.alive = 0
+        # Handshaky TLS datových spojení všech pracovníků (jen FTPS)
+        self.tls_stats = {'handshakes': 0, 'reused': 0, 'handshake_time': 0.0}
+        # Složky známé ze vzdáleného výpisu nebo už vytvořené - sdílené všemi spojeními
+        self.known_dirs = set(known_dirs or ())
+        self._lock = threading.Lock()
+        self._dirs_lock = threading.Lock()
+
+    def open_worker_connection(self):
+        """Otevřít (nebo z poolu půjčit) další spojení pro pracovníka, vrací (ftp, ssh, sftp)"""
+        if self.connections:
+            session = self.connections.acquire(self.env)
+            if self.primary_ftp:
+                return session, None, None
+            return None, session, session.sftp_client
+        if self.primary_ftp:
+            return open_ftp_connection(self.env), None, None
+        ssh_client, sftp_client = open_sftp_connection(self.env)
+        return None, ssh_client, sftp_client
+
+    def close_worker_connection(self, ftp_client, ssh_client, sftp_client):
+        """Vrátit spojení pracovníka do poolu, bez poolu ho zavřít"""
+        if self.connections:
+            self.connections.release(ftp_client or ssh_client)
+            return
+        try:
+            if ftp_client:
+                ftp_client.quit()
+            if sftp_client:
+                sftp_client.close()
+            if ssh_client:
+                ssh_client.close()
+        except:
+            pass
+
+    def ensure_dirs(self, remote_dir, ftp_client, sftp_client):
+        """Vytvořit chybějící vzdálené složky, každou jen jednou za synchronizaci"""
+        if not remote_dir or remote_dir in self.known_dirs:
+            return
+        # Zámek zajistí, že stejnou složku nezakládá více spojení najednou
+        with self._dirs_lock:
+            if ftp_client:
+                ensure_remote_dirs_ftp(ftp_client, remote_dir, self.known_dirs)
+            else:
+                ensure_remote_dirs_sftp(sftp_client, remote_dir, self.known_dirs)
+
+    def upload_one(self, file_info, ftp_client, sftp_client):
+        """Nahrát jeden soubor po daném spojení"""
+        remote_dir = '/'.join(file_info['remote'].split('/')[:-1])
+
+        # Vytvořit vzdálené složky pokud neexistují
+        self.ensure_dirs(remote_dir, ftp_client, sftp_client)
+
+        # Na přerušené nahrání navázat, ostatní soubory nahrát celé přímo na absolutní cestu
+        resume = self.env.get('resume_transfers', 'verify')
+        if file_info.get('resume_from') and resume:
+            upload_resumable(
+                file_info['local'], file_info['remote'], ftp_client, sftp_client,
+                offset=file_info['resume_from'],
+                verify_tail=resume == 'verify'
+            )
+
+        elif ftp_client:
+            with open(file_info['local'], 'rb') as f:
+                ftp_client.storbinary(f"STOR {file_info['remote']}", f)
+
+        elif sftp_client:
+            sftp_put(sftp_client, file_info['local'], file_info['remote'])
+
+    def start(self, task, worker_count=None, on_progress=None):
+        """Spustit pracovníky, kteří čekají na soubory ve frontě"""
+        worker_count = self.size if worker_count is None else max(1, min(self.size, worker_count))
+        first = 0 if self.use_primary else 1
+        self.alive = worker_count
+        self.threads = [
+            threading.Thread(target=self.worker, args=(task, index, on_progress), daemon=True)
+            for index in range(first, first + worker_count)
+        ]
+        for thread in self.threads:
+            thread.start()
+
+    def put(self, task, file_info):
+        """Zařadit soubor do fronty, při plné frontě počkat na pracovníky"""
+        while True:
+            task.check_cancelled()
+            if self.alive == 0:
+                raise RuntimeError("Nepodařilo se otevřít žádné spojení pro nahrávání.\n" + "\n".join(self.warnings))
+            try:
+                self.queue.put(file_info, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def finish(self):
+        """Oznámit konec fronty a počkat na dokončení pracovníků"""
+        for _ in self.threads:
+            while True:
+                try:
+                    self.queue.put(None, timeout=0.1)
+                    break
+                except queue.Full:
+                    if self.alive == 0:
+                        break
+        for thread in self.threads:
+            thread.join()
+
+    def upload(self, task, files_to_upload, on_progress=None):
+        """Nahrát všechny soubory, vrací počet úspěšně nahraných"""
+        self.start(task, len(files_to_upload), on_progress)
+        try:
+            for file_info in files_to_upload:
+                self.put(task, file_info)
+        except OperationCancelled:
+            pass
+        finally:
+            self.finish()
+
+        return self.uploaded
+
+    def worker(self, task, index, on_progress):
+        """Smyčka jednoho pracovníka - každý má vlastní spojení"""
+        own_connection = index > 0
+
+        if own_connection:
+            try:
+                ftp_client, ssh_client, sftp_client = self.open_worker_connection()
+            except Exception as e:
+                # Server může omezovat počet spojení, frontu dokončí ostatní pracovníci
+                with self._lock:
+                    self.warnings.append(f"Spojení #{index + 1} se nepodařilo otevřít: {e}")
+                    self.alive -= 1
+                return
+        else:
+            ftp_client, ssh_client, sftp_client = self.primary_ftp, None, self.primary_sftp
+        tls_before = tls_stats_snapshot(ftp_client)
+
+        try:
+            while not task.is_cancelled():
+                try:
+                    file_info = self.queue.get(timeout=0.1)
+                except queue.Empty:
+                    continue
+                if file_info is None:
+                    break
+
+                try:
+                    self.upload_one(file_info, ftp_client, sftp_client)
+                    with self._lock:
+                        self.uploaded += 1
+                        self.uploaded_files.append(file_info)
+                except Exception as e:
+                    with self._lock:
+                        self.failed_files.append(('Nahrání', file_info['rel_path'], str(e)))
+
+                if on_progress:
+                    on_progress(file_info)
+        finally:
+            tls_after = tls_stats_snapshot(ftp_client)
+            with self._lock:
+                self.alive -= 1
+                for name, value in tls_after.items():
+                    # Po obnovení spojení začínají počítadla znovu od nuly
+                    self.tls_stats[name] += max(0, value - tls_before.get(name, 0))
+            if own_connection:
+                self.close_worker_connection(ftp_client, ssh_client, sftp_client)
+
+
+@functools.lru_cache(maxsize=None)
+def git_available():
+    """Ověřit dostupnost git v PATH (jednou za běh programu)"""
+    try:
+        subprocess.run(["git", "--version"], capture_output=True, check=True)
+        return True
+    except Exception:
+        return False
+
+
+class GitRepoCache:
+    """Kořeny Git repozitářů podle složek a otisk stavu repozitáře
+
+    Kořen se hledá po souborovém systému (.git) bez spouštění gitu a výsledek
+    se zapamatuje pro všechny složky na cestě. Stav repa se pozná podle času
+    změny indexu, HEAD a referencí v .git.
+    """
+
+    STATE_FILES = ('index', 'HEAD', 'logs/HEAD', 'FETCH_HEAD', 'packed-refs', 'refs/heads')
+
+    def __init__(self):
+        self.roots = {}
+        self._lock = threading.Lock()
+
+    def repo_root(self, path):
+        """Kořen repozitáře, ve kterém path leží, nebo None"""
+        try:
+            current = os.path.realpath(path)
+        except (OSError, ValueError):
+            return None
+
+        visited = []
+        root = None
+        while True:
+            with self._lock:
+                if current in self.roots:
+                    root = self.roots[current]
+                    break
+            visited.append(current)
+            # .git je složka, u worktree a submodulů soubor s odkazem
+            if os.path.exists(os.path.join(current, '.git')):
+                root = current
+                break
+            parent = os.path.dirname(current)
+            if parent == current:
+                break
+            current = parent
+
+        with self._lock:
+            for directory in visited:
+                self.roots[directory] = root
+        return root
+
+    def invalidate(self):
+        """Zapomenout nalezené kořeny (např. po git init)"""
+        with self._lock:
+            self.roots.clear()
+
+    @staticmethod
+    def git_dir(root):
+        """Cesta ke složce .git (u worktree a submodulů podle souboru .git)"""
+        dot_git = os.path.join(root, '.git')
+        if os.path.isfile(dot_git):
+            try:
+                with open(dot_git, encoding='utf-8') as f:
+                    content = f.read().strip()
+            except OSError:
+                return dot_git
+            if content.startswith('gitdir:'):
+                return os.path.join(root, content[len('gitdir:'):].strip())
+        return dot_git
+
+    def state(self, root):
+        """Otisk stavu repa - změní se commitem, checkoutem, fetch i změnou indexu"""
+        git_dir = self.git_dir(root)
+        stamps = []
+        for name in self.STATE_FILES:
+            try:
+                stamps.append(os.stat(os.path.join(git_dir, name)).st_mtime_ns)
+            except OSError:
+                stamps.append(None)
+        return tuple(stamps)
+
+
+def run_git(root, args, strip=True):
+    """Spustit Git příkaz v root (strip=False - výstup beze změny, např. pro -z)"""
+    return run_git_batch(root, [args], strip)[0]
+
+
+def run_git_batch(root, commands, strip=True):
+    """Spustit několik nezávislých Git příkazů souběžně a vrátit jejich výstupy
+
+    Dávka trvá jako nejpomalejší příkaz, ne jako jejich součet.
+    """
+    processes = []
+    try:
+        for args in commands:
+            # Git vypisuje cesty i hlášky v UTF-8 nezávisle na kódové stránce systému
+            processes.append(subprocess.Popen(
+                ["git", "-C", root] + args,
+                stdin=subprocess.DEVNULL,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                encoding="utf-8",
+                errors="replace"
+            ))
+    except FileNotFoundError:
+        for process in processes:
+            process.kill()
+            process.communicate()
+        raise RuntimeError("Git není nainstalovaný nebo není v PATH.")
+
+    outputs = []
+    failure = None
+    for process in processes:
+        stdout, stderr = process.communicate()
+        output = stdout.strip() if strip else stdout
+        if process.returncode != 0 and failure is None:
+            failure = stderr.strip() or output or "Neznámá Git chyba."
+        outputs.append(output)
+
+    if failure is not None:
+        raise RuntimeError(failure)
+    return outputs
+
+
+class GitRepoState:
+    """Stav repozitáře - větev, upstream, změněné soubory a lokální větve
+
+    Skládá se ze strojově čitelného výstupu git status --porcelain=v2
+    a git for-each-ref, Git záložka se vykresluje jen z něj.
+    """
+
+    __slots__ = ('head', 'oid', 'upstream', 'ahead', 'behind', 'changes', 'branches')
+
+    def __init__(self):
+        self.head = None
+        self.oid = None
+        self.upstream = None
+        self.ahead = 0
+        self.behind = 0
+        # (XY, cesta, původní cesta u přejmenování)
+        self.changes = []
+        # (název, upstream, stav vůči upstreamu)
+        self.branches = []
+
+    @property
+    def detached(self):
+        return self.head is None
+
+    @classmethod
+    def parse(cls, status_output, branches_output):
+        """Sestavit stav z výstupu status --porcelain=v2 --branch -z a for-each-ref"""
+        state = cls()
+        records = iter(status_output.split('\0'))
+        for record in records:
+            if not record:
+                continue
+            kind = record[0]
+            if kind == '#':
+                _, key, value = record.split(' ', 2)
+                if key == 'branch.oid':
+                    state.oid = None if value == '(initial)' else value
+                elif key == 'branch.head':
+                    state.head = None if value == '(detached)' else value
+                elif key == 'branch.upstream':
+                    state.upstream = value
+                elif key == 'branch.ab':
+                    ahead, behind = value.split()
+                    state.ahead = int(ahead)
+                    state.behind = -int(behind)
+            elif kind == '1':
+                fields = record.split(' ', 8)
+                state.changes.append((fields[1], fields[8], None))
+            elif kind == '2':
+                fields = record.split(' ', 9)
+                # U přejmenování následuje původní cesta jako samostatné pole
+                state.changes.append((fields[1], fields[9], next(records, None)))
+            elif kind == 'u':
+                fields = record.split(' ', 10)
+                state.changes.append((fields[1], fields[10], None))
+            elif kind == '?':
+                state.changes.append(('??', record[2:], None))
+
+        for line in branches_output.splitlines():
+            if not line:
+                continue
+            current, name, upstream, track = line.split('\0')
+            state.branches.append((name, upstream or None, track))
+            if current == '*' and state.head is None:
+                state.head = name
+        return state
+
+    def format_status(self):
+        """Textový přehled ve stylu git status -sb"""
+        if self.detached:
+            header = "## HEAD (žádná větev)"
+        elif self.oid is None:
+            header = f"## Zatím bez commitů na {self.head}"
+        else:
+            header = f"## {self.head}"
+            if self.upstream:
+                header += f"...{self.upstream}"
+                track = []
+                if self.ahead:
+                    track.append(f"ahead {self.ahead}")
+                if self.behind:
+                    track.append(f"behind {self.behind}")
+                if track:
+                    header += f" [{', '.join(track)}]"
+
+        lines = [header]
+        for xy, path, orig_path in self.changes:
+            xy = xy.replace('.', ' ')
+            lines.append(f"{xy} {orig_path} -> {path}" if orig_path else f"{xy} {path}")
+        if not self.changes:
+            lines.append("Čistý stav.")
+        return "\n".join(lines)
+
+
+class GitBackend:
+    """Git operace nad jedním repozitářem
+
+    Stav se zjišťuje jednou dávkou strojově čitelných příkazů a obsah objektů
+    čte jeden trvale běžící git cat-file --batch, takže se nespouští proces
+    na každý dotaz.
+    """
+
+    STATUS_ARGS = ["status", "--porcelain=v2", "--branch", "-z"]
+    BRANCHES_ARGS = [
+        "for-each-ref",
+        "--format=%(HEAD)%00%(refname:short)%00%(upstream:short)%00%(upstream:track)",
+        "refs/heads"
+    ]
+
+    def __init__(self, root):
+        self.root = root
+        self._cat_file = None
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def run(self, args, strip=True):
+        """Spustit Git příkaz v repozitáři"""
+        return run_git(self.root, args, strip)
+
+    def query_state(self):
+        """Načíst GitRepoState (status a větve souběžně)"""
+        status_output, branches_output = run_git_batch(
+            self.root, [self.STATUS_ARGS, self.BRANCHES_ARGS], strip=False
+        )
+        return GitRepoState.parse(status_output, branches_output)
+
+    def read_object(self, rev):
+        """Objekt podle revize jako (oid, typ, obsah), neexistující None"""
+        with self._lock:
+            process = self._cat_file
+            if process is None or process.poll() is not None:
+                try:
+                    process = subprocess.Popen(
+                        ["git", "-C", self.root, "cat-file", "--batch"],
+                        stdin=subprocess.PIPE,
+                        stdout=subprocess.PIPE,
+                        stderr=subprocess.DEVNULL
+                    )
+                except FileNotFoundError:
+                    raise RuntimeError("Git není nainstalovaný nebo není v PATH.")
+                self._cat_file = process
+
+            try:
+                process.stdin.write(rev.encode('utf-8') + b"\n")
+                process.stdin.flush()
+                header = process.stdout.readline()
+                if header.endswith((b" missing\n", b" ambiguous\n")):
+                    return None
+                oid, kind, size = header.split()
+                data = process.stdout.read(int(size))
+                process.stdout.read(1)
+            except (OSError, ValueError):
+                self._close_cat_file()
+                raise RuntimeError(f"Git cat-file selhal pro {rev}.")
+            return oid.decode('ascii'), kind.decode('ascii'), data
+
+    def _close_cat_file(self):
+        process = self._cat_file
+        self._cat_file = None
+        if process is None:
+            return
+        try:
+            process.stdin.close()
+            process.wait(timeout=2)
+        except Exception:
+            process.kill()
+            process.wait()
+
+    def close(self):
+        """Ukončit trvale běžící procesy"""
+        with self._lock:
+            self._close_cat_file()
+
+
+class StreamGate:
+    """Dávkování čtení streamu - čtení stojí, dokud GUI nepožádá o další stránku"""
+
+    def __init__(self, lines):
+        self.allowed = lines
+        self._condition = threading.Condition()
+
+    def request(self, lines):
+        """Povolit načtení dalších lines řádků (volá GUI při posunu ke konci)"""
+        with self._condition:
+            self.allowed += lines
+            self._condition.notify_all()
+
+    def wait(self, task, consumed):
+        """Počkat, dokud není povoleno víc než consumed řádků"""
+        with self._condition:
+            while consumed >= self.allowed:
+                task.check_cancelled()
+                self._condition.wait(0.1)
+
+
+def stream_git_lines(task, root, args, gate):
+    """Číst výstup Git příkazu po řádcích a posílat je GUI po dávkách (task.emit_partial)
+
+    Nečte se víc, než gate povolí - git mezitím stojí na plném pipe, takže
+    paměť nezávisí na velikosti výstupu. Vrací počet přečtených řádků.
+    """
+    try:
+        process = subprocess.Popen(
+            ["git", "-C", root] + args,
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            encoding="utf-8",
+            errors="replace"
+        )
+    except FileNotFoundError:
+        raise RuntimeError("Git není nainstalovaný nebo není v PATH.")
+
+    count = 0
+    batch = []
+    try:
+        for line in process.stdout:
+            line = line.rstrip('\n')
+            if len(line) > GIT_VIEW_MAX_LINE_CHARS:
+                line = f"{line[:GIT_VIEW_MAX_LINE_CHARS]} … (zkráceno, {len(line)} znaků)"
+            batch.append(line)
+            count += 1
+            if len(batch) >= GIT_VIEW_BATCH_LINES:
+                task.emit_partial(batch)
+                batch = []
+                task.check_cancelled()
+                gate.wait(task, count)
+        if batch:
+            task.emit_partial(batch)
+        error = process.stderr.read().strip()
+        process.wait()
+    except BaseException:
+        process.kill()
+        process.wait()
+        raise
+    finally:
+        process.stdout.close()
+        process.stderr.close()
+
+    if process.returncode != 0:
+        raise RuntimeError(error or "Neznámá Git chyba.")
+    return count
+
+
+def parse_git_numstat(output):
+    """Výstup git diff --numstat -z jako [(cesta, přidáno, odebráno)], binární soubory None"""
+    files = []
+    fields = iter(output.split('\0'))
+    for field in fields:
+        if not field:
+            continue
+        added, deleted, path = field.split('\t', 2)
+        if not path:
+            # Přejmenování: následuje původní a nová cesta
+            next(fields, None)
+            path = next(fields, '')
+        files.append((
+            path,
+            None if added == '-' else int(added),
+            None if deleted == '-' else int(deleted)
+        ))
+    return files
+
+
+class OperationEngine(QObject):
+    """Správce operací běžících na pozadí"""
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        # Operace nad jedním spojením se musí střídat, ftplib ani paramiko SFTP nejsou thread-safe
+        self.session_lock = threading.RLock()
+        # Git příkazy nad stejným repem také běží postupně (index.lock)
+        self.git_lock = threading.RLock()
+        self.generation = 0
+        self.threads = set()
+
+    def start(self, thread, on_success=None, on_error=None, on_progress=None, on_cancel=None, session=False,
+              on_partial=None):
+        """Spustit připravené vlákno a napojit callbacky"""
+        thread.generation = self.generation if session else None
+
+        def is_current():
+            return thread.generation is None or thread.generation == self.generation
+
+        if on_success:
+            thread.succeeded.connect(lambda result: is_current() and on_success(result))
+        if on_error:
+            thread.failed.connect(lambda message: is_current() and on_error(message))
+        if on_progress:
+            thread.progress.connect(on_progress)
+        if on_partial:
+            thread.partial.connect(lambda data: is_current() and on_partial(data))
+        if on_cancel:
+            thread.cancelled.connect(lambda: is_current() and on_cancel())
+
+        self.threads.add(thread)
+        thread.finished.connect(lambda: self.threads.discard(thread))
+        thread.start()
+        return thread
+
+    def run(self, func, *args, on_success=None, on_error=None, on_progress=None, on_cancel=None,
+            on_partial=None, session=True, **kwargs):
+        """Spustit funkci func(task, *args) na pozadí
+
+        session=True  - operace nad vzdáleným spojením (serializované přes session_lock)
+        session=False - Git operace (serializované přes git_lock)
+        """
+        lock = self.session_lock if session else self.git_lock
+        thread = OperationThread(func, *args, lock=lock, **kwargs)
+        return self.start(thread, on_success, on_error, on_progress, on_cancel, session, on_partial)
+
+    def invalidate_session(self):
+        """Zahodit výsledky rozběhnutých operací starého spojení a zrušit je"""
+        self.generation += 1
+        for thread in list(self.threads):
+            if thread.generation is not None:
+                thread.cancel()
+
+    def cancel_all(self):
+        """Zrušit všechny běžící operace"""
+        for thread in list(self.threads):
+            thread.cancel()
+
+    def wait_all(self, msecs=3000):
+        """Počkat na doběhnutí všech vláken (při ukončení aplikace)"""
+        for thread in list(self.threads):
+            thread.wait(msecs)
+
+
+class FORTEftp(QMainWindow):
+    """Hlavní okno aplikace FORTEftp"""
+    
+    def __init__(self):
+        super().__init__()
+        self.setWindowTitle("FORTEftp - FTP/SSH Klient")
+        self.setGeometry(100, 100, 1200, 700)
+        
+        # Nastavit ikonu
+        icon_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "icon.ico")
+        if os.path.exists(icon_path):
+            self.setWindowIcon(QIcon(icon_path))
+        
+        self.ftp_client = None
+        self.ssh_client = None
+        self.sftp_client = None
+        self.current_env = None
+        self.current_remote_path = "/"
+        self.current_local_path = str(Path.home())
+        self.git_repo_root = None
+        self.git_repo_stamp = None
+        self.git_repos = GitRepoCache()
+        self.git_backend = None
+        self.git_state = None
+        self.git_diff_task = None
+        self.git_diff_gate = None
+        self.git_log_task = None
+        self.git_log_next = None
+        self.git_log_rev = "HEAD"
+        # Index lokálního stromu poslední synchronizace (jen s inotify)
+        self.local_index = None
+        self.local_index_lock = threading.Lock()
+        self.local_index_task = None
+        # Git záložka se obnoví až při zobrazení
+        self.git_refresh_pending = True
+        self.engine = OperationEngine(self)
+        self.connections = ConnectionPool()
+        self.remote_refresh_task = None
+        self.remote_listing = 0
+        self.listing_cache = RemoteListingCache()
+        self.prefetch_task = None
+        self.local_scan = None
+        
+        # Index lokálního stromu: průběžně vyzvedávat události a občas ho celý ověřit
+        self.local_index_events_timer = QTimer(self)
+        self.local_index_events_timer.setInterval(LOCAL_INDEX_EVENTS_MS)
+        self.local_index_events_timer.timeout.connect(self.collect_local_index_events)
+        self.local_index_events_timer.start()
+        self.local_index_reconcile_timer = QTimer(self)
+        self.local_index_reconcile_timer.setInterval(LOCAL_INDEX_RECONCILE_MS)
+        self.local_index_reconcile_timer.timeout.connect(self.reconcile_local_index)
+        self.local_index_reconcile_timer.start()
+        
+        self.init_ui()
+        self.load_environments()
+    
+    def init_ui(self):
+        """Inicializace uživatelského rozhraní"""
+        central_widget = QWidget()
+        self.setCentralWidget(central_widget)
+        
+        main_layout = QVBoxLayout()
+        
+        # Horní panel - výběr prostředí
+        top_panel = self.create_top_panel()
+        main_layout.addLayout(top_panel)
+        
+        # Hlavní obsah - záložky
+        self.tabs = QTabWidget()
+        
+        # Záložka FTP správce
+        self.ftp_tab = self.create_ftp_tab()
+        self.tabs.addTab(self.ftp_tab, "📁 FTP Správce")
+        
+        # Záložka SSH terminál
+        self.ssh_terminal = SSHTerminal()
+        self.tabs.addTab(self.ssh_terminal, "💻 SSH Terminál")
+
+        # Záložka Git
+        self.git_tab = self.create_git_tab()
+        self.tabs.addTab(self.git_tab, "🧩 Git")
+        self.tabs.currentChanged.connect(self.on_tab_changed)
+        
+        main_layout.addWidget(self.tabs)
+        
+        # Stavový řádek
+        self.status_label = QLabel("Nepřipojeno")
+        main_layout.addWidget(self.status_label)
+        
+        central_widget.setLayout(main_layout)
+    
+    def create_top_panel(self):
+        """Vytvořit horní panel s ovládáním"""
+        layout = QHBoxLayout()
+        
+        # Výběr prostředí
+        layout.addWidget(QLabel("Prostředí:"))
+        self.env_combo = QComboBox()
+        self.env_combo.setMinimumWidth(200)
+        layout.addWidget(self.env_combo)
+        
+        # Tlačítka pro správu prostředí
+        self.new_env_btn = QPushButton("➕ Nové")
+        self.new_env_btn.clicked.connect(self.new_environment)
+        layout.addWidget(self.new_env_btn)
+        
+        self.edit_env_btn = QPushButton("✏️ Upravit")
+        self.edit_env_btn.clicked.connect(self.edit_environment)
+        layout.addWidget(self.edit_env_btn)
+        
+        self.delete_env_btn = QPushButton("🗑️ Smazat")
+        self.delete_env_btn.clicked.connect(self.delete_environment)
+        layout.addWidget(self.delete_env_btn)
+        
+        layout.addSpacing(20)
+        
+        # Tlačítko připojit/odpojit
+        self.connect_btn = QPushButton("🔌 Připojit")
+        self.connect_btn.clicked.connect(self.toggle_connection)
+        self.connect_btn.setStyleSheet("QPushButton { font-weight: bold; padding: 5px 15px; }")
+        layout.addWidget(self.connect_btn)
+        
+        # Změřit zkušební přenos a uložit nejrychlejší nastavení SFTP
+        self.tune_sftp_btn = QPushButton("⚡ Vyladit SFTP")
+        self.tune_sftp_btn.setToolTip("Vyzkouší velikosti okna a požadavků a uloží nejrychlejší do prostředí")
+        self.tune_sftp_btn.clicked.connect(self.tune_sftp)
+        layout.addWidget(self.tune_sftp_btn)
+        
+        layout.addStretch()
+        
+        return layout
+    
+    def create_file_view(self, model, context_menu, double_clicked):
+        """Vytvořit seznam souborů nad FileListModel"""
+        view = QTreeView()
+        view.setModel(model)
+        view.setRootIsDecorated(False)
+        # Stejná výška řádků - view nemusí měřit každý řádek zvlášť
+        view.setUniformRowHeights(True)
+        view.setSortingEnabled(True)
+        view.sortByColumn(0, Qt.AscendingOrder)
+        view.setContextMenuPolicy(Qt.CustomContextMenu)
+        view.customContextMenuRequested.connect(context_menu)
+        view.doubleClicked.connect(double_clicked)
+        return view
+    
+    def create_filter_input(self, model):
+        """Vytvořit pole pro filtrování seznamu souborů podle názvu"""
+        filter_input = QLineEdit()
+        filter_input.setPlaceholderText("🔍 Filtr názvu...")
+        filter_input.setClearButtonEnabled(True)
+        filter_input.textChanged.connect(model.set_filter)
+        return filter_input
+    
+    def create_ftp_tab(self):
+        """Vytvořit záložku FTP správce"""
+        widget = QWidget()
+        layout = QVBoxLayout()
+        
+        # Splitter pro rozdělení na levou a pravou část
+        splitter = QSplitter(Qt.Horizontal)
+        
+        # Levá strana - lokální soubory
+        left_panel = QWidget()
+        left_layout = QVBoxLayout()
+        
+        left_layout.addWidget(QLabel("💻 Lokální soubory:"))
+        
+        # Navigace
+        local_nav = QHBoxLayout()
+        self.local_path_input = QLineEdit(self.current_local_path)
+        self.local_path_input.returnPressed.connect(self.refresh_local_files)
+        local_nav.addWidget(self.local_path_input)
+        self.local_refresh_btn = QPushButton("🔄")
+        self.local_refresh_btn.clicked.connect(self.refresh_local_files)
+        local_nav.addWidget(self.local_refresh_btn)
+        left_layout.addLayout(local_nav)
+        
+        # Seznam souborů
+        self.local_model = FileListModel(self)
+        self.local_tree = self.create_file_view(
+            self.local_model, self.local_context_menu, self.local_item_double_clicked
+        )
+        left_layout.addWidget(self.create_filter_input(self.local_model))
         left_layout.addWidget(self.local_tree)
         
+        # Lokální složka se načítá po dávkách, aby velké složky neblokovaly GUI
+        self.local_load_timer = QTimer(self)
+        self.local_load_timer.setInterval(0)
+        self.local_load_timer.timeout.connect(self.load_local_batch)
+        
+        # Změna v zobrazené složce panel sama obnoví (s odstupem, aby série změn vedla k jednomu načtení)
+        self.local_watcher = QFileSystemWatcher(self)
+        self.local_watcher.directoryChanged.connect(lambda path: self.local_refresh_timer.start())
+        self.local_refresh_timer = QTimer(self)
+        self.local_refresh_timer.setSingleShot(True)
+        self.local_refresh_timer.setInterval(LOCAL_REFRESH_DELAY_MS)
+        self.local_refresh_timer.timeout.connect(self.auto_refresh_local_files)
+        
         left_panel.setLayout(left_layout)
         splitter.addWidget(left_panel)
         
@@ -395,16 +4191,16 @@ class FORTEftp(QMainWindow):
         self.remote_path_input.returnPressed.connect(self.refresh_remote_files)
         remote_nav.addWidget(self.remote_path_input)
         self.remote_refresh_btn = QPushButton("🔄")
-        self.remote_refresh_btn.clicked.connect(self.refresh_remote_files)
+        self.remote_refresh_btn.clicked.connect(self.reload_remote_files)
         remote_nav.addWidget(self.remote_refresh_btn)
         right_layout.addLayout(remote_nav)
         
         # Seznam souborů
-        self.remote_tree = QTreeWidget()
-        self.remote_tree.setHeaderLabels(["Název", "Velikost", "Typ"])
-        self.remote_tree.setContextMenuPolicy(Qt.CustomContextMenu)
-        self.remote_tree.customContextMenuRequested.connect(self.remote_context_menu)
-        self.remote_tree.itemDoubleClicked.connect(self.remote_item_double_clicked)
+        self.remote_model = FileListModel(self)
+        self.remote_tree = self.create_file_view(
+            self.remote_model, self.remote_context_menu, self.remote_item_double_clicked
+        )
+        right_layout.addWidget(self.create_filter_input(self.remote_model))
         right_layout.addWidget(self.remote_tree)
         
         right_panel.setLayout(right_layout)
@@ -460,7 +4256,7 @@ class FORTEftp(QMainWindow):
         repo_layout.addWidget(self.git_repo_label)
         repo_layout.addStretch()
         self.git_detect_btn = QPushButton("🔍 Najít repo")
-        self.git_detect_btn.clicked.connect(self.refresh_git_repo)
+        self.git_detect_btn.clicked.connect(self.detect_git_repo)
         repo_layout.addWidget(self.git_detect_btn)
         layout.addLayout(repo_layout)
 
@@ -610,19 +4406,25 @@ class FORTEftp(QMainWindow):
         self.git_status_output.setReadOnly(True)
         self.git_outputs.addTab(self.git_status_output, "Status")
 
-        self.git_diff_output = QTextEdit()
-        self.git_diff_output.setReadOnly(True)
-        self.git_outputs.addTab(self.git_diff_output, "Diff")
+        # Diff: seznam souborů z --numstat, vpravo stránkovaný diff vybraného souboru
+        diff_splitter = QSplitter(Qt.Horizontal)
+        self.git_diff_files = QTreeWidget()
+        self.git_diff_files.setHeaderLabels(["Soubor", "+", "-"])
+        self.git_diff_files.setRootIsDecorated(False)
+        self.git_diff_files.itemClicked.connect(self.git_diff_file_selected)
+        diff_splitter.addWidget(self.git_diff_files)
+        self.git_diff_output = self.create_git_view(self.git_diff_scrolled)
+        diff_splitter.addWidget(self.git_diff_output)
+        diff_splitter.setSizes([250, 650])
+        self.git_outputs.addTab(diff_splitter, "Diff")
 
-        self.git_log_output = QTextEdit()
-        self.git_log_output.setReadOnly(True)
+        self.git_log_output = self.create_git_view(self.git_log_scrolled)
         self.git_outputs.addTab(self.git_log_output, "Log")
 
         layout.addWidget(self.git_outputs)
 
         widget.setLayout(layout)
         self.set_git_ui_enabled(False)
-        self.refresh_git_repo()
         return widget
     
     def load_environments(self):
@@ -694,6 +4496,98 @@ class FORTEftp(QMainWindow):
             self.save_environments()
             self.update_env_combo()
     
+    def tune_sftp(self):
+        """Změřit zkušební přenosy a uložit nejrychlejší nastavení SFTP do prostředí"""
+        if not self.sftp_client:
+            QMessageBox.warning(self, "FORTEftp", "Připojte se k SFTP (SSH) prostředí!")
+            return
+        
+        env = self.current_env
+        
+        def done(result):
+            progress.close()
+            env['sftp_tuning'] = result['tuning']
+            self.save_environments()
+            # Velikost požadavků platí hned, okno a paket u dalšího připojení
+            _sftp_tuning[self.sftp_client] = result['tuning']
+            
+            message = "Výsledky zkušebního přenosu:\n\n"
+            for tuning, upload_speed, download_speed in result['results']:
+                marker = "➡️" if tuning == result['tuning'] else "    "
+                message += (
+                    f"{marker} okno {self.format_size(tuning['window_size'])}, "
+                    f"požadavek {self.format_size(tuning['request_size'])}, "
+                    f"{tuning['max_requests']} souběžně: "
+                    f"⬆️ {self.format_size(upload_speed)}/s ⬇️ {self.format_size(download_speed)}/s\n"
+                )
+            message += f"\nNastavení bylo uloženo do prostředí '{env['name']}'."
+            QMessageBox.information(self, "Vyladění SFTP", message)
+        
+        task = self.engine.run(
+            self.run_sftp_tuning,
+            self.sftp_client,
+            self.current_remote_path,
+            on_success=done,
+            on_error=lambda message: (progress.close(), QMessageBox.critical(self, "Chyba", message)),
+            on_progress=lambda value, maximum, text: self.update_progress_dialog(progress, value, maximum, text),
+            on_cancel=lambda: progress.close()
+        )
+        progress = self.create_progress_dialog("Vyladění SFTP", "Měřím rychlost přenosu...", task)
+    
+    def run_sftp_tuning(self, task, sftp_client, remote_root):
+        """Nahrát a stáhnout zkušební soubor s každým kandidátním nastavením (běží na pozadí)"""
+        transport = sftp_client.get_channel().get_transport()
+        probe_path = f"{remote_root.rstrip('/')}/.forte_probe_{uuid.uuid4().hex[:8]}"
+        payload = os.urandom(SFTP_PROBE_SIZE)
+        results = []
+        
+        try:
+            for idx, candidate in enumerate(SFTP_TUNING_CANDIDATES):
+                task.check_cancelled()
+                task.report(idx, len(SFTP_TUNING_CANDIDATES), f"Zkouším nastavení {idx + 1}/{len(SFTP_TUNING_CANDIDATES)}...", force=True)
+                client = open_tuned_sftp(transport, candidate)
+                try:
+                    started = time.monotonic()
+                    remote_file, tuning = sftp_open(client, probe_path, 'wb')
+                    with remote_file:
+                        sftp_write_from(BytesIO(payload), remote_file, tuning, lambda done, total: task.check_cancelled())
+                    upload_time = time.monotonic() - started
+                    
+                    started = time.monotonic()
+                    received = BytesIO()
+                    remote_file, tuning = sftp_open(client, probe_path, 'rb')
+                    with remote_file:
+                        sftp_read_into(remote_file, received, tuning, 0, len(payload), lambda done, total: task.check_cancelled())
+                    download_time = time.monotonic() - started
+                    
+                    if received.getvalue() != payload:
+                        raise IOError("Stažená data nesouhlasí")
+                    results.append((upload_time + download_time, candidate, upload_time, download_time))
+                except OperationCancelled:
+                    raise
+                except Exception:
+                    # Server nastavení nepřijal - zkusit další
+                    continue
+                finally:
+                    client.close()
+        finally:
+            try:
+                sftp_client.remove(probe_path)
+            except Exception:
+                pass
+        
+        if not results:
+            raise RuntimeError("Žádné nastavení neprošlo zkušebním přenosem.")
+        
+        best = min(results, key=lambda result: result[0])
+        return {
+            'tuning': dict(best[1]),
+            'results': [
+                (candidate, len(payload) / max(upload_time, 1e-6), len(payload) / max(download_time, 1e-6))
+                for _, candidate, upload_time, download_time in results
+            ]
+        }
+    
     def toggle_connection(self):
         """Připojit/Odpojit"""
         if self.ftp_client or self.ssh_client:
@@ -713,95 +4607,113 @@ class FORTEftp(QMainWindow):
             return
         
         self.current_env = env
+        self.listing_cache.clear(env.get('listing_cache_ttl', DEFAULT_LISTING_CACHE_TTL))
+        self.connect_btn.setEnabled(False)
+        self.status_label.setText(f"⏳ Připojuji k {env['host']}...")
+        
+        self.engine.run(
+            self.open_connection,
+            env,
+            on_success=self.on_connected,
+            on_error=self.on_connect_failed,
+            on_cancel=lambda: self.connect_btn.setEnabled(True)
+        )
+    
+    def open_connection(self, task, env):
+        """Navázat spojení se serverem (běží na pozadí)"""
         conn_type = env['type']
+        remote_path = env.get('remote_path', '/')
         
-        try:
-            if conn_type in ["FTP", "FTPS"]:
-                # FTP připojení
-                if conn_type == "FTPS":
-                    self.ftp_client = FTP_TLS()
-                else:
-                    self.ftp_client = FTP()
-                
-                self.ftp_client.connect(env['host'], env['port'])
-                self.ftp_client.login(env['user'], env['password'])
-                
-                if conn_type == "FTPS":
-                    self.ftp_client.prot_p()
-                
-                self.current_remote_path = env.get('remote_path', '/')
-                self.ftp_client.cwd(self.current_remote_path)
-                
-                self.status_label.setText(f"✅ Připojeno k {env['host']} (FTP)")
-                self.connect_btn.setText("🔌 Odpojit")
-                self.upload_btn.setEnabled(True)
-                self.download_btn.setEnabled(True)
-                self.upload_changes_btn.setEnabled(True)
-                
-                self.refresh_remote_files()
-                
-            elif conn_type == "SFTP (SSH)":
-                # SSH připojení
-                success = self.ssh_terminal.connect(
-                    env['host'], 
-                    env['port'], 
-                    env['user'], 
-                    env['password']
-                )
-                
-                if success:
-                    # Pro SFTP také připojit SSH klienta pro přenos souborů
-                    self.ssh_client = paramiko.SSHClient()
-                    self.ssh_client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-                    self.ssh_client.connect(
-                        env['host'], 
-                        port=env['port'], 
-                        username=env['user'], 
-                        password=env['password']
-                    )
-                    self.sftp_client = self.ssh_client.open_sftp()
-                    
-                    self.current_remote_path = env.get('remote_path', '/')
-                    
-                    self.status_label.setText(f"✅ Připojeno k {env['host']} (SSH/SFTP)")
-                    self.connect_btn.setText("🔌 Odpojit")
-                    self.upload_btn.setEnabled(True)
-                    self.download_btn.setEnabled(True)
-                    self.upload_changes_btn.setEnabled(True)
-                    
-                    self.refresh_remote_files()
-                    self.tabs.setCurrentWidget(self.ssh_terminal)
+        if conn_type in ["FTP", "FTPS"]:
+            # FTP připojení (teplé z poolu, pokud je k dispozici)
+            ftp_client = self.connections.acquire(env)
+            try:
+                ftp_client.cwd(remote_path)
+            except Exception:
+                self.connections.release(ftp_client)
+                raise
+            
+            return {'env': env, 'ftp_client': ftp_client, 'remote_path': remote_path}
         
-        except Exception as e:
-            QMessageBox.critical(self, "Chyba připojení", f"Nepodařilo se připojit:\n{str(e)}")
-            self.disconnect()
+        if conn_type == "SFTP (SSH)":
+            # Jedno SSH spojení - terminál, SFTP i příkazy jsou jeho kanály
+            session = self.connections.acquire(env)
+            try:
+                task.check_cancelled()
+                channel = SSHTerminal.open_shell(session)
+            except Exception:
+                self.connections.release(session)
+                raise
+            
+            return {
+                'env': env,
+                'ssh_client': session,
+                'sftp_client': session.sftp_client,
+                'terminal': channel,
+                'remote_path': remote_path
+            }
+        
+        raise RuntimeError(f"Neznámý typ připojení: {conn_type}")
+    
+    def on_connected(self, session):
+        """Převzít navázané spojení do GUI"""
+        env = session['env']
+        self.connect_btn.setEnabled(True)
+        self.current_remote_path = session['remote_path']
+        self.remote_path_input.setText(self.current_remote_path)
+        
+        if 'ftp_client' in session:
+            self.ftp_client = session['ftp_client']
+            self.status_label.setText(f"✅ Připojeno k {env['host']} (FTP)")
+        else:
+            self.ssh_client = session['ssh_client']
+            self.sftp_client = session['sftp_client']
+            self.ssh_terminal.attach(self.ssh_client, session['terminal'], env['host'], env['port'])
+            self.status_label.setText(f"✅ Připojeno k {env['host']} (SSH/SFTP)")
+        
+        self.connect_btn.setText("🔌 Odpojit")
+        self.upload_btn.setEnabled(True)
+        self.download_btn.setEnabled(True)
+        self.upload_changes_btn.setEnabled(True)
+        
+        self.refresh_remote_files()
+        if self.ssh_client:
+            self.tabs.setCurrentWidget(self.ssh_terminal)
+    
+    def on_connect_failed(self, message):
+        """Chyba při navazování spojení"""
+        self.connect_btn.setEnabled(True)
+        QMessageBox.critical(self, "Chyba připojení", f"Nepodařilo se připojit:\n{message}")
+        self.disconnect()
     
     def disconnect(self):
         """Odpojit od serveru"""
-        if self.ftp_client:
-            try:
-                self.ftp_client.quit()
-            except:
-                pass
-            self.ftp_client = None
+        # Rozběhnuté operace starého spojení zrušit a jejich výsledky zahodit
+        self.engine.invalidate_session()
         
-        if self.ssh_client:
-            try:
-                self.sftp_client.close()
-                self.ssh_client.close()
-            except:
-                pass
-            self.ssh_client = None
-            self.sftp_client = None
+        ftp_client = self.ftp_client
+        ssh_client = self.ssh_client
+        self.ftp_client = None
+        self.ssh_client = None
+        self.sftp_client = None
         
         self.ssh_terminal.disconnect()
         
+        if ftp_client or ssh_client:
+            # Vrátit do poolu až po doběhnutí operace, která spojení právě používá
+            self.engine.run(self.release_connection, ftp_client or ssh_client)
+        
         self.status_label.setText("Odpojeno")
         self.connect_btn.setText("🔌 Připojit")
         self.upload_btn.setEnabled(False)
         self.upload_changes_btn.setEnabled(False)
         self.download_btn.setEnabled(False)
-        self.remote_tree.clear()
+        self.remote_model.reset()
+        self.listing_cache.clear()
+    
+    def release_connection(self, task, session):
+        """Vrátit spojení do poolu, zůstane teplé pro další připojení (běží na pozadí)"""
+        self.connections.release(session)
     
     def refresh_local_files(self):
         """Obnovit seznam lokálních souborů"""
@@ -810,35 +4722,105 @@ class FORTEftp(QMainWindow):
             return
         
         self.current_local_path = path
-        self.local_tree.clear()
+        
+        watched = self.local_watcher.directories()
+        if watched != [path]:
+            if watched:
+                self.local_watcher.removePaths(watched)
+            self.local_watcher.addPath(path)
 
         if hasattr(self, "git_repo_label"):
             self.git_repo_path_input.setText(self.current_local_path)
-            self.refresh_git_repo()
+            self.update_git_tab()
         
-        try:
-            # Přidat odkaz na nadřazenou složku
-            if path != "/":
-                parent_item = QTreeWidgetItem(self.local_tree)
-                parent_item.setText(0, "..")
-                parent_item.setText(2, "📁 Složka")
-                parent_item.setData(0, Qt.UserRole, str(Path(path).parent))
-            
-            # Načíst obsah složky
-            for item in sorted(Path(path).iterdir(), key=lambda x: (not x.is_dir(), x.name)):
-                tree_item = QTreeWidgetItem(self.local_tree)
-                tree_item.setText(0, item.name)
-                tree_item.setData(0, Qt.UserRole, str(item))
-                
-                if item.is_dir():
-                    tree_item.setText(2, "📁 Složka")
-                else:
-                    size = item.stat().st_size
-                    tree_item.setText(1, self.format_size(size))
-                    tree_item.setText(2, "📄 Soubor")
+        # Předchozí nedočtený výpis zahodit
+        self.local_load_timer.stop()
+        if self.local_scan:
+            self.local_scan.close()
+            self.local_scan = None
         
-        except Exception as e:
+        # Odkaz na nadřazenou složku
+        parent_path = str(Path(path).parent)
+        self.local_model.reset(parent_path if parent_path != path else None)
+        
+        try:
+            scanner = os.scandir(path)
+        except OSError as e:
             QMessageBox.warning(self, "Chyba", f"Nelze načíst složku:\n{str(e)}")
+            return
+        
+        self.local_scan = local_file_entries(scanner)
+        self.local_load_timer.start()
+    
+    def auto_refresh_local_files(self):
+        """Obnovit lokální panel po změně ve složce, ne během psaní nové cesty"""
+        if self.local_path_input.text() == self.current_local_path:
+            self.refresh_local_files()
+    
+    def local_directories(self, local_root, task):
+        """Lokální strom pro synchronizaci ve tvaru iter_local_directories (běží na pozadí)
+        
+        Se sledováním změn (Windows, Linux) se strom drží v LocalIndex a další
+        synchronizace téže složky načte jen změněné složky, jinak se prochází celý.
+        """
+        with self.local_index_lock:
+            index = self.local_index
+            if index is None or index.root != local_root:
+                if index is not None:
+                    index.close()
+                index = LocalIndex.create(local_root)
+                self.local_index = index
+        
+        if index is None or index.unavailable:
+            return iter_local_directories(local_root, task)
+        return index.directories(task)
+    
+    def collect_local_index_events(self):
+        """Vyzvednout události sledování, aby nepřetekla fronta jádra"""
+        index = self.local_index
+        if index is not None:
+            index.collect_events()
+    
+    def reconcile_local_index(self):
+        """Občas index celý ověřit procházením složek (na pozadí, bez Git zámku)"""
+        index = self.local_index
+        if index is None or self.local_index_task:
+            return
+        
+        def finished(*_):
+            self.local_index_task = None
+        
+        self.local_index_task = self.engine.start(
+            OperationThread(index.reconcile),
+            on_success=finished,
+            on_error=finished,
+            on_cancel=finished
+        )
+    
+    def load_local_batch(self):
+        """Přidat do modelu další dávku lokálních položek (jeden časový díl GUI vlákna)"""
+        if not self.local_scan:
+            self.local_load_timer.stop()
+            return
+        
+        deadline = time.monotonic() + FILE_LIST_SLICE
+        batch = []
+        finished = False
+        try:
+            for entry in self.local_scan:
+                batch.append(entry)
+                if len(batch) % FILE_LIST_BATCH == 0 and time.monotonic() >= deadline:
+                    break
+            else:
+                finished = True
+        except OSError:
+            finished = True
+        
+        self.local_model.append(batch)
+        if finished:
+            self.local_load_timer.stop()
+            self.local_scan = None
+            self.local_model.finish()
 
     def set_git_ui_enabled(self, enabled):
         """Povolit/zakázat Git ovládací prvky"""
@@ -858,56 +4840,29 @@ class FORTEftp(QMainWindow):
             btn.setEnabled(enabled)
 
     def resolve_git_repo_root(self, path):
-        """Najít Git repo root podle cesty"""
-        try:
-            result = subprocess.run(
-                ["git", "-C", path, "rev-parse", "--show-toplevel"],
-                capture_output=True,
-                text=True,
-                check=True
-            )
-            return result.stdout.strip()
-        except Exception:
-            return self.find_git_root_by_fs(path)
-
-    def find_git_root_by_fs(self, path):
-        """Najít Git repo root podle .git složky"""
-        try:
-            current = Path(path).resolve()
-        except Exception:
-            return None
-
-        while True:
-            if (current / ".git").is_dir():
-                return str(current)
-            if current.parent == current:
-                break
-            current = current.parent
-
-        return None
+        """Najít Git repo root podle cesty (z cache, bez spouštění gitu)"""
+        return self.git_repos.repo_root(path)
 
-    def run_git_command(self, args, repo_root=None):
-        """Spustit Git příkaz v repo rootu"""
+    def run_git_command(self, args, repo_root=None, strip=True):
+        """Spustit Git příkaz v repo rootu (strip=False - výstup beze změny, např. pro -z)"""
         root = repo_root or self.git_repo_root
         if not root:
             raise RuntimeError("Git repozitář nebyl nalezen.")
 
-        try:
-            result = subprocess.run(
-                ["git", "-C", root] + args,
-                capture_output=True,
-                text=True
-            )
-        except FileNotFoundError:
-            raise RuntimeError("Git není nainstalovaný nebo není v PATH.")
-
-        output = result.stdout.strip()
-        error = result.stderr.strip()
+        return run_git(root, args, strip)
 
-        if result.returncode != 0:
-            raise RuntimeError(error or output or "Neznámá Git chyba.")
+    def require_git_backend(self):
+        """Git backend aktuálního repa (volá se uvnitř úlohy, chyba jde do on_error)"""
+        backend = self.git_backend
+        if backend is None:
+            raise RuntimeError("Git repozitář nebyl nalezen.")
+        return backend
 
-        return output
+    def run_git_task(self, func, *args, on_success=None, on_error=None):
+        """Spustit Git operaci func(task, *args) na pozadí"""
+        if on_error is None:
+            on_error = lambda message: QMessageBox.warning(self, "Git", message)
+        return self.engine.run(func, *args, on_success=on_success, on_error=on_error, session=False)
 
     def git_quick_command(self, args, description, requires_confirm=False, confirm_text=None):
         """Spustit rychlý Git příkaz s volitelným potvrzením"""
@@ -921,52 +4876,144 @@ class FORTEftp(QMainWindow):
             if reply != QMessageBox.Yes:
                 return
 
+        self.git_command_with_status(args, done_text=f"Hotovo: {' '.join(['git'] + args)}")
+
+    def git_changes_since(self, local_root, commit):
+        """Soubory pod local_root změněné od commitu včetně necommitnutých a nesledovaných
+
+        Vrací (změněné, smazané) - dict relativní cesta -> důvod a set relativních cest.
+        Soubory ignorované přes .gitignore se nezahrnou.
+        """
+        # Porovnání commitu s pracovní složkou zahrne commity i necommitnuté úpravy
+        output, untracked = run_git_batch(local_root, [
+            ["diff", "--name-status", "-z", "--no-renames", "--relative", commit, "--"],
+            ["ls-files", "--others", "--exclude-standard", "-z"]
+        ], strip=False)
+        changed = {}
+        deleted = set()
+        fields = output.split('\0')
+        for status, rel_path in zip(fields[0::2], fields[1::2]):
+            if status.startswith('D'):
+                deleted.add(rel_path)
+            elif status:
+                changed[rel_path] = "Nový soubor" if status.startswith('A') else "Změněný soubor"
+
+        for rel_path in untracked.split('\0'):
+            if rel_path:
+                changed[rel_path] = "Nesledovaný soubor"
+        return changed, deleted
+
+    def git_deploy_state(self, local_root):
+        """Aktuální commit a necommitnuté cesty pod local_root, mimo Git repo None"""
+        # Mimo repozitář git vůbec nespouštět - stačí hledání .git v cache
+        if not self.git_repos.repo_root(local_root):
+            return None
         try:
-            output = self.run_git_command(args)
-            if not output:
-                output = f"Hotovo: {' '.join(['git'] + args)}"
-            self.git_status_output.setPlainText(output)
-            self.refresh_git_status()
-        except Exception as e:
-            QMessageBox.warning(self, "Git", str(e))
+            head = self.run_git_command(["rev-parse", "HEAD"], local_root)
+            changed, deleted = self.git_changes_since(local_root, "HEAD")
+        except Exception:
+            return None
+        return head, set(changed) | deleted
 
     def is_git_available(self):
         """Ověřit dostupnost git v PATH"""
-        try:
-            subprocess.run(
-                ["git", "--version"],
-                capture_output=True,
-                text=True,
-                check=True
-            )
-            return True
-        except Exception:
-            return False
+        return git_available()
+
+    def on_tab_changed(self, index):
+        """Při zobrazení Git záložky dohnat odložené obnovení"""
+        if self.tabs.widget(index) is self.git_tab:
+            self.update_git_tab()
+
+    def update_git_tab(self):
+        """Obnovit Git záložku, jen pokud je vidět a repo nebo jeho stav se změnil"""
+        if self.tabs.currentWidget() is not self.git_tab:
+            self.git_refresh_pending = True
+            return
+
+        search_path = self.git_repo_path_input.text().strip() or self.current_local_path
+        root = self.resolve_git_repo_root(search_path)
+        if not self.git_refresh_pending and root == self.git_repo_root:
+            if root is None or self.git_repos.state(root) == self.git_repo_stamp:
+                return
+        self.refresh_git_repo()
+
+    def detect_git_repo(self):
+        """Znovu vyhledat repo (např. po git init) a načíst jeho stav"""
+        self.git_repos.invalidate()
+        self.refresh_git_repo()
 
     def refresh_git_repo(self):
         """Načíst Git repo dle zvolené složky"""
         search_path = self.git_repo_path_input.text().strip() or self.current_local_path
+
+        # Předchozí hledání, které ještě nezačalo, je zbytečné
+        if getattr(self, "git_repo_task", None):
+            self.git_repo_task.cancel()
+        self.git_refresh_pending = False
+
+        self.git_repo_task = self.run_git_task(
+            self.load_git_repo_info,
+            search_path,
+            on_success=self.show_git_repo_info
+        )
+
+    def load_git_repo_info(self, task, search_path):
+        """Zjistit repo, status a branche (běží na pozadí)"""
         repo_root = self.resolve_git_repo_root(search_path)
+        info = {
+            'repo_root': repo_root,
+            # Otisk před dotazy - změna během nich vyvolá další obnovení
+            'stamp': self.git_repos.state(repo_root) if repo_root else None,
+            'git_available': False,
+            'backend': None,
+            'state': None,
+            'error': None
+        }
+
+        if repo_root and self.is_git_available():
+            info['git_available'] = True
+            backend = self.git_backend
+            if backend is None or backend.root != repo_root:
+                backend = GitBackend(repo_root)
+            info['backend'] = backend
+            try:
+                info['state'] = backend.query_state()
+            except Exception as e:
+                info['error'] = str(e)
+
+        return info
+
+    def show_git_repo_info(self, info):
+        """Promítnout načtené informace o repu do Git záložky"""
+        repo_root = info['repo_root']
         self.git_repo_root = repo_root
+        self.git_repo_stamp = info['stamp']
+
+        # Backend předchozího repa ukončit (cat-file proces)
+        if self.git_backend is not None and self.git_backend is not info['backend']:
+            self.git_backend.close()
+        self.git_backend = info['backend']
+        self.git_state = None
 
         if repo_root:
             self.git_repo_label.setText(repo_root)
-            if self.is_git_available():
+            if info['git_available']:
                 self.set_git_ui_enabled(True)
-                self.refresh_git_status()
-                self.git_load_branches()
+                if info['error']:
+                    self.git_branch_combo.clear()
+                    self.git_status_output.setPlainText(info['error'])
+                else:
+                    self.show_git_state(info['state'])
             else:
                 self.set_git_ui_enabled(False)
                 self.git_status_output.setPlainText("Git nebyl nalezen v PATH. Nainstalujte Git a restartujte aplikaci.")
-                self.git_diff_output.clear()
-                self.git_log_output.clear()
+                self.clear_git_views()
                 self.git_branch_combo.clear()
         else:
             self.git_repo_label.setText("(nenalezeno)")
             self.set_git_ui_enabled(False)
             self.git_status_output.setPlainText("Git repo nebyl nalezen v aktuální složce.")
-            self.git_diff_output.clear()
-            self.git_log_output.clear()
+            self.clear_git_views()
             self.git_branch_combo.clear()
 
     def select_git_folder(self):
@@ -981,40 +5028,52 @@ class FORTEftp(QMainWindow):
             self.git_repo_path_input.setText(selected)
             self.refresh_git_repo()
 
+    def show_git_state(self, state):
+        """Vykreslit status a větve z GitRepoState"""
+        self.git_state = state
+        self.git_status_output.setPlainText(state.format_status())
+        self.set_git_branches(state)
+
     def refresh_git_status(self):
         """Načíst git status"""
-        try:
-            output = self.run_git_command(["status", "-sb"]) or "Čistý stav."
-            self.git_status_output.setPlainText(output)
-        except Exception as e:
-            self.git_status_output.setPlainText(str(e))
+        self.run_git_task(
+            lambda task: self.require_git_backend().query_state(),
+            on_success=self.show_git_state,
+            on_error=self.git_status_output.setPlainText
+        )
+
+    def git_command_with_status(self, *commands, done_text, on_done=None):
+        """Spustit Git příkazy a v téže úloze načíst nový stav repa
+
+        Zobrazí se výstup posledního příkazu (nebo done_text) spolu se statusem.
+        """
+        def work(task):
+            backend = self.require_git_backend()
+            output = None
+            for args in commands:
+                output = backend.run(args)
+            return output or done_text, backend.query_state()
+
+        def done(result):
+            output, state = result
+            self.show_git_state(state)
+            self.git_status_output.setPlainText(f"{output}\n\n{state.format_status()}")
+            if on_done:
+                on_done()
+
+        self.run_git_task(work, on_success=done)
 
     def git_fetch(self):
         """Fetch vzdálených změn"""
-        try:
-            output = self.run_git_command(["fetch", "--all"]) or "Fetch dokončen."
-            status = self.run_git_command(["status", "-sb"]) or "Čistý stav."
-            self.git_status_output.setPlainText(f"{output}\n\n{status}")
-        except Exception as e:
-            QMessageBox.warning(self, "Git", str(e))
+        self.git_command_with_status(["fetch", "--all"], done_text="Fetch dokončen.")
 
     def git_pull(self):
         """Pull změn"""
-        try:
-            output = self.run_git_command(["pull"]) or "Pull dokončen."
-            status = self.run_git_command(["status", "-sb"]) or "Čistý stav."
-            self.git_status_output.setPlainText(f"{output}\n\n{status}")
-        except Exception as e:
-            QMessageBox.warning(self, "Git", str(e))
+        self.git_command_with_status(["pull"], done_text="Pull dokončen.")
 
     def git_push(self):
         """Push změn"""
-        try:
-            output = self.run_git_command(["push"]) or "Push dokončen."
-            status = self.run_git_command(["status", "-sb"]) or "Čistý stav."
-            self.git_status_output.setPlainText(f"{output}\n\n{status}")
-        except Exception as e:
-            QMessageBox.warning(self, "Git", str(e))
+        self.git_command_with_status(["push"], done_text="Push dokončen.")
 
     def git_commit(self):
         """Commit změn (git add -A + commit)"""
@@ -1023,14 +5082,12 @@ class FORTEftp(QMainWindow):
             QMessageBox.warning(self, "Git", "Zadejte commit message.")
             return
 
-        try:
-            self.run_git_command(["add", "-A"])
-            output = self.run_git_command(["commit", "-m", message])
-            self.git_commit_message.clear()
-            self.git_status_output.setPlainText(output)
-            self.refresh_git_status()
-        except Exception as e:
-            QMessageBox.warning(self, "Git", str(e))
+        self.git_command_with_status(
+            ["add", "-A"],
+            ["commit", "-m", message],
+            done_text="Commit dokončen.",
+            on_done=self.git_commit_message.clear
+        )
 
     def git_create_branch(self):
         """Vytvořit novou branch"""
@@ -1039,36 +5096,16 @@ class FORTEftp(QMainWindow):
             QMessageBox.warning(self, "Git", "Zadejte název nové branche.")
             return
 
-        try:
-            output = self.run_git_command(["checkout", "-b", branch_name])
-            self.git_new_branch_input.clear()
-            self.git_status_output.setPlainText(output)
-            self.git_load_branches()
-            self.refresh_git_status()
-        except Exception as e:
-            QMessageBox.warning(self, "Git", str(e))
-
-    def git_load_branches(self):
-        """Načíst seznam branchí"""
-        try:
-            output = self.run_git_command(["branch", "--list"])
-        except Exception as e:
-            self.git_branch_combo.clear()
-            self.git_status_output.setPlainText(str(e))
-            return
+        self.git_command_with_status(
+            ["checkout", "-b", branch_name],
+            done_text=f"Vytvořena branch {branch_name}.",
+            on_done=self.git_new_branch_input.clear
+        )
 
-        branches = []
-        current_branch = None
-        for line in output.splitlines():
-            line = line.strip()
-            if not line:
-                continue
-            if line.startswith("*"):
-                branch = line[1:].strip()
-                current_branch = branch
-            else:
-                branch = line
-            branches.append(branch)
+    def set_git_branches(self, state):
+        """Naplnit výběr branchí z GitRepoState"""
+        branches = [name for name, _, _ in state.branches]
+        current_branch = state.head
 
         self.git_branch_combo.blockSignals(True)
         self.git_branch_combo.clear()
@@ -1086,129 +5123,336 @@ class FORTEftp(QMainWindow):
             QMessageBox.warning(self, "Git", "Vyberte branch.")
             return
 
-        try:
-            output = self.run_git_command(["checkout", branch])
-            self.git_status_output.setPlainText(output)
-            self.refresh_git_status()
-        except Exception as e:
-            QMessageBox.warning(self, "Git", str(e))
+        self.git_command_with_status(["checkout", branch], done_text=f"Přepnuto na {branch}.")
+
+    def create_git_view(self, scrolled):
+        """Výstup Gitu s omezeným počtem řádků, scrolled(value) při posunu"""
+        view = QPlainTextEdit()
+        view.setReadOnly(True)
+        view.setLineWrapMode(QPlainTextEdit.NoWrap)
+        view.setMaximumBlockCount(GIT_VIEW_MAX_LINES)
+        view.setFont(QFont("Consolas", 9))
+        view.verticalScrollBar().valueChanged.connect(scrolled)
+        return view
+
+    @staticmethod
+    def near_view_end(view):
+        """Je posuvník u konce okna (čas načíst další stránku)?"""
+        scrollbar = view.verticalScrollBar()
+        return scrollbar.value() >= scrollbar.maximum() - scrollbar.pageStep()
+
+    @staticmethod
+    def append_git_lines(view, lines):
+        """Přidat řádky na konec okna bez posunu pohledu"""
+        scrollbar = view.verticalScrollBar()
+        position = scrollbar.value()
+        view.appendPlainText("\n".join(lines))
+        scrollbar.setValue(position)
+
+    def clear_git_views(self):
+        """Zrušit načítání a vyprázdnit diff a log"""
+        for task in (getattr(self, "git_diff_task", None), getattr(self, "git_log_task", None)):
+            if task:
+                task.cancel()
+        self.git_diff_task = None
+        self.git_diff_gate = None
+        self.git_log_task = None
+        self.git_log_next = None
+        self.git_diff_files.clear()
+        self.git_diff_output.clear()
+        self.git_log_output.clear()
 
     def git_show_log(self):
-        """Zobrazit git log"""
-        try:
-            output = self.run_git_command(["log", "--oneline", "-n", "50"])
-            self.git_log_output.setPlainText(output or "Bez záznamu.")
-            self.git_outputs.setCurrentWidget(self.git_log_output)
-        except Exception as e:
-            self.git_log_output.setPlainText(str(e))
+        """Zobrazit první stránku git logu, další stránky se načtou při posunu"""
+        if getattr(self, "git_log_task", None):
+            self.git_log_task.cancel()
+        self.git_log_output.clear()
+        # Stránky se počítají od commitu zobrazeného při otevření, nové commity je neposunou
+        self.git_log_rev = self.git_state.oid if self.git_state and self.git_state.oid else "HEAD"
+        self.git_log_next = 0
+        self.git_outputs.setCurrentWidget(self.git_log_output)
+        self.load_git_log_page()
+
+    def load_git_log_page(self):
+        """Načíst další stránku logu (--skip)"""
+        skip = self.git_log_next
+        self.git_log_next = None
+        rev = self.git_log_rev
+
+        thread = None
+
+        def work(task):
+            output = self.require_git_backend().run(
+                ["log", "--oneline", f"--skip={skip}", "-n", str(GIT_LOG_PAGE), rev, "--"],
+                strip=False
+            )
+            return output.splitlines()
+
+        def done(lines):
+            # Výsledek zrušeného načítání (nový log, jiné repo) se zahodí
+            if self.git_log_task is not thread:
+                return
+            self.git_log_task = None
+            if lines:
+                self.append_git_lines(self.git_log_output, lines)
+            elif not skip:
+                self.git_log_output.setPlainText("Bez záznamu.")
+            # Neúplná stránka znamená konec historie
+            if len(lines) == GIT_LOG_PAGE:
+                self.git_log_next = skip + len(lines)
+                if self.near_view_end(self.git_log_output):
+                    self.load_git_log_page()
+
+        def failed(message):
+            if self.git_log_task is thread:
+                self.git_log_task = None
+                self.git_log_output.appendPlainText(message)
+
+        thread = self.run_git_task(work, on_success=done, on_error=failed)
+        self.git_log_task = thread
+
+    def git_log_scrolled(self, value):
+        """Při posunu ke konci logu načíst další stránku"""
+        if self.git_log_next is not None and self.near_view_end(self.git_log_output):
+            self.load_git_log_page()
 
     def git_show_diff(self):
-        """Zobrazit git diff"""
-        try:
-            output = self.run_git_command(["diff"])
-            self.git_diff_output.setPlainText(output or "Žádné rozdíly.")
-            self.git_outputs.setCurrentWidget(self.git_diff_output)
-        except Exception as e:
-            self.git_diff_output.setPlainText(str(e))
+        """Zobrazit souhrn změněných souborů (--numstat) a začít streamovat celý diff"""
+        def done(files):
+            self.git_diff_files.clear()
+            total_added = sum(added or 0 for _, added, _ in files)
+            total_deleted = sum(deleted or 0 for _, _, deleted in files)
+            item = QTreeWidgetItem([f"(všechny soubory: {len(files)})", str(total_added), str(total_deleted)])
+            self.git_diff_files.addTopLevelItem(item)
+            for path, added, deleted in files:
+                child = QTreeWidgetItem([
+                    path,
+                    "bin" if added is None else str(added),
+                    "bin" if deleted is None else str(deleted)
+                ])
+                child.setData(0, Qt.UserRole, path)
+                self.git_diff_files.addTopLevelItem(child)
+            self.git_diff_files.resizeColumnToContents(1)
+            self.git_diff_files.resizeColumnToContents(2)
+            self.git_diff_files.setCurrentItem(item)
+            self.git_outputs.setCurrentWidget(self.git_diff_output.parentWidget())
+            if files:
+                self.stream_git_diff(None)
+            else:
+                self.git_diff_output.setPlainText("Žádné rozdíly.")
+
+        self.run_git_task(
+            lambda task: parse_git_numstat(self.require_git_backend().run(["diff", "--numstat", "-z"], strip=False)),
+            on_success=done,
+            on_error=self.git_diff_output.setPlainText
+        )
+
+    def git_diff_file_selected(self, item, column):
+        """Zobrazit diff jen vybraného souboru"""
+        self.stream_git_diff(item.data(0, Qt.UserRole))
+
+    def stream_git_diff(self, path):
+        """Streamovat diff (celý nebo jednoho souboru) po stránkách do okna"""
+        if getattr(self, "git_diff_task", None):
+            self.git_diff_task.cancel()
+        self.git_diff_output.clear()
+
+        args = ["diff"] + (["--", path] if path else [])
+        gate = StreamGate(GIT_VIEW_PAGE_LINES)
+        self.git_diff_gate = gate
+
+        def work(task):
+            return stream_git_lines(task, self.require_git_backend().root, args, gate)
+
+        # Dávky a výsledek zrušeného streamu (jiný soubor, jiné repo) se zahodí
+        def partial(lines):
+            if self.git_diff_gate is gate:
+                self.append_git_lines(self.git_diff_output, lines)
+
+        def done(count):
+            if self.git_diff_gate is gate:
+                self.git_diff_task = None
+                self.git_diff_gate = None
+                if not count:
+                    self.git_diff_output.setPlainText("Žádné rozdíly.")
+
+        def failed(message):
+            if self.git_diff_gate is gate:
+                self.git_diff_task = None
+                self.git_diff_gate = None
+                self.git_diff_output.appendPlainText(message)
+
+        # Stream čeká na posun okna - nesmí přitom držet Git zámek ostatních operací
+        self.git_diff_task = self.engine.start(
+            OperationThread(work), on_success=done, on_error=failed, on_partial=partial
+        )
+
+    def git_diff_scrolled(self, value):
+        """Při posunu ke konci diffu povolit čtení další stránky"""
+        if self.git_diff_gate is not None and self.near_view_end(self.git_diff_output):
+            self.git_diff_gate.request(GIT_VIEW_PAGE_LINES)
     
-    def refresh_remote_files(self):
-        """Obnovit seznam vzdálených souborů"""
+    def reload_remote_files(self):
+        """Ručně obnovit seznam vzdálených souborů - vždy načíst ze serveru"""
+        self.refresh_remote_files(cached=False)
+    
+    def refresh_remote_files(self, cached=True):
+        """Obnovit seznam vzdálených souborů (cached=True - z cache výpisů, pokud je platný)"""
         if not self.ftp_client and not self.sftp_client:
             return
         
         path = self.remote_path_input.text()
         self.current_remote_path = path
-        self.remote_tree.clear()
         
+        # Starší nedokončený výpis ani přednačítání už nejsou potřeba
+        if self.remote_refresh_task:
+            self.remote_refresh_task.cancel()
+            self.remote_refresh_task = None
+        self.cancel_prefetch()
+        
+        # Odkaz na nadřazenou složku
+        parent_path = None
+        if path != "/":
+            parent_path = "/".join(path.rstrip("/").split("/")[:-1]) or "/"
+        self.remote_model.reset(parent_path)
+        
+        # Dávky zrušeného výpisu mohou ještě čekat ve frontě událostí
+        self.remote_listing += 1
+        listing = self.remote_listing
+        
+        entries = self.listing_cache.get(path) if cached else None
+        if entries is not None:
+            base = path.rstrip('/')
+            self.remote_model.append([
+                FileEntry(name, f"{base}/{name}", is_dir, size) for name, is_dir, size, mtime in entries
+            ])
+            self.remote_model.finish()
+            self.start_prefetch()
+            return
+        
+        self.remote_refresh_task = self.engine.run(
+            self.list_remote_directory,
+            path,
+            self.ftp_client,
+            self.sftp_client,
+            on_partial=lambda entries, n=listing: n == self.remote_listing and self.remote_model.append(entries),
+            on_success=lambda _, n=listing: self.remote_listing_loaded(n),
+            on_error=lambda message: QMessageBox.warning(
+                self, "Chyba", f"Nelze načíst vzdálenou složku:\n{message}"
+            )
+        )
+    
+    def remote_listing_loaded(self, listing):
+        """Výpis vzdálené složky je celý - seřadit a začít přednačítat podsložky"""
+        if listing != self.remote_listing:
+            return
+        self.remote_model.finish()
+        self.start_prefetch()
+    
+    def start_prefetch(self):
+        """Na pozadí načíst podsložky zobrazené vzdálené složky do cache výpisů"""
+        env = self.current_env
+        if not env or not env.get('prefetch_listings') or self.listing_cache.ttl <= 0:
+            return
+        
+        subdirs = [entry.path for entry in self.remote_model.entries if entry.is_dir]
+        if not subdirs:
+            return
+        
+        # Bez session_lock - používá vlastní spojení z poolu a nesmí zdržovat navigaci
+        thread = OperationThread(self.prefetch_listings, env, subdirs)
+        self.prefetch_task = self.engine.start(thread, session=True)
+    
+    def cancel_prefetch(self):
+        """Zastavit přednačítání (uživatel odešel jinam)"""
+        if self.prefetch_task:
+            self.prefetch_task.cancel()
+            self.prefetch_task = None
+    
+    def prefetch_listings(self, task, env, subdirs):
+        """Načíst výpisy podsložek předem přes další spojení z poolu (běží na pozadí)
+        
+        Prochází do šířky do hloubky PREFETCH_MAX_DEPTH, skončí po PREFETCH_MAX_DIRS
+        složkách nebo PREFETCH_MAX_ENTRIES položkách a přenos omezuje na
+        PREFETCH_BANDWIDTH. Složky, které už v cache jsou, se nenačítají znovu.
+        """
+        pending = collections.deque((path, 1) for path in subdirs)
+        listed = 0
+        total = 0
+        
+        session = self.connections.acquire(env)
         try:
-            if self.ftp_client:
-                # FTP
-                self.ftp_client.cwd(path)
+            while pending and listed < PREFETCH_MAX_DIRS and total < PREFETCH_MAX_ENTRIES:
+                task.check_cancelled()
+                path, depth = pending.popleft()
                 
-                # Přidat odkaz na nadřazenou složku
-                if path != "/":
-                    parent_item = QTreeWidgetItem(self.remote_tree)
-                    parent_item.setText(0, "..")
-                    parent_item.setText(2, "📁 Složka")
-                    parent_path = "/".join(path.rstrip("/").split("/")[:-1])
-                    if not parent_path:
-                        parent_path = "/"
-                    parent_item.setData(0, Qt.UserRole, parent_path)
-                
-                # Načíst obsah
-                files = []
-                self.ftp_client.dir(files.append)
-                
-                for file_info in files:
-                    parts = file_info.split()
-                    if len(parts) < 9:
-                        continue
-                    
-                    name = " ".join(parts[8:])
-                    if name in ['.', '..']:
+                entries = self.listing_cache.get(path)
+                if entries is None:
+                    started = time.monotonic()
+                    try:
+                        if env['type'] in ["FTP", "FTPS"]:
+                            entries = list_ftp_directory(session, path)
+                        else:
+                            entries = list_sftp_directory(session.sftp_client, path)
+                    except Exception:
+                        # Nečitelná složka - přeskočit
                         continue
+                    self.listing_cache.put(path, entries)
+                    listed += 1
+                    total += len(entries)
                     
-                    tree_item = QTreeWidgetItem(self.remote_tree)
-                    tree_item.setText(0, name)
-                    tree_item.setData(0, Qt.UserRole, f"{path.rstrip('/')}/{name}")
-                    
-                    if file_info.startswith('d'):
-                        tree_item.setText(2, "📁 Složka")
-                    else:
-                        try:
-                            size = int(parts[4])
-                            tree_item.setText(1, self.format_size(size))
-                        except:
-                            pass
-                        tree_item.setText(2, "📄 Soubor")
-            
-            elif self.sftp_client:
-                # SFTP
-                # Přidat odkaz na nadřazenou složku
-                if path != "/":
-                    parent_item = QTreeWidgetItem(self.remote_tree)
-                    parent_item.setText(0, "..")
-                    parent_item.setText(2, "📁 Složka")
-                    parent_path = "/".join(path.rstrip("/").split("/")[:-1])
-                    if not parent_path:
-                        parent_path = "/"
-                    parent_item.setData(0, Qt.UserRole, parent_path)
+                    # Omezení přenosu podle odhadované velikosti výpisu
+                    cost = len(entries) * PREFETCH_ENTRY_BYTES / PREFETCH_BANDWIDTH
+                    task.pause(cost - (time.monotonic() - started))
                 
-                # Načíst obsah
-                for item in self.sftp_client.listdir_attr(path):
-                    tree_item = QTreeWidgetItem(self.remote_tree)
-                    tree_item.setText(0, item.filename)
-                    tree_item.setData(0, Qt.UserRole, f"{path.rstrip('/')}/{item.filename}")
-                    
-                    if stat.S_ISDIR(item.st_mode):
-                        tree_item.setText(2, "📁 Složka")
-                    else:
-                        tree_item.setText(1, self.format_size(item.st_size))
-                        tree_item.setText(2, "📄 Soubor")
-        
-        except Exception as e:
-            QMessageBox.warning(self, "Chyba", f"Nelze načíst vzdálenou složku:\n{str(e)}")
+                if depth < PREFETCH_MAX_DEPTH:
+                    base = path.rstrip('/')
+                    pending.extend((f"{base}/{name}", depth + 1) for name, is_dir, size, mtime in entries if is_dir)
+        finally:
+            self.connections.release(session)
+    
+    def list_remote_directory(self, task, path, ftp_client=None, sftp_client=None):
+        """Načíst obsah vzdálené složky (běží na pozadí), položky posílá po dávkách"""
+        if ftp_client:
+            # FTP - cwd kvůli relativním příkazům a ověření existence složky
+            ftp_client.cwd(path)
+            listing = list_ftp_directory(ftp_client, path)
+        elif sftp_client:
+            # SFTP vrací výpis po částech, první položky se zobrazí hned
+            listing = iter_sftp_directory(sftp_client, path)
+        else:
+            listing = []
+        
+        base = path.rstrip('/')
+        entries = []
+        batch = []
+        for name, is_dir, size, mtime in listing:
+            entries.append((name, is_dir, size, mtime))
+            batch.append(FileEntry(name, f"{base}/{name}", is_dir, size))
+            if len(batch) >= FILE_LIST_BATCH:
+                task.check_cancelled()
+                task.emit_partial(batch)
+                batch = []
+        if batch:
+            task.emit_partial(batch)
+        self.listing_cache.put(path, entries)
     
     def format_size(self, size):
         """Formátovat velikost souboru"""
-        for unit in ['B', 'KB', 'MB', 'GB']:
-            if size < 1024.0:
-                return f"{size:.1f} {unit}"
-            size /= 1024.0
-        return f"{size:.1f} TB"
+        return format_size(size)
     
-    def local_item_double_clicked(self, item, column):
+    def local_item_double_clicked(self, index):
         """Dvoj-klik na lokální položku"""
-        path = item.data(0, Qt.UserRole)
-        if os.path.isdir(path):
-            self.local_path_input.setText(path)
+        entry = self.local_model.entry(index)
+        if entry and entry.is_dir:
+            self.local_path_input.setText(entry.path)
             self.refresh_local_files()
     
-    def remote_item_double_clicked(self, item, column):
+    def remote_item_double_clicked(self, index):
         """Dvoj-klik na vzdálenou položku"""
-        path = item.data(0, Qt.UserRole)
-        if item.text(2) == "📁 Složka":
-            self.remote_path_input.setText(path)
+        entry = self.remote_model.entry(index)
+        if entry and entry.is_dir:
+            self.remote_path_input.setText(entry.path)
             self.refresh_remote_files()
     
     def local_context_menu(self, position):
@@ -1246,7 +5490,7 @@ class FORTEftp(QMainWindow):
         elif action == delete_action:
             self.delete_remote_item()
         elif action == refresh_action:
-            self.refresh_remote_files()
+            self.reload_remote_files()
     
     def create_local_folder(self):
         """Vytvořit lokální složku"""
@@ -1263,23 +5507,34 @@ class FORTEftp(QMainWindow):
         """Vytvořit vzdálenou složku"""
         name, ok = QInputDialog.getText(self, "Nová složka", "Název složky:")
         if ok and name:
-            try:
-                if self.ftp_client:
-                    self.ftp_client.mkd(name)
-                elif self.sftp_client:
-                    new_path = f"{self.current_remote_path.rstrip('/')}/{name}"
-                    self.sftp_client.mkdir(new_path)
-                self.refresh_remote_files()
-            except Exception as e:
-                QMessageBox.critical(self, "Chyba", f"Nelze vytvořit složku:\n{str(e)}")
+            new_path = f"{self.current_remote_path.rstrip('/')}/{name}"
+            self.engine.run(
+                self.make_remote_directory,
+                new_path,
+                self.ftp_client,
+                self.sftp_client,
+                on_success=lambda _: self.refresh_remote_files(),
+                on_error=lambda message: QMessageBox.critical(
+                    self, "Chyba", f"Nelze vytvořit složku:\n{message}"
+                )
+            )
+    
+    def make_remote_directory(self, task, path, ftp_client=None, sftp_client=None):
+        """Vytvořit vzdálenou složku (běží na pozadí)"""
+        if ftp_client:
+            ftp_client.mkd(path)
+        elif sftp_client:
+            sftp_client.mkdir(path)
+        self.listing_cache.add(path, True)
+        self.listing_cache.put(path, [])
     
     def delete_local_item(self):
         """Smazat lokální položku"""
-        item = self.local_tree.currentItem()
-        if not item or item.text(0) == "..":
+        entry = self.local_model.entry(self.local_tree.currentIndex())
+        if not entry or entry is self.local_model.parent_entry:
             return
         
-        path = item.data(0, Qt.UserRole)
+        path = entry.path
         reply = QMessageBox.question(
             self,
             "Potvrzení",
@@ -1300,82 +5555,141 @@ class FORTEftp(QMainWindow):
     
     def delete_remote_item(self):
         """Smazat vzdálenou položku"""
-        item = self.remote_tree.currentItem()
-        if not item or item.text(0) == "..":
+        entry = self.remote_model.entry(self.remote_tree.currentIndex())
+        if not entry or entry is self.remote_model.parent_entry:
             return
         
-        name = item.text(0)
+        name = entry.name
         reply = QMessageBox.question(
             self,
             "Potvrzení",
             f"Opravdu chcete smazat '{name}'?",
             QMessageBox.Yes | QMessageBox.No
         )
-        
-        if reply == QMessageBox.Yes:
-            try:
-                if self.ftp_client:
-                    if item.text(2) == "📁 Složka":
-                        self.ftp_client.rmd(name)
-                    else:
-                        self.ftp_client.delete(name)
-                elif self.sftp_client:
-                    path = item.data(0, Qt.UserRole)
-                    if item.text(2) == "📁 Složka":
-                        self.sftp_client.rmdir(path)
-                    else:
-                        self.sftp_client.remove(path)
-                self.refresh_remote_files()
-            except Exception as e:
-                QMessageBox.critical(self, "Chyba", f"Nelze smazat:\n{str(e)}")
+        
+        if reply == QMessageBox.Yes:
+            self.engine.run(
+                self.delete_remote_path,
+                entry.path,
+                entry.is_dir,
+                self.ftp_client,
+                self.sftp_client,
+                on_success=lambda _: self.refresh_remote_files(),
+                on_error=lambda message: QMessageBox.critical(
+                    self, "Chyba", f"Nelze smazat:\n{message}"
+                )
+            )
+    
+    def delete_remote_path(self, task, path, is_dir, ftp_client=None, sftp_client=None):
+        """Smazat vzdálený soubor nebo prázdnou složku (běží na pozadí)"""
+        if ftp_client:
+            if is_dir:
+                ftp_client.rmd(path)
+            else:
+                ftp_client.delete(path)
+        elif sftp_client:
+            if is_dir:
+                sftp_client.rmdir(path)
+            else:
+                sftp_client.remove(path)
+        self.listing_cache.remove(path)
+    
+    def start_transfer(self, thread, title, on_success):
+        """Spustit přenos jednoho souboru s průběhem"""
+        progress = self.create_progress_dialog(title, title, thread)
+        
+        def finish(result):
+            progress.close()
+            on_success(result)
+        
+        def fail(message):
+            progress.close()
+            QMessageBox.critical(self, "Chyba", f"{title} selhalo:\n{message}")
+        
+        self.engine.start(
+            thread,
+            on_success=finish,
+            on_error=fail,
+            on_progress=lambda value, maximum, text: self.update_progress_dialog(progress, value, maximum, text),
+            on_cancel=progress.close,
+            session=True
+        )
+    
+    def create_progress_dialog(self, title, label, task):
+        """Vytvořit neblokující dialog průběhu napojený na operaci"""
+        progress = QProgressDialog(label, "Zrušit", 0, 0, self)
+        progress.setWindowModality(Qt.WindowModal)
+        progress.setWindowTitle(title)
+        progress.setMinimumDuration(0)
+        progress.setAutoClose(False)
+        progress.setAutoReset(False)
+        progress.canceled.connect(task.cancel)
+        progress.show()
+        return progress
+    
+    def update_progress_dialog(self, progress, value, maximum, text):
+        """Promítnout hlášení průběhu do dialogu"""
+        # QProgressDialog pracuje s 32bitovým int, velké hodnoty (bajty) přepočítat
+        if maximum > 0x7FFFFFFF:
+            value = int(value * 1000 / maximum)
+            maximum = 1000
+        progress.setMaximum(int(maximum))
+        progress.setValue(int(min(value, maximum)))
+        if text:
+            progress.setLabelText(text)
     
     def upload_file(self):
         """Nahrát soubor na server"""
-        item = self.local_tree.currentItem()
-        if not item or item.text(2) != "📄 Soubor":
+        entry = self.local_model.entry(self.local_tree.currentIndex())
+        if not entry or entry.is_dir:
             QMessageBox.warning(self, "FORTEftp", "Vyberte soubor k nahrání!")
             return
         
-        local_path = item.data(0, Qt.UserRole)
+        local_path = entry.path
         filename = os.path.basename(local_path)
+        remote_path = f"{self.current_remote_path.rstrip('/')}/{filename}"
         
-        try:
-            if self.ftp_client:
-                with open(local_path, 'rb') as f:
-                    self.ftp_client.storbinary(f'STOR {filename}', f)
-            elif self.sftp_client:
-                remote_path = f"{self.current_remote_path.rstrip('/')}/{filename}"
-                self.sftp_client.put(local_path, remote_path)
-            
+        def done(_):
+            self.listing_cache.add(remote_path, False, os.path.getsize(local_path))
             QMessageBox.information(self, "Úspěch", f"Soubor '{filename}' byl nahrán.")
             self.refresh_remote_files()
         
-        except Exception as e:
-            QMessageBox.critical(self, "Chyba", f"Nelze nahrát soubor:\n{str(e)}")
+        thread = FileTransferThread(
+            "upload", local_path, remote_path,
+            ftp_client=self.ftp_client,
+            sftp_client=self.sftp_client,
+            lock=self.engine.session_lock,
+            resume=self.current_env.get('resume_transfers', 'verify'),
+            segments=self.current_env.get('parallel_connections', DEFAULT_PARALLEL_CONNECTIONS),
+            segment_threshold=self.current_env.get('segment_threshold_mb', DEFAULT_SEGMENT_THRESHOLD_MB) * 1024 * 1024
+        )
+        self.start_transfer(thread, "Nahrání souboru", done)
     
     def download_file(self):
         """Stáhnout soubor ze serveru"""
-        item = self.remote_tree.currentItem()
-        if not item or item.text(2) != "📄 Soubor":
+        entry = self.remote_model.entry(self.remote_tree.currentIndex())
+        if not entry or entry.is_dir:
             QMessageBox.warning(self, "FORTEftp", "Vyberte soubor ke stažení!")
             return
         
-        filename = item.text(0)
+        filename = entry.name
         local_path = os.path.join(self.current_local_path, filename)
+        remote_path = entry.path
         
-        try:
-            if self.ftp_client:
-                with open(local_path, 'wb') as f:
-                    self.ftp_client.retrbinary(f'RETR {filename}', f.write)
-            elif self.sftp_client:
-                remote_path = item.data(0, Qt.UserRole)
-                self.sftp_client.get(remote_path, local_path)
-            
+        def done(_):
             QMessageBox.information(self, "Úspěch", f"Soubor '{filename}' byl stažen.")
             self.refresh_local_files()
         
-        except Exception as e:
-            QMessageBox.critical(self, "Chyba", f"Nelze stáhnout soubor:\n{str(e)}")
+        thread = FileTransferThread(
+            "download", remote_path, local_path,
+            ftp_client=self.ftp_client,
+            sftp_client=self.sftp_client,
+            lock=self.engine.session_lock,
+            resume=self.current_env.get('resume_transfers', 'verify'),
+            segments=self.current_env.get('parallel_connections', DEFAULT_PARALLEL_CONNECTIONS),
+            segment_threshold=self.current_env.get('segment_threshold_mb', DEFAULT_SEGMENT_THRESHOLD_MB) * 1024 * 1024
+        )
+        self.start_transfer(thread, "Stažení souboru", done)
     
     def upload_modified_files(self):
         """Nahrát pouze změněné soubory z aktuální lokální složky"""
@@ -1412,6 +5726,54 @@ class FORTEftp(QMainWindow):
         warning_label.setStyleSheet("color: #d32f2f; font-size: 9pt; margin-left: 25px;")
         layout.addWidget(warning_label)
         
+        layout.addSpacing(10)
+        
+        # Checkbox pro určení změn z manifestu posledního nahrání
+        has_manifest = SyncManifest().has_entries(self.current_env['name'], self.current_remote_path)
+        manifest_checkbox = QCheckBox("⚡ Porovnat s manifestem posledního nahrání (bez kontroly serveru)")
+        manifest_checkbox.setChecked(has_manifest)
+        manifest_checkbox.setEnabled(has_manifest)
+        layout.addWidget(manifest_checkbox)
+        
+        manifest_label = QLabel("Změny se určí jen z lokálních souborů. Soubory změněné na serveru\njinou cestou se neodhalí, proto se server občas ověří celý.")
+        manifest_label.setStyleSheet("font-size: 9pt; margin-left: 25px;")
+        layout.addWidget(manifest_label)
+        
+        layout.addSpacing(10)
+        
+        # Checkbox pro nahrání změn podle Gitu od naposledy nahraného commitu
+        deployed = SyncManifest().deployed_commit(self.current_env['name'], self.current_remote_path)
+        git_checkbox = QCheckBox(
+            f"🌿 Jen změny v Gitu od nahraného commitu {deployed[0][:8]}" if deployed
+            else "🌿 Jen změny v Gitu od naposledy nahraného commitu"
+        )
+        git_checkbox.setEnabled(deployed is not None)
+        layout.addWidget(git_checkbox)
+        
+        git_label = QLabel("Změny se určí z git diff a nesledovaných souborů bez procházení složek\ni serveru. Soubory ignorované Gitem (.gitignore) se nenahrají.")
+        git_label.setStyleSheet("font-size: 9pt; margin-left: 25px;")
+        layout.addWidget(git_label)
+        
+        layout.addSpacing(10)
+        
+        # Checkbox pro porovnání obsahu místo času změny
+        hash_checkbox = QCheckBox("🔍 Porovnat obsah souborů (hash) místo času změny")
+        layout.addWidget(hash_checkbox)
+        
+        hash_label = QLabel("Přesné, ale pomalejší: server musí umět HASH/XSHA256/XMD5 (FTP)\nnebo sha256sum (SSH). Lokální hashe se ukládají do cache.")
+        hash_label.setStyleSheet("font-size: 9pt; margin-left: 25px;")
+        layout.addWidget(hash_label)
+        
+        layout.addSpacing(10)
+        
+        # Checkbox pro průběžné nahrávání bez přehledu změn
+        stream_checkbox = QCheckBox("🚀 Nahrávat průběžně během kontroly (bez přehledu změn)")
+        layout.addWidget(stream_checkbox)
+        
+        stream_label = QLabel("Nahrávání začne hned u první změněné složky. Soubory nelze předem\nvybrat, mazání se potvrdí až po nahrání.")
+        stream_label.setStyleSheet("font-size: 9pt; margin-left: 25px;")
+        layout.addWidget(stream_label)
+        
         layout.addSpacing(20)
         
         # Tlačítka
@@ -1433,146 +5795,722 @@ class FORTEftp(QMainWindow):
         if dialog.exec_() != QDialog.Accepted:
             return
         
-        delete_remote_files = delete_checkbox.isChecked()
+        options = {
+            'delete': delete_checkbox.isChecked(),
+            'trust_manifest': manifest_checkbox.isChecked(),
+            'content_hash': hash_checkbox.isChecked()
+        }
+        
+        if git_checkbox.isChecked():
+            task = self.engine.run(
+                self.analyze_git_changes,
+                self.current_env,
+                self.current_local_path,
+                self.current_remote_path,
+                options,
+                on_success=lambda result: (progress.close(), self.on_sync_analyzed(result)),
+                on_error=lambda message: (progress.close(), QMessageBox.critical(self, "Chyba", message)),
+                on_progress=lambda value, maximum, text: self.update_progress_dialog(progress, value, maximum, text),
+                on_cancel=lambda: progress.close(),
+                session=False
+            )
+            progress = self.create_progress_dialog("Synchronizace", "Zjišťuji změny v Gitu...", task)
+            return
+        
+        if stream_checkbox.isChecked():
+            task = self.engine.run(
+                self.run_streaming_sync,
+                self.current_env,
+                self.current_local_path,
+                self.current_remote_path,
+                options,
+                self.ftp_client,
+                self.sftp_client,
+                self.ssh_client,
+                on_success=lambda summary: (stream_progress.close(), self.on_streaming_synced(summary)),
+                on_error=lambda message: (stream_progress.close(), QMessageBox.critical(self, "Chyba", message)),
+                on_progress=lambda value, maximum, text: self.update_progress_dialog(stream_progress, value, maximum, text),
+                on_cancel=lambda: (stream_progress.close(), self.refresh_remote_files())
+            )
+            stream_progress = self.create_progress_dialog("Synchronizace", "Kontroluji a nahrávám...", task)
+            return
+        
+        task = self.engine.run(
+            self.analyze_sync_changes,
+            self.current_env,
+            self.current_local_path,
+            self.current_remote_path,
+            options,
+            self.ftp_client,
+            self.sftp_client,
+            self.ssh_client,
+            on_success=lambda result: (progress.close(), self.on_sync_analyzed(result)),
+            on_error=lambda message: (progress.close(), QMessageBox.critical(self, "Chyba", message)),
+            on_progress=lambda value, maximum, text: self.update_progress_dialog(progress, value, maximum, text),
+            on_cancel=lambda: progress.close()
+        )
+        progress = self.create_progress_dialog("Analýza souborů", "Načítám lokální soubory...", task)
+    
+    def analyze_sync_changes(self, task, env, local_root, remote_root, options, ftp_client=None, sftp_client=None, ssh_client=None):
+        """Najít soubory k nahrání a ke smazání (běží na pozadí)"""
+        # Stav Gitu před skenem - po úplném nahrání se zaznamená jako nahraný commit
+        git_state = self.git_deploy_state(local_root)
         
         # Získat seznam lokálních souborů
         local_files = []
+        local_dirs = set()
         try:
-            for item in Path(self.current_local_path).rglob('*'):
-                if item.is_file():
-                    rel_path = item.relative_to(self.current_local_path)
-                    local_files.append({
-                        'path': str(item),
-                        'rel_path': str(rel_path).replace('\\', '/'),
-                        'size': item.stat().st_size,
-                        'mtime': item.stat().st_mtime
-                    })
+            for rel_dir, files, subdirs in self.local_directories(local_root, task):
+                local_dirs.update(subdirs)
+                local_files.extend(files)
+                task.report(0, 0, f"Načítám lokální soubory... ({len(local_files)})")
+        except OperationCancelled:
+            raise
         except Exception as e:
-            QMessageBox.critical(self, "Chyba", f"Nelze načíst lokální soubory:\n{str(e)}")
-            return
+            raise RuntimeError(f"Nelze načíst lokální soubory:\n{str(e)}")
+        
+        result = {
+            'local_count': len(local_files),
+            'files_to_upload': [],
+            'files_to_delete': [],
+            'in_sync': [],
+            'remote_dirs': set(),
+            'mode': 'full',
+            'warnings': []
+        }
         
         if not local_files:
-            QMessageBox.information(self, "FORTEftp", "Žádné soubory k nahrání.")
-            return
+            return result
+        
+        # Změny podle manifestu posledního nahrání - bez dotazů na server
+        manifest = SyncManifest()
+        if options.get('trust_manifest'):
+            verify_every = env.get('manifest_verify_every', DEFAULT_MANIFEST_VERIFY_EVERY)
+            if manifest.needs_verification(env['name'], remote_root, verify_every):
+                result['warnings'].append(
+                    f"Od posledního ověření serveru proběhlo {verify_every} nahrání, "
+                    "tentokrát se server zkontroluje celý."
+                )
+            else:
+                self.compare_with_manifest(task, result, manifest, env['name'], local_files, local_dirs, remote_root, options)
+                return result
+        
+        # Načíst vzdálený strom - každou složku jen jednou
+        task.report(0, 0, "Načítám vzdálené soubory...", force=True)
+        remote_index = None
+        if ftp_client:
+            remote_index = RemoteIndex.from_ftp(ftp_client, remote_root, task)
+        else:
+            if ssh_client and env.get('ssh_fast_scan', True):
+                # Celý strom jedním příkazem find, při omezeném shellu zpět na SFTP
+                remote_index = RemoteIndex.from_ssh_find(ssh_client, remote_root, task)
+                if remote_index is not None and not remote_index.entries:
+                    # Prázdný výstup find u neprázdné složky (find bez -H, zvláštní
+                    # oprávnění) by znamenal nahrát všechno znovu - ověřit přes SFTP
+                    try:
+                        if sftp_client.listdir(remote_root):
+                            remote_index = None
+                    except Exception:
+                        pass
+            if remote_index is None:
+                remote_index = RemoteIndex.from_sftp(sftp_client, remote_root, task)
         
-        # Porovnat se vzdálenými soubory
-        files_to_upload = []
+        # Existující složky se při nahrávání nebudou znovu ověřovat
+        result['remote_dirs'] = remote_index.directories()
+        # Načtené složky poslouží i prohlížení serveru
+        self.listing_cache.put_index(remote_index)
         
-        progress = QProgressDialog("Kontrolujem změny...", "Zrušit", 0, len(local_files), self)
-        progress.setWindowModality(Qt.WindowModal)
-        progress.setWindowTitle("Analýza souborů")
+        # Porovnat se vzdálenými soubory v paměti
+        self.compare_local_files(task, result, local_files, remote_index, remote_root, options, ftp_client, ssh_client)
+        
+        task.report(len(local_files), len(local_files), "", force=True)
+        
+        # Pokud je aktivní mazání, najít soubory ke smazání
+        if options.get('delete'):
+            remote_entries = {rel_path: entry[2] for rel_path, entry in remote_index.entries.items()}
+            result['files_to_delete'] = self.find_files_to_delete(remote_entries, local_files, local_dirs, remote_root)
+        
+        if git_state:
+            result['git_commit'], result['git_extra'] = git_state
+        
+        return result
+    
+    def analyze_git_changes(self, task, env, local_root, remote_root, options):
+        """Určit změny podle Gitu od naposledy nahraného commitu (běží na pozadí)
+        
+        Neprochází lokální strom ani server - nahraje se jen to, co git diff
+        a nesledované soubory ukážou od commitu zaznamenaného při minulém nahrání.
+        """
+        deployed = SyncManifest().deployed_commit(env['name'], remote_root)
+        if not deployed:
+            raise RuntimeError("Pro toto prostředí zatím není zaznamenaný nahraný commit.\nProveďte nejdřív běžné nahrání změn.")
+        base_commit, extra_paths = deployed
+        
+        task.report(0, 0, "Zjišťuji změny v Gitu...", force=True)
+        # HEAD i nahraný commit přečte jeden cat-file proces
+        with GitBackend(local_root) as backend:
+            head_object = backend.read_object("HEAD")
+            base_object = backend.read_object(f"{base_commit}^{{commit}}")
+        if head_object is None:
+            raise RuntimeError("Repozitář zatím nemá žádný commit.")
+        head = head_object[0]
+        if base_object is None:
+            raise RuntimeError(
+                f"Nahraný commit {base_commit[:8]} už v repozitáři není (rebase, jiné repo?).\n"
+                "Proveďte běžné nahrání změn."
+            )
+        
+        changed, deleted = self.git_changes_since(local_root, base_commit)
+        # Necommitnuté soubory z minulého nahrání mohly být mezitím vráceny - nahrát znovu
+        for rel_path in extra_paths:
+            if rel_path not in changed:
+                if os.path.isfile(os.path.join(local_root, rel_path)):
+                    changed[rel_path] = "Změněný soubor"
+                else:
+                    deleted.add(rel_path)
+        
+        _, uncommitted = self.git_deploy_state(local_root) or (None, set())
+        
+        result = {
+            'local_count': len(changed) + len(deleted),
+            'files_to_upload': [],
+            'files_to_delete': [],
+            'in_sync': [],
+            'remote_dirs': set(),
+            'mode': 'git',
+            'git_base': base_commit,
+            'git_commit': head,
+            'git_extra': uncommitted,
+            'warnings': []
+        }
+        
+        for idx, rel_path in enumerate(sorted(changed)):
+            task.check_cancelled()
+            task.report(idx, len(changed), f"Kontroluji: {rel_path}")
+            local_path = os.path.join(local_root, *rel_path.split('/'))
+            try:
+                file_stat = os.stat(local_path)
+            except OSError:
+                deleted.add(rel_path)
+                continue
+            # Submoduly a jiné ne-soubory se přeskočí
+            if not stat.S_ISREG(file_stat.st_mode):
+                continue
+            local_file = {
+                'path': local_path,
+                'rel_path': rel_path,
+                'size': file_stat.st_size,
+                'mtime_ns': file_stat.st_mtime_ns
+            }
+            result['files_to_upload'].append(self.make_upload_entry(local_file, remote_root, changed[rel_path]))
+        
+        if options.get('delete'):
+            result['files_to_delete'] = [
+                {'rel_path': rel_path, 'full_path': f"{remote_root.rstrip('/')}/{rel_path}", 'is_dir': False}
+                for rel_path in sorted(deleted - set(changed))
+            ]
+        
+        return result
+    
+    def compare_local_files(self, task, result, local_files, remote_index, remote_root, options, ftp_client=None, ssh_client=None):
+        """Porovnat lokální soubory se záznamy vzdáleného indexu"""
+        hash_candidates = []
         
         for idx, local_file in enumerate(local_files):
-            if progress.wasCanceled():
-                return
+            task.check_cancelled()
+            task.report(idx, len(local_files), f"Kontroluji: {local_file['rel_path']}")
             
-            progress.setValue(idx)
-            progress.setLabelText(f"Kontroluji: {local_file['rel_path']}")
-            QApplication.processEvents()
+            link = remote_index.link_for(local_file['rel_path'])
+            if link is not None:
+                self.add_link_warning(result, link)
+                continue
             
-            remote_path = f"{self.current_remote_path.rstrip('/')}/{local_file['rel_path']}"
-            should_upload = False
-            reason = ""
+            remote_entry = remote_index.get(local_file['rel_path'])
             
-            try:
-                if self.ftp_client:
-                    # Zkusit získat velikost vzdáleného souboru
-                    try:
-                        remote_size = self.ftp_client.size(local_file['rel_path'])
-                        # Soubor existuje - porovnat velikost
-                        if remote_size is None or remote_size != local_file['size']:
-                            should_upload = True
-                            reason = "Jiná velikost"
-                        else:
-                            # Velikost je stejná, zkusit porovnat čas
-                            try:
-                                mdtm_response = self.ftp_client.voidcmd(f"MDTM {local_file['rel_path']}")
-                                # Odpověď je ve formátu: "213 YYYYMMDDhhmmss"
-                                if mdtm_response.startswith('213 '):
-                                    import time
-                                    from datetime import datetime
-                                    time_str = mdtm_response[4:].strip()
-                                    remote_time = datetime.strptime(time_str, '%Y%m%d%H%M%S').timestamp()
-                                    # Porovnat s tolerancí 2 sekundy (kvůli zaokrouhlení)
-                                    if local_file['mtime'] > remote_time + 2:
-                                        should_upload = True
-                                        reason = "Novější verze"
-                            except:
-                                # MDTM není podporováno nebo selhalo - soubor necháme
-                                pass
-                    except:
-                        # Soubor neexistuje na serveru
-                        should_upload = True
-                        reason = "Nový soubor"
-                
-                elif self.sftp_client:
-                    # SFTP kontrola
-                    try:
-                        remote_stat = self.sftp_client.stat(remote_path)
-                        # Nejdřív porovnat velikost
-                        if local_file['size'] != remote_stat.st_size:
-                            should_upload = True
-                            reason = "Jiná velikost"
-                        # Pak porovnat čas modifikace s tolerancí 2 sekundy
-                        elif local_file['mtime'] > remote_stat.st_mtime + 2:
-                            should_upload = True
-                            reason = "Novější verze"
-                    except FileNotFoundError:
-                        should_upload = True
-                        reason = "Nový soubor"
-                    except:
-                        # Jiná chyba - přeskočit soubor
-                        pass
-                
-                if should_upload:
-                    files_to_upload.append({
-                        'local': local_file['path'],
-                        'remote': remote_path,
-                        'rel_path': local_file['rel_path'],
-                        'size': local_file['size'],
-                        'reason': reason
-                    })
+            # Při porovnání obsahu rozhodne u souborů se stejnou velikostí hash, ne čas
+            if (options.get('content_hash') and remote_entry and not remote_entry[2]
+                    and remote_entry[0] == local_file['size']):
+                hash_candidates.append((local_file, remote_entry))
+                continue
             
-            except Exception as e:
-                # Při neočekávané chybě pouze logovat, ale nepřidávat
-                print(f"Chyba při kontrole {local_file['rel_path']}: {e}")
+            reason = self.compare_with_remote(local_file, remote_entry, remote_root, ftp_client, remote_index.list_times)
+            self.add_compare_result(result, local_file, remote_entry, remote_root, reason)
         
-        progress.setValue(len(local_files))
+        if hash_candidates:
+            self.compare_content_hashes(task, result, hash_candidates, remote_root, ftp_client, ssh_client, remote_index.list_times)
+    
+    def add_link_warning(self, result, link):
+        """Upozornit, že synchronizace vynechala cestu, která je na serveru odkazem"""
+        warning = f"Na serveru je {link} symbolický odkaz, synchronizace ho i jeho obsah vynechala."
+        if warning not in result['warnings']:
+            result['warnings'].append(warning)
+    
+    def add_compare_result(self, result, local_file, remote_entry, remote_root, reason):
+        """Zařadit porovnaný soubor k nahrání, nebo mezi souhlasící se serverem"""
+        if reason:
+            entry = self.make_upload_entry(local_file, remote_root, reason)
+            # Kratší vzdálený soubor zapsaný až po poslední změně lokálního
+            # vypadá jako přerušené nahrání - lze na něj navázat
+            if (remote_entry and not remote_entry[2] and remote_entry[0]
+                    and remote_entry[0] < local_file['size']
+                    and remote_entry[1] is not None and remote_entry[1] >= local_file['mtime']):
+                entry['resume_from'] = remote_entry[0]
+                entry['reason'] = "Nedokončené nahrání"
+            result['files_to_upload'].append(entry)
+        else:
+            # Souhlasí se serverem - zapíše se do manifestu
+            result['in_sync'].append({
+                'rel_path': local_file['rel_path'],
+                'local': local_file['path'],
+                'size': local_file['size'],
+                'mtime_ns': local_file['mtime_ns'],
+                'content_hash': local_file.get('content_hash'),
+                'remote_mtime': remote_entry[1]
+            })
+    
+    def compare_content_hashes(self, task, result, candidates, remote_root, ftp_client=None, ssh_client=None, list_times=None):
+        """Porovnat obsah souborů se stejnou velikostí podle hashe na serveru"""
+        rel_paths = [local_file['rel_path'] for local_file, _ in candidates]
+        
+        task.report(0, len(rel_paths), "Počítám hashe na serveru...", force=True)
+        remote = None
+        if ftp_client:
+            remote = remote_hashes_ftp(ftp_client, remote_root, rel_paths, task)
+        elif ssh_client:
+            remote = remote_hashes_ssh(ssh_client, remote_root, rel_paths, task)
+        
+        if remote is None:
+            result['warnings'].append(
+                "Server neumí spočítat hash souborů (HASH/XSHA256/XMD5 ani sha256sum), "
+                "soubory se porovnaly podle času změny."
+            )
+            remote_algorithm, remote_hashes = None, {}
+        else:
+            remote_algorithm, remote_hashes, error = remote
+            if error:
+                missing = len(rel_paths) - len(remote_hashes)
+                result['warnings'].append(
+                    f"Hash na serveru se nepodařilo získat pro {missing} z {len(rel_paths)} souborů ({error}), "
+                    "porovnaly se podle času změny."
+                )
         
-        # Pokud je aktivní mazání, najít soubory ke smazání
-        files_to_delete = []
-        if delete_remote_files:
-            progress_delete = QProgressDialog("Kontroluji soubory ke smazání...", "Zrušit", 0, 100, self)
-            progress_delete.setWindowModality(Qt.WindowModal)
-            progress_delete.setWindowTitle("Hledání souborů")
-            progress_delete.setValue(10)
-            QApplication.processEvents()
-            
-            # Získat seznam vzdálených souborů
-            remote_files_list = []
-            try:
-                if self.ftp_client:
-                    remote_files_list = self.get_all_remote_files_ftp(self.current_remote_path)
-                elif self.sftp_client:
-                    remote_files_list = self.get_all_remote_files_sftp(self.current_remote_path)
-            except Exception as e:
-                QMessageBox.warning(self, "Chyba", f"Nelze načíst vzdálené soubory:\n{str(e)}")
-            
-            progress_delete.setValue(50)
-            QApplication.processEvents()
+        local_hashes = {}
+        if remote_hashes:
+            hashed = [local_file for local_file, _ in candidates if local_file['rel_path'] in remote_hashes]
+            local_hashes = LocalHashCache().hashes(hashed, remote_algorithm, task)
+        
+        for local_file, remote_entry in candidates:
+            task.check_cancelled()
+            remote_hash = remote_hashes.get(local_file['rel_path'])
+            local_hash = local_hashes.get(local_file['path'])
+            if remote_hash and local_hash:
+                reason = None if remote_hash == local_hash else "Jiný obsah"
+            else:
+                # Hash nelze získat - porovnat postaru podle času
+                reason = self.compare_with_remote(local_file, remote_entry, remote_root, ftp_client, list_times)
+            self.add_compare_result(result, local_file, remote_entry, remote_root, reason)
+    
+    def compare_with_manifest(self, task, result, manifest, env_name, local_files, local_dirs, remote_root, options, manifest_entries=None):
+        """Určit změny porovnáním lokálního skenu s manifestem posledního nahrání"""
+        result['mode'] = 'manifest'
+        if manifest_entries is None:
+            manifest_entries = manifest.load(env_name, remote_root)
+        hash_candidates = []
+        
+        for idx, local_file in enumerate(local_files):
+            task.check_cancelled()
+            task.report(idx, len(local_files), f"Kontroluji: {local_file['rel_path']}")
             
-            # Vytvořit set lokálních relativních cest
-            local_paths_set = {f['rel_path'] for f in local_files}
+            entry = manifest_entries.get(local_file['rel_path'])
+            if entry is None:
+                reason = "Nový soubor"
+            elif entry[0] != local_file['size']:
+                reason = "Jiná velikost"
+            elif entry[1] != local_file['mtime_ns']:
+                # Stejná velikost, jiný čas - pokud známe hash, rozhodne obsah
+                if entry[2]:
+                    hash_candidates.append(local_file)
+                    continue
+                reason = "Změněný soubor"
+            else:
+                continue
             
-            # Najít soubory které jsou na serveru, ale ne lokálně
-            for remote_file in remote_files_list:
-                if remote_file['rel_path'] not in local_paths_set:
-                    files_to_delete.append(remote_file)
+            result['files_to_upload'].append(self.make_upload_entry(local_file, remote_root, reason))
+        
+        if hash_candidates:
+            local_hashes = LocalHashCache().hashes(hash_candidates, 'blake2b', task)
+            touched = []
+            for local_file in hash_candidates:
+                if local_hashes.get(local_file['path']) == manifest_entries[local_file['rel_path']][2]:
+                    touched.append(local_file)
+                else:
+                    result['files_to_upload'].append(self.make_upload_entry(local_file, remote_root, "Změněný soubor"))
+            if touched:
+                manifest.touch(env_name, remote_root, touched)
+        
+        if options.get('delete'):
+            remote_entries = {rel_path: False for rel_path in manifest_entries}
+            result['files_to_delete'] = self.find_files_to_delete(remote_entries, local_files, local_dirs, remote_root)
+    
+    def make_upload_entry(self, local_file, remote_root, reason):
+        """Záznam souboru k nahrání"""
+        return {
+            'local': local_file['path'],
+            'remote': f"{remote_root.rstrip('/')}/{local_file['rel_path']}",
+            'rel_path': local_file['rel_path'],
+            'size': local_file['size'],
+            'mtime_ns': local_file['mtime_ns'],
+            'reason': reason
+        }
+    
+    def find_files_to_delete(self, remote_entries, local_files, local_dirs, remote_root):
+        """Najít vzdálené položky (rel_path -> is_dir), které lokálně neexistují"""
+        # Vytvořit set lokálních relativních cest
+        local_paths_set = {f['rel_path'] for f in local_files}
+        local_paths_set.update(local_dirs)
+        
+        files_to_delete = []
+        deleted_dirs = []
+        for rel_path in sorted(remote_entries):
+            if rel_path in local_paths_set:
+                continue
+            # Obsah mazané složky se smaže spolu s ní
+            if any(rel_path.startswith(d + '/') for d in deleted_dirs):
+                continue
             
-            progress_delete.setValue(100)
+            is_dir = remote_entries[rel_path]
+            files_to_delete.append({
+                'rel_path': rel_path,
+                'full_path': f"{remote_root.rstrip('/')}/{rel_path}",
+                'is_dir': is_dir
+            })
+            if is_dir:
+                deleted_dirs.append(rel_path)
+        
+        return files_to_delete
+    
+    def compare_with_remote(self, local_file, remote_entry, remote_root, ftp_client=None, list_times=None):
+        """Porovnat lokální soubor se záznamem z indexu, vrací důvod nahrání nebo None
 
+        list_times jsou přibližné časy z FTP LIST (RemoteIndex.list_times).
+        """
+        if remote_entry is None or remote_entry[2]:
+            return "Nový soubor"
+        
+        remote_size, remote_mtime, _ = remote_entry
+        
+        # Nejdřív porovnat velikost
+        if remote_size is None or remote_size != local_file['size']:
+            return "Jiná velikost"
+        
+        # Přibližný čas z LIST (zóna serveru ±1 den, přesnost na minuty či dny)
+        # rozhodne sám, pokud je lokální soubor zjevně novější nebo starší
+        list_time = list_times.get(local_file['rel_path']) if list_times and remote_mtime is None else None
+        if list_time is not None:
+            listed, precision = list_time
+            if local_file['mtime'] > listed + precision + LIST_TIME_SLACK + 2:
+                return "Novější verze"
+            if local_file['mtime'] <= listed - LIST_TIME_SLACK:
+                return None
+        
+        # Čas nejistý nebo ve výpisu chybí - doptat se přes MDTM, pokud ho server umí
+        if remote_mtime is None and ftp_client and 'MDTM' in ftp_features(ftp_client):
+            try:
+                remote_path = f"{remote_root.rstrip('/')}/{local_file['rel_path']}"
+                mdtm_response = ftp_client.voidcmd(f"MDTM {remote_path}")
+                # Odpověď je ve formátu: "213 YYYYMMDDhhmmss"
+                if mdtm_response.startswith('213 '):
+                    remote_mtime = parse_mlsd_time(mdtm_response[4:].strip())
+            except:
+                # MDTM selhalo - soubor necháme
+                pass
+        
+        # Pak porovnat čas modifikace s tolerancí 2 sekundy (kvůli zaokrouhlení)
+        if remote_mtime is not None and local_file['mtime'] > remote_mtime + 2:
+            return "Novější verze"
+        
+        return None
+    
+    def scan_local_tree(self, task, local_root, dir_queue, stop):
+        """Posílat lokální složky do omezené fronty (vlastní vlákno)"""
+        def put(item):
+            while not stop.is_set():
+                try:
+                    dir_queue.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+        
+        try:
+            for item in self.local_directories(local_root, task):
+                if not put(item):
+                    return
+        except Exception as e:
+            # Chybu (i zrušení) předat porovnání jako položku fronty
+            put(e)
+            return
+        put(None)
+    
+    def run_streaming_sync(self, task, env, local_root, remote_root, options, ftp_client=None, sftp_client=None, ssh_client=None):
+        """Kontrolovat a nahrávat průběžně po složkách (běží na pozadí)
+        
+        Sken lokálních složek, porovnání a nahrávání běží souběžně a jsou
+        propojené omezenými frontami - nahrávání začne u první změněné složky
+        a paměť nezávisí na velikosti stromu. Hlavní spojení načítá vzdálené
+        složky, soubory nahrávají další spojení. Mazání se jen sesbírá
+        a po nahrání ho potvrdí uživatel.
+        """
+        manifest = SyncManifest()
+        env_name = env['name']
+        warnings = []
+        
+        # Změny podle manifestu posledního nahrání - server se vůbec nenačítá
+        manifest_entries = None
+        if options.get('trust_manifest'):
+            verify_every = env.get('manifest_verify_every', DEFAULT_MANIFEST_VERIFY_EVERY)
+            if manifest.needs_verification(env_name, remote_root, verify_every):
+                warnings.append(
+                    f"Od posledního ověření serveru proběhlo {verify_every} nahrání, "
+                    "tentokrát se server zkontroloval celý."
+                )
+            else:
+                manifest_entries = manifest.load(env_name, remote_root)
+        mode = 'full' if manifest_entries is None else 'manifest'
+        
+        if mode == 'full':
+            # Manifest se přestaví průběžně ze souhlasících souborů
+            manifest.reset(env_name, remote_root)
+            if ftp_client:
+                list_directory = lambda index, path: index.list_ftp(ftp_client, path)
+            else:
+                list_directory = lambda index, path: index.list_sftp(sftp_client, path)
+        else:
+            # Vzdálené složky podle manifestu: rodič -> {název: is_dir}
+            manifest_children = {}
+            for rel_path in manifest_entries:
+                parts = rel_path.split('/')
+                for depth in range(len(parts)):
+                    parent = '/'.join(parts[:depth])
+                    manifest_children.setdefault(parent, {})[parts[depth]] = depth < len(parts) - 1
+        
+        # Hlavní spojení při plné kontrole načítá složky, nahrávají jen další spojení
+        pool = TransferPool(
+            env,
+            env.get('parallel_connections', DEFAULT_PARALLEL_CONNECTIONS),
+            remote_root,
+            ftp_client=ftp_client,
+            sftp_client=sftp_client,
+            use_primary=mode == 'manifest',
+            queue_size=STREAM_QUEUE_SIZE,
+            connections=self.connections
+        )
+        
+        checked = 0
+        queued = []
+        files_to_delete = []
+        missing_dirs = set()
+        # Složky, jejichž výpis selhal - bez něj je nelze porovnat ani v nich mazat
+        skipped_dirs = set()
+        # Složky, které jsou na serveru symbolickým odkazem
+        linked_dirs = set()
+        progress_lock = threading.Lock()
+        
+        def report(force=False):
+            with progress_lock:
+                task.report(
+                    len(pool.uploaded_files) + len(pool.failed_files), len(queued),
+                    f"Zkontrolováno {checked} souborů, nahráno {len(pool.uploaded_files)}/{len(queued)}",
+                    force=force
+                )
+        
+        dir_queue = queue.Queue(maxsize=STREAM_QUEUE_SIZE)
+        stop = threading.Event()
+        scanner = threading.Thread(target=self.scan_local_tree, args=(task, local_root, dir_queue, stop), daemon=True)
+        scanner.start()
+        pool.start(task, on_progress=lambda file_info: report())
+        completed = False
+        
+        try:
+            while True:
+                task.check_cancelled()
+                try:
+                    item = dir_queue.get(timeout=0.1)
+                except queue.Empty:
+                    continue
+                if item is None:
+                    break
+                if isinstance(item, OperationCancelled):
+                    raise item
+                if isinstance(item, Exception):
+                    raise RuntimeError(f"Nelze načíst lokální soubory:\n{str(item)}")
+                
+                rel_dir, files, subdirs = item
+                local_names = {f['rel_path'] for f in files}
+                local_names.update(subdirs)
+                dir_result = {'files_to_upload': [], 'in_sync': [], 'warnings': []}
+                
+                if mode == 'manifest':
+                    self.compare_with_manifest(task, dir_result, manifest, env_name, files, set(), remote_root, {}, manifest_entries)
+                    remote_children = {
+                        (f"{rel_dir}/{name}" if rel_dir else name): is_dir
+                        for name, is_dir in manifest_children.get(rel_dir, {}).items()
+                    }
+                else:
+                    if rel_dir in skipped_dirs:
+                        skipped_dirs.update(subdirs)
+                        continue
+                    if rel_dir in linked_dirs:
+                        linked_dirs.update(subdirs)
+                        continue
+                    # Načíst jen tuto vzdálenou složku; pod chybějící složkou není co načítat
+                    remote_index = RemoteIndex(remote_root)
+                    if rel_dir not in missing_dirs:
+                        path = remote_index.full_path(rel_dir) if rel_dir else remote_index.root
+                        try:
+                            entries = list_directory(remote_index, path)
+                            remote_index.listings += 1
+                            self.listing_cache.put(path, entries)
+                        except OperationCancelled:
+                            raise
+                        except Exception as e:
+                            if not is_missing_remote_dir(e):
+                                # Prázdný výpis by znamenal nahrát vše znovu - složku raději přeskočit
+                                warnings.append(
+                                    f"Vzdálenou složku {path} se nepodařilo načíst ({e}), "
+                                    "její soubory i podsložky se přeskočily."
+                                )
+                                skipped_dirs.update(subdirs)
+                                skipped_dirs.add(rel_dir)
+                                continue
+                            entries = []
+                        remote_index.add_listing(rel_dir, entries)
+                        pool.known_dirs.update(remote_index.directories())
+                    for subdir in subdirs:
+                        if subdir in remote_index.links:
+                            # Složka je na serveru odkaz - obsah se nesynchronizuje
+                            self.add_link_warning(dir_result, subdir)
+                            linked_dirs.add(subdir)
+                            continue
+                        entry = remote_index.get(subdir)
+                        if entry is None or not entry[2]:
+                            missing_dirs.add(subdir)
+                    missing_dirs.discard(rel_dir)
+                    
+                    self.compare_local_files(task, dir_result, files, remote_index, remote_root, options, ftp_client, ssh_client)
+                    if dir_result['in_sync']:
+                        self.add_local_hashes(task, dir_result['in_sync'])
+                        manifest.add_entries(env_name, remote_root, dir_result['in_sync'])
+                    remote_children = {rel_path: entry[2] for rel_path, entry in remote_index.entries.items()}
+                
+                for warning in dir_result['warnings']:
+                    if warning not in warnings:
+                        warnings.append(warning)
+                
+                if options.get('delete'):
+                    for rel_path in sorted(remote_children):
+                        if rel_path not in local_names:
+                            files_to_delete.append({
+                                'rel_path': rel_path,
+                                'full_path': f"{remote_root.rstrip('/')}/{rel_path}",
+                                'is_dir': remote_children[rel_path]
+                            })
+                
+                checked += len(files)
+                for file_info in dir_result['files_to_upload']:
+                    queued.append(file_info)
+                    pool.put(task, file_info)
+                report()
+            
+            completed = True
+        finally:
+            stop.set()
+            pool.finish()
+            report(force=True)
+            self.update_listing_cache(remote_root, pool.uploaded_files, [])
+            try:
+                # Nedokončená kontrola se nepočítá jako ověření serveru
+                verified = completed and not skipped_dirs
+                self.record_sync_manifest(
+                    task, env, remote_root,
+                    {'mode': mode if verified else 'partial', 'in_sync': None},
+                    pool.uploaded_files, []
+                )
+            except Exception as e:
+                warnings.append(f"Manifest se nepodařilo uložit: {e}")
+        
+        return {
+            'local_count': checked,
+            'mode': mode,
+            'files_to_upload': queued,
+            'files_to_delete': [],
+            'pending_delete': files_to_delete,
+            'upload_success': pool.uploaded,
+            'delete_success': 0,
+            'failed_files': pool.failed_files,
+            'warnings': pool.warnings + warnings,
+            'tls_stats': pool.tls_stats
+        }
+    
+    def forget_remote_tree(self):
+        """Přerušená synchronizace - výpisy pod aktuální složkou nemusí odpovídat serveru"""
+        self.listing_cache.invalidate(self.current_remote_path, recursive=True)
+        self.refresh_remote_files()
+    
+    def on_streaming_synced(self, summary):
+        """Zobrazit výsledek průběžné synchronizace a potvrdit mazání"""
+        files_to_delete = summary['pending_delete']
+        if not summary['files_to_upload'] and not files_to_delete and not summary['failed_files']:
+            message = "✅ Všechny soubory jsou synchronizované!\n\nŽádné změny k provedení."
+            for warning in summary['warnings']:
+                message += f"\n\n⚠️ {warning}"
+            QMessageBox.information(self, "FORTEftp", message)
+            return
+        
+        self.show_sync_result(summary)
+        if not files_to_delete:
+            return
+        
+        message = f"🗑️ SMAZAT: {len(files_to_delete)} souborů, které nejsou lokálně uložené\n\n"
+        for f in files_to_delete[:8]:
+            message += f"  ❌ {f['rel_path']}\n"
+        if len(files_to_delete) > 8:
+            message += f"  ... a {len(files_to_delete) - 8} dalších\n"
+        message += "\nSmazat je ze serveru?"
+        
+        reply = QMessageBox.question(self, "Potvrzení mazání", message, QMessageBox.Yes | QMessageBox.No)
+        if reply != QMessageBox.Yes:
+            return
+        
+        task = self.engine.run(
+            self.run_sync_operations,
+            self.current_env,
+            {'mode': 'manifest', 'in_sync': []},
+            [],
+            files_to_delete,
+            self.current_remote_path,
+            self.ftp_client,
+            self.sftp_client,
+            on_success=lambda result: (delete_progress.close(), self.show_sync_result(result)),
+            on_error=lambda message: (delete_progress.close(), self.forget_remote_tree(), QMessageBox.critical(self, "Chyba", message)),
+            on_progress=lambda value, maximum, text: self.update_progress_dialog(delete_progress, value, maximum, text),
+            on_cancel=lambda: (delete_progress.close(), self.forget_remote_tree())
+        )
+        delete_progress = self.create_progress_dialog("Mazání", "Mažu soubory...", task)
+    
+    def on_sync_analyzed(self, result):
+        """Zobrazit nalezené změny a po potvrzení spustit synchronizaci"""
+        for warning in result['warnings']:
+            QMessageBox.warning(self, "Chyba", warning)
+        
+        if not result['local_count'] and result['mode'] != 'git':
+            QMessageBox.information(self, "FORTEftp", "Žádné soubory k nahrání.")
+            return
+        
+        files_to_delete = result['files_to_delete']
+        
         # Uživatel vybere soubory k nahrání
-        files_to_upload = self.select_files_to_upload(files_to_upload)
+        files_to_upload = self.select_files_to_upload(result['files_to_upload'])
         if files_to_upload is None:
             return
         
@@ -1580,6 +6518,11 @@ class FORTEftp(QMainWindow):
         has_changes = len(files_to_upload) > 0 or len(files_to_delete) > 0
         
         if not has_changes:
+            if result['mode'] == 'full':
+                # Ověřený stav serveru uložit do manifestu pro příští nahrání
+                self.engine.run(self.record_sync_manifest, self.current_env, self.current_remote_path, result, [], [])
+            if len(result['files_to_upload']) == len(files_to_upload):
+                self.engine.run(self.record_deployed_commit, self.current_env, self.current_remote_path, result)
             QMessageBox.information(
                 self, 
                 "FORTEftp", 
@@ -1590,6 +6533,11 @@ class FORTEftp(QMainWindow):
         # Zobrazit dialog s potvrzením
         message = "NALEZENÉ ZMĚNY:\n\n"
         
+        if result['mode'] == 'manifest':
+            message += "ℹ️ Změny určeny z manifestu posledního nahrání (server nekontrolován)\n\n"
+        elif result['mode'] == 'git':
+            message += f"ℹ️ Změny určeny z Gitu od nahraného commitu {result['git_base'][:8]} (server nekontrolován)\n\n"
+        
         if files_to_upload:
             total_size = sum(f['size'] for f in files_to_upload)
             message += f"📤 NAHRÁT: {len(files_to_upload)} souborů ({self.format_size(total_size)})\n\n"
@@ -1624,92 +6572,213 @@ class FORTEftp(QMainWindow):
             return
         
         # Provést operace
+        task = self.engine.run(
+            self.run_sync_operations,
+            self.current_env,
+            result,
+            files_to_upload,
+            files_to_delete,
+            self.current_remote_path,
+            self.ftp_client,
+            self.sftp_client,
+            self.ssh_client,
+            on_success=lambda summary: (sync_progress.close(), self.show_sync_result(summary)),
+            on_error=lambda message: (sync_progress.close(), self.forget_remote_tree(), QMessageBox.critical(self, "Chyba", message)),
+            on_progress=lambda value, maximum, text: self.update_progress_dialog(sync_progress, value, maximum, text),
+            on_cancel=lambda: (sync_progress.close(), self.forget_remote_tree())
+        )
+        sync_progress = self.create_progress_dialog("Synchronizace", "Synchronizuji...", task)
+    
+    def run_sync_operations(self, task, env, analysis, files_to_upload, files_to_delete, remote_root, ftp_client=None, sftp_client=None, ssh_client=None):
+        """Nahrát a smazat vybrané soubory (běží na pozadí)"""
         total_operations = len(files_to_upload) + len(files_to_delete)
-        sync_progress = QProgressDialog("Synchronizuji...", "Zrušit", 0, total_operations, self)
-        sync_progress.setWindowModality(Qt.WindowModal)
-        sync_progress.setWindowTitle("Synchronizace")
         
         upload_success = 0
         delete_success = 0
         failed_files = []
+        deleted_paths = []
         current_op = 0
         
-        # Nahrát soubory
-        for idx, file_info in enumerate(files_to_upload):
-            if sync_progress.wasCanceled():
-                break
-            
-            sync_progress.setValue(current_op)
-            sync_progress.setLabelText(f"⬆️ Nahrávám ({idx + 1}/{len(files_to_upload)}): {file_info['rel_path']}")
-            QApplication.processEvents()
-            
+        # Nahrát soubory paralelně přes více spojení
+        pool = TransferPool(
+            env,
+            env.get('parallel_connections', DEFAULT_PARALLEL_CONNECTIONS),
+            remote_root,
+            ftp_client=ftp_client,
+            sftp_client=sftp_client,
+            known_dirs=analysis.get('remote_dirs'),
+            connections=self.connections
+        )
+        progress_lock = threading.Lock()
+        
+        def on_uploaded(file_info):
+            nonlocal current_op
+            with progress_lock:
+                current_op += 1
+                task.report(current_op, total_operations, f"⬆️ Nahrávám ({current_op}/{len(files_to_upload)}): {file_info['rel_path']}")
+        
+        tar_reported = 0
+        
+        def on_tar_sent(file_info):
+            nonlocal tar_reported
+            tar_reported += 1
+            on_uploaded(file_info)
+        
+        warnings = []
+        uploaded_files = []
+        pool_files = files_to_upload
+        
+        # Malé soubory přes SSH jedním archivem tar, velké paralelně po souborech
+        tar_mode = env.get('ssh_tar_upload', 'plain')
+        tar_files = [f for f in files_to_upload if f['size'] <= TAR_UPLOAD_MAX_FILE_SIZE]
+        if sftp_client and ssh_client and tar_mode and len(tar_files) >= TAR_UPLOAD_MIN_FILES:
+            compression = None if tar_mode == 'plain' else tar_mode
+            if compression == 'zstd' and zstandard is None:
+                warnings.append("Balíček zstandard není nainstalovaný, archiv se komprimuje přes gzip.")
+                compression = 'gzip'
             try:
-                if self.ftp_client:
-                    # Vytvořit vzdálené složky pokud neexistují
-                    remote_dir = '/'.join(file_info['remote'].split('/')[:-1])
-                    self.create_remote_directories_ftp(remote_dir)
-                    
-                    # Nahrát soubor
-                    with open(file_info['local'], 'rb') as f:
-                        filename = file_info['rel_path'].split('/')[-1]
-                        self.ftp_client.cwd(remote_dir if remote_dir else '/')
-                        self.ftp_client.storbinary(f'STOR {filename}', f)
-                        self.ftp_client.cwd(self.current_remote_path)
-                
-                elif self.sftp_client:
-                    # Vytvořit vzdálené složky pokud neexistují
-                    remote_dir = '/'.join(file_info['remote'].split('/')[:-1])
-                    self.create_remote_directories_sftp(remote_dir)
-                    
-                    # Nahrát soubor
-                    self.sftp_client.put(file_info['local'], file_info['remote'])
-                
-                upload_success += 1
-            
+                tar_result = upload_tar_ssh(ssh_client, remote_root, tar_files, task, on_tar_sent, compression)
+                if tar_result is None:
+                    warnings.append("Server nemá tar, soubory se nahrají jednotlivě přes SFTP.")
+            except OperationCancelled:
+                raise
             except Exception as e:
-                failed_files.append(('Nahrání', file_info['rel_path'], str(e)))
+                # Archiv se nemusel rozbalit celý - nahrát vše znovu po souborech
+                warnings.append(f"Hromadné nahrání přes tar selhalo, soubory se nahrají jednotlivě: {e}")
+                tar_result = None
+                # Průběh nahlášený za odeslané soubory vrátit - nahrají se znovu
+                with progress_lock:
+                    current_op -= tar_reported
+                    task.report(current_op, total_operations, "⬆️ Nahrávám soubory jednotlivě...", force=True)
             
-            current_op += 1
+            if tar_result is not None:
+                tar_uploaded, tar_failed = tar_result
+                uploaded_files.extend(tar_uploaded)
+                upload_success += len(tar_uploaded)
+                failed_files.extend(tar_failed)
+                tar_paths = {f['rel_path'] for f in tar_files}
+                pool_files = [f for f in files_to_upload if f['rel_path'] not in tar_paths]
+        
+        if pool_files:
+            upload_success += pool.upload(task, pool_files, on_uploaded)
+            failed_files.extend(pool.failed_files)
+        uploaded_files.extend(pool.uploaded_files)
         
         # Smazat soubory
         for idx, file_info in enumerate(files_to_delete):
-            if sync_progress.wasCanceled():
+            if task.is_cancelled():
                 break
             
-            sync_progress.setValue(current_op)
-            sync_progress.setLabelText(f"🗑️ Mažu ({idx + 1}/{len(files_to_delete)}): {file_info['rel_path']}")
-            QApplication.processEvents()
+            task.report(current_op, total_operations, f"🗑️ Mažu ({idx + 1}/{len(files_to_delete)}): {file_info['rel_path']}")
             
             try:
-                if self.ftp_client:
+                if ftp_client:
                     if file_info['is_dir']:
-                        self.delete_remote_dir_ftp(file_info['full_path'])
+                        self.delete_remote_dir_ftp(file_info['full_path'], ftp_client)
                     else:
-                        self.ftp_client.delete(file_info['full_path'])
+                        ftp_client.delete(file_info['full_path'])
                 
-                elif self.sftp_client:
+                elif sftp_client:
                     if file_info['is_dir']:
-                        self.delete_remote_dir_sftp(file_info['full_path'])
+                        self.delete_remote_dir_sftp(file_info['full_path'], sftp_client)
                     else:
-                        self.sftp_client.remove(file_info['full_path'])
+                        sftp_client.remove(file_info['full_path'])
                 
                 delete_success += 1
+                deleted_paths.append(file_info['rel_path'])
             
             except Exception as e:
                 failed_files.append(('Mazání', file_info['rel_path'], str(e)))
             
             current_op += 1
         
-        sync_progress.setValue(total_operations)
+        task.report(total_operations, total_operations, "Ukládám manifest...", force=True)
+        self.update_listing_cache(remote_root, uploaded_files, deleted_paths)
+        
+        warnings.extend(pool.warnings)
+        try:
+            self.record_sync_manifest(task, env, remote_root, analysis, uploaded_files, deleted_paths)
+            # Commit se zaznamená, jen pokud je na serveru celý navržený stav
+            complete = len(files_to_upload) == len(analysis.get('files_to_upload', files_to_upload))
+            if complete and not failed_files and not task.is_cancelled():
+                self.record_deployed_commit(task, env, remote_root, analysis)
+        except Exception as e:
+            warnings.append(f"Manifest se nepodařilo uložit: {e}")
+        
+        return {
+            'files_to_upload': files_to_upload,
+            'files_to_delete': files_to_delete,
+            'upload_success': upload_success,
+            'delete_success': delete_success,
+            'failed_files': failed_files,
+            'warnings': warnings,
+            'tls_stats': pool.tls_stats
+        }
+    
+    def update_listing_cache(self, remote_root, uploaded_files, deleted_paths):
+        """Promítnout nahrané a smazané soubory do uložených výpisů složek"""
+        base = remote_root.rstrip('/')
+        for file_info in uploaded_files:
+            self.listing_cache.add(f"{base}/{file_info['rel_path']}", False, file_info['size'])
+        for rel_path in deleted_paths:
+            self.listing_cache.remove(f"{base}/{rel_path}")
+    
+    def record_deployed_commit(self, task, env, remote_root, analysis):
+        """Zapsat nahraný Git commit po úplném nahrání (běží na pozadí)"""
+        if analysis.get('git_commit') and analysis['mode'] in ('full', 'git'):
+            SyncManifest().record_commit(env['name'], remote_root, analysis['git_commit'], analysis['git_extra'])
+    
+    def add_local_hashes(self, task, files, cancellable=True):
+        """Doplnit souborům pro manifest (dict s local, size, mtime_ns) blake2b hash lokální verze
+        
+        Bez hashe by compare_with_manifest po změně času (git checkout)
+        nepoznal nezměněný obsah a nahrál by soubor znovu.
+        """
+        missing = [f for f in files if not f.get('content_hash')]
+        if not missing:
+            return
+        hashes = LocalHashCache().hashes(
+            [{'path': f['local'], 'size': f['size'], 'mtime_ns': f['mtime_ns']} for f in missing],
+            'blake2b',
+            task if cancellable else None
+        )
+        for f in missing:
+            f['content_hash'] = hashes.get(f['local'])
+    
+    def record_sync_manifest(self, task, env, remote_root, analysis, uploaded_files, deleted_paths):
+        """Zapsat nahrané a smazané soubory do manifestu (běží na pozadí)"""
+        uploaded = [dict(file_info) for file_info in uploaded_files]
+        # Nahrané soubory se zapíšou i po zrušení - hash se nepřeruší
+        self.add_local_hashes(task, uploaded, cancellable=False)
+        if analysis['in_sync']:
+            try:
+                self.add_local_hashes(task, analysis['in_sync'])
+            except OperationCancelled:
+                # Zapíše se i tak - zůstanou hashe, které manifest už znal (record_deploy)
+                pass
+        
+        SyncManifest().record_deploy(
+            env['name'],
+            remote_root,
+            uploaded,
+            deleted_paths,
+            verified=analysis['mode'] == 'full',
+            in_sync=analysis['in_sync']
+        )
+    
+    def show_sync_result(self, summary):
+        """Zobrazit výsledek synchronizace"""
+        files_to_upload = summary['files_to_upload']
+        files_to_delete = summary['files_to_delete']
+        failed_files = summary['failed_files']
         
-        # Zobrazit výsledek
         result_msg = "VÝSLEDEK SYNCHRONIZACE:\n\n"
         
         if files_to_upload:
-            result_msg += f"⬆️ Nahráno: {upload_success}/{len(files_to_upload)} souborů\n"
+            result_msg += f"⬆️ Nahráno: {summary['upload_success']}/{len(files_to_upload)} souborů\n"
         
         if files_to_delete:
-            result_msg += f"🗑️ Smazáno: {delete_success}/{len(files_to_delete)} souborů\n"
+            result_msg += f"🗑️ Smazáno: {summary['delete_success']}/{len(files_to_delete)} souborů\n"
         
         if failed_files:
             result_msg += f"\n❌ Chyby ({len(failed_files)}):\n"
@@ -1718,6 +6787,17 @@ class FORTEftp(QMainWindow):
             if len(failed_files) > 5:
                 result_msg += f"  ... a {len(failed_files) - 5} dalších\n"
         
+        tls_stats = summary.get('tls_stats') or {}
+        if tls_stats.get('handshakes'):
+            average = tls_stats['handshake_time'] / tls_stats['handshakes'] * 1000
+            result_msg += (
+                f"\n🔒 TLS datová spojení: {tls_stats['handshakes']} handshaků, "
+                f"{tls_stats['reused']} s obnovenou relací, průměrně {average:.0f} ms\n"
+            )
+        
+        for warning in summary.get('warnings', []):
+            result_msg += f"\n⚠️ {warning}"
+        
         if not failed_files:
             result_msg += "\n✅ Synchronizace dokončena bez chyb!"
         
@@ -1844,161 +6924,70 @@ class FORTEftp(QMainWindow):
 
         return selected_files
     
-    def create_remote_directories_ftp(self, path):
+    def create_remote_directories_ftp(self, path, ftp_client=None, known_dirs=None):
         """Vytvořit vzdálené složky přes FTP"""
-        if not path or path == '/':
-            return
-        
-        parts = path.strip('/').split('/')
-        current = ''
-        
-        for part in parts:
-            current += '/' + part
-            try:
-                self.ftp_client.cwd(current)
-            except:
-                try:
-                    self.ftp_client.mkd(current)
-                except:
-                    pass
+        ensure_remote_dirs_ftp(ftp_client or self.ftp_client, path, known_dirs)
     
-    def create_remote_directories_sftp(self, path):
+    def create_remote_directories_sftp(self, path, sftp_client=None, known_dirs=None):
         """Vytvořit vzdálené složky přes SFTP"""
-        if not path or path == '/':
-            return
-        
-        parts = path.strip('/').split('/')
-        current = ''
-        
-        for part in parts:
-            current += '/' + part
-            try:
-                self.sftp_client.stat(current)
-            except:
-                try:
-                    self.sftp_client.mkdir(current)
-                except:
-                    pass
-    
-    def get_all_remote_files_ftp(self, base_path):
-        """Získat seznam všech vzdálených souborů přes FTP (rekurzivně)"""
-        all_files = []
-        
-        def scan_directory(path):
-            try:
-                self.ftp_client.cwd(path)
-                items = []
-                self.ftp_client.dir(items.append)
-                
-                for item in items:
-                    parts = item.split()
-                    if len(parts) < 9:
-                        continue
-                    
-                    name = " ".join(parts[8:])
-                    if name in ['.', '..']:
-                        continue
-                    
-                    full_path = f"{path.rstrip('/')}/{name}"
-                    rel_path = full_path.replace(base_path.rstrip('/') + '/', '', 1)
-                    
-                    is_dir = item.startswith('d')
-                    
-                    all_files.append({
-                        'rel_path': rel_path,
-                        'full_path': full_path,
-                        'is_dir': is_dir
-                    })
-                    
-                    if is_dir:
-                        scan_directory(full_path)
-            except:
-                pass
-        
-        scan_directory(base_path)
-        return all_files
-    
-    def get_all_remote_files_sftp(self, base_path):
-        """Získat seznam všech vzdálených souborů přes SFTP (rekurzivně)"""
-        all_files = []
-        
-        def scan_directory(path):
-            try:
-                for item in self.sftp_client.listdir_attr(path):
-                    full_path = f"{path.rstrip('/')}/{item.filename}"
-                    rel_path = full_path.replace(base_path.rstrip('/') + '/', '', 1)
-                    
-                    is_dir = stat.S_ISDIR(item.st_mode)
-                    
-                    all_files.append({
-                        'rel_path': rel_path,
-                        'full_path': full_path,
-                        'is_dir': is_dir
-                    })
-                    
-                    if is_dir:
-                        scan_directory(full_path)
-            except:
-                pass
-        
-        scan_directory(base_path)
-        return all_files
+        ensure_remote_dirs_sftp(sftp_client or self.sftp_client, path, known_dirs)
     
-    def delete_remote_dir_ftp(self, path):
+    def delete_remote_dir_ftp(self, path, ftp_client=None):
         """Smazat složku a veškerý obsah přes FTP"""
+        ftp_client = ftp_client or self.ftp_client
         try:
-            items = []
-            self.ftp_client.cwd(path)
-            self.ftp_client.dir(items.append)
-            
-            for item in items:
-                parts = item.split()
-                if len(parts) < 9:
-                    continue
+            for entry in read_ftp_directory(ftp_client, path):
+                full_path = f"{path.rstrip('/')}/{entry.name}"
                 
-                name = " ".join(parts[8:])
-                if name in ['.', '..']:
-                    continue
-                
-                full_path = f"{path.rstrip('/')}/{name}"
-                
-                if item.startswith('d'):
-                    self.delete_remote_dir_ftp(full_path)
+                # Odkaz na složku se maže jako soubor, obsah cíle zůstane
+                if entry.is_dir:
+                    self.delete_remote_dir_ftp(full_path, ftp_client)
                 else:
-                    self.ftp_client.delete(full_path)
+                    ftp_client.delete(full_path)
             
             # Vrátit se zpět a smazat prázdnou složku
             parent = '/'.join(path.rstrip('/').split('/')[:-1])
             if parent:
-                self.ftp_client.cwd(parent)
+                ftp_client.cwd(parent)
             else:
-                self.ftp_client.cwd('/')
-            self.ftp_client.rmd(path)
+                ftp_client.cwd('/')
+            ftp_client.rmd(path)
         except:
             pass
     
-    def delete_remote_dir_sftp(self, path):
+    def delete_remote_dir_sftp(self, path, sftp_client=None):
         """Smazat složku a veškerý obsah přes SFTP"""
+        sftp_client = sftp_client or self.sftp_client
         try:
-            for item in self.sftp_client.listdir_attr(path):
+            for item in sftp_client.listdir_attr(path):
                 full_path = f"{path.rstrip('/')}/{item.filename}"
                 
                 if stat.S_ISDIR(item.st_mode):
-                    self.delete_remote_dir_sftp(full_path)
+                    self.delete_remote_dir_sftp(full_path, sftp_client)
                 else:
-                    self.sftp_client.remove(full_path)
+                    sftp_client.remove(full_path)
             
-            self.sftp_client.rmdir(path)
+            sftp_client.rmdir(path)
         except:
             pass
     
     def closeEvent(self, event):
         """Uzavření aplikace"""
+        self.engine.cancel_all()
         self.disconnect()
+        self.engine.wait_all()
+        self.connections.close_all()
+        if self.git_backend is not None:
+            self.git_backend.close()
+        if self.local_index is not None:
+            self.local_index.close()
         event.accept()
 
 
 def main():
+    # Hashování souborů běží v procesech, zabalené .exe je musí umět spustit
+    multiprocessing.freeze_support()
+    
     app = QApplication(sys.argv)
     app.setStyle('Fusion')
     
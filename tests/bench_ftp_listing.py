@@ -0,0 +1,75 @@
+"""Propustnost rozboru výpisů FTP složek na výpisu s milionem řádků
+
+Řádky se skládají z korpusu v tests/listing_corpus se zaručeně unikátními
+názvy. Spuštění:
+
+    python tests/bench_ftp_listing.py [--lines 1000000] [--min-rate 100000]
+
+S --min-rate skončí chybou, pokud některý formát klesne pod daný počet
+řádků za sekundu.
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import FORTEftp  # noqa: E402
+
+CORPUS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "listing_corpus")
+
+
+def corpus_lines(name):
+    with open(os.path.join(CORPUS_DIR, name), encoding="utf-8", newline="") as f:
+        return [line for line in f.read().split("\r\n") if line]
+
+
+def build_listing(name, count):
+    """count řádků z korpusu, každý s jiným názvem (konec řádku je název)"""
+    base = corpus_lines(name)
+    return [f"{base[i % len(base)]}-{i}" for i in range(count)]
+
+
+def parse_mlsd_lines(lines):
+    entries = []
+    for line in lines:
+        facts_found, _, name = line.partition(' ')
+        facts = {}
+        for fact in facts_found[:-1].split(";"):
+            key, _, value = fact.partition("=")
+            facts[key.lower()] = value
+        entry = FORTEftp.parse_mlsd_entry(name, facts)
+        if entry is not None:
+            entries.append(entry)
+    return entries
+
+
+def measure(label, func, lines):
+    start = time.perf_counter()
+    entries = func(lines)
+    elapsed = time.perf_counter() - start
+    rate = len(lines) / elapsed
+    print(f"{label:10} {len(lines):>9} řádků  {len(entries):>9} položek  {elapsed:6.2f} s  {rate:>10,.0f} řádků/s")
+    return rate
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--lines", type=int, default=1000000)
+    parser.add_argument("--min-rate", type=float, default=0)
+    args = parser.parse_args()
+
+    rates = [
+        measure("Unix ls", FORTEftp.parse_ftp_listing, build_listing("unix_ls.txt", args.lines)),
+        measure("DOS/IIS", FORTEftp.parse_ftp_listing, build_listing("dos_iis.txt", args.lines)),
+        # Rozbor faktů dělá ftplib, měří se celá cesta od řádku po ListingEntry
+        measure("MLSD", parse_mlsd_lines, build_listing("mlsd.txt", args.lines)),
+    ]
+    if args.min_rate and min(rates) < args.min_rate:
+        print(f"Pod požadovanou propustností {args.min_rate:,.0f} řádků/s")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
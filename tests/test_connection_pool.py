@@ -0,0 +1,176 @@
+"""Pool teplých spojení a obnovení spadlého FTP spojení
+
+Spuštění: python -m pytest tests
+"""
+
+import ftplib
+import os
+import sys
+
+import pytest
+
+pytest.importorskip("PyQt5")
+pytest.importorskip("paramiko")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import FORTEftp  # noqa: E402
+
+
+def make_env(**overrides):
+    env = {
+        'name': "Produkce",
+        'type': "FTP",
+        'host': "ftp.example.com",
+        'port': 21,
+        'user': "deploy",
+        'password': "heslo",
+        'parallel_connections': 2,
+    }
+    env.update(overrides)
+    return env
+
+
+class FakeSession:
+    """Spojení bez sítě - pamatuje si, zda žije a zda bylo zavřeno"""
+
+    created = []
+
+    def __init__(self, env):
+        self.env = env
+        self.alive = True
+        self.closed = False
+        FakeSession.created.append(self)
+
+    def connect(self):
+        pass
+
+    def is_alive(self):
+        return self.alive
+
+    def keepalive(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    FakeSession.created = []
+    monkeypatch.setattr(FORTEftp, "FTPSession", FakeSession)
+    monkeypatch.setattr(FORTEftp, "SSHSession", FakeSession)
+    pool = FORTEftp.ConnectionPool()
+    yield pool
+    pool.close_all()
+
+
+def test_key_separates_servers_and_logins():
+    key = FORTEftp.ConnectionPool.key
+    assert key(make_env()) == key(make_env(name="Jiný název", parallel_connections=8))
+    assert key(make_env()) != key(make_env(password="nové"))
+    assert key(make_env()) != key(make_env(port=990))
+    assert key(make_env()) != key(make_env(type="SFTP (SSH)"))
+
+
+def test_released_session_is_reused(pool):
+    session = pool.acquire(make_env())
+    pool.release(session)
+
+    # Stejný server pod jiným názvem prostředí - spojení se použije znovu
+    renamed = make_env(name="Kopie")
+    assert pool.acquire(renamed) is session
+    assert session.env is renamed
+    assert len(FakeSession.created) == 1
+
+
+def test_other_login_gets_new_session(pool):
+    session = pool.acquire(make_env())
+    pool.release(session)
+
+    other = pool.acquire(make_env(user="jiny"))
+    assert other is not session
+    assert len(FakeSession.created) == 2
+
+
+def test_dead_idle_session_is_replaced(pool):
+    session = pool.acquire(make_env())
+    pool.release(session)
+    session.alive = False
+
+    fresh = pool.acquire(make_env())
+    assert fresh is not session
+    assert session.closed
+
+
+def test_surplus_idle_sessions_are_closed(pool):
+    # Čekat smí parallel_connections + 1 spojení, nejstarší se zavřou
+    sessions = [pool.acquire(make_env()) for _ in range(5)]
+    for session in sessions:
+        pool.release(session)
+
+    assert [session.closed for session in sessions] == [True, True, False, False, False]
+
+
+def test_closed_session_is_not_pooled(pool):
+    session = pool.acquire(make_env())
+    session.closed = True
+    pool.release(session)
+
+    assert pool.acquire(make_env()) is not session
+
+
+class FlakyFTP:
+    """ftplib klient, kterému server jednou ukončí spojení (421)"""
+
+    def __init__(self, fail):
+        self.fail = set(fail)
+        self.calls = []
+
+    def _call(self, name, *args):
+        self.calls.append((name,) + args)
+        if name in self.fail:
+            self.fail.discard(name)
+            raise ftplib.error_temp("421 Timeout - closing control connection")
+        return "250 OK"
+
+    def cwd(self, path):
+        return self._call('cwd', path)
+
+    def nlst(self, path):
+        return self._call('nlst', path)
+
+    def storbinary(self, command, f):
+        return self._call('storbinary', command)
+
+    def close(self):
+        pass
+
+
+def test_session_reconnects_and_retries_commands(monkeypatch):
+    clients = [FlakyFTP(fail={'nlst'}), FlakyFTP(fail=())]
+    monkeypatch.setattr(FORTEftp, "open_ftp_connection", lambda env: clients.pop(0))
+    session = FORTEftp.FTPSession(make_env())
+    session.connect()
+    first = session.client
+
+    session.cwd("/www")
+    assert session.nlst("/www") == "250 OK"
+
+    assert session.reconnects == 1
+    # Nové spojení se vrátilo do poslední složky a příkaz zopakovalo
+    assert session.client.calls == [('cwd', "/www"), ('nlst', "/www")]
+    assert first.calls[-1] == ('nlst', "/www")
+
+
+def test_session_does_not_repeat_transfers(monkeypatch):
+    clients = [FlakyFTP(fail={'storbinary'}), FlakyFTP(fail=())]
+    monkeypatch.setattr(FORTEftp, "open_ftp_connection", lambda env: clients.pop(0))
+    session = FORTEftp.FTPSession(make_env())
+    session.connect()
+
+    with pytest.raises(ftplib.error_temp):
+        session.storbinary("STOR index.php", None)
+
+    # Spojení je obnovené, ale data se podruhé neposlala
+    assert session.reconnects == 1
+    assert session.client.calls == []
@@ -0,0 +1,212 @@
+"""Rozbor výpisů FTP složek (MLSD, unixový ls -l, DOS/IIS) nad korpusem skutečných výpisů
+
+Spuštění: python -m pytest tests
+"""
+
+import calendar
+import os
+import sys
+
+import pytest
+
+pytest.importorskip("PyQt5")
+pytest.importorskip("paramiko")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import FORTEftp  # noqa: E402
+
+CORPUS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "listing_corpus")
+
+# "Teď" pro výpisy bez roku - soubory po tomto datu patří do loňska
+NOW = calendar.timegm((2024, 6, 1, 0, 0, 0))
+
+
+def utc(*parts):
+    return calendar.timegm(parts + (0,) * (6 - len(parts)))
+
+
+def corpus_lines(name):
+    with open(os.path.join(CORPUS_DIR, name), encoding="utf-8", newline="") as f:
+        return f.read().split("\r\n")[:-1]
+
+
+def mlsd_records(name):
+    """Řádky MLSD rozebrané stejně jako ftplib.FTP.mlsd"""
+    for line in corpus_lines(name):
+        facts_found, _, entry_name = line.partition(' ')
+        facts = {}
+        for fact in facts_found[:-1].split(";"):
+            key, _, value = fact.partition("=")
+            facts[key.lower()] = value
+        yield entry_name, facts
+
+
+def as_tuple(entry):
+    return (entry.name, entry.kind, entry.size, entry.mtime, entry.target)
+
+
+def test_unix_listing():
+    entries = [
+        FORTEftp.parse_list_line(line, NOW) for line in corpus_lines("unix_ls.txt")
+    ]
+    assert [as_tuple(entry) for entry in entries if entry] == [
+        ("public_html", "dir", None, utc(2024, 3, 15, 10, 5), None),
+        ("backup.tar.gz", "file", 12345, utc(2021, 1, 2), None),
+        # Datum bez roku v budoucnosti patří do loňska
+        ("index.php", "file", 512, utc(2023, 11, 30, 23, 59), None),
+        ("current", "link", 11, utc(2022, 2, 28), "releases/42"),
+        ("  leading spaces.txt", "file", 10, utc(2024, 5, 20, 12, 0), None),
+        ("acl.txt", "file", 100, utc(1999, 12, 31), None),
+        ("big.iso", "file", 5368709120, utc(2023, 8, 1), None),
+        ("deploy.sh", "file", 77, utc(2020, 10, 10), None),
+        ("no group column", "file", 33, utc(2023, 9, 9, 9, 9), None),
+        ("name  with  double  spaces", "file", 0, utc(2024, 1, 1), None),
+    ]
+    # total, '.', '..', prázdný řádek a hláška serveru se přeskočí
+    assert sum(entry is None for entry in entries) == 5
+
+
+def test_dos_listing():
+    entries = [FORTEftp.parse_list_line(line, NOW) for line in corpus_lines("dos_iis.txt")]
+    assert [as_tuple(entry) for entry in entries if entry] == [
+        ("aspnet_client", "dir", None, utc(2024, 3, 15, 10, 5), None),
+        ("web.config", "file", 1234, utc(2024, 3, 15, 14, 30), None),
+        # 12:00AM je půlnoc, 12:45PM poledne
+        ("old.txt", "file", 17, utc(1999, 12, 1, 0, 0), None),
+        ("Folder With Spaces", "dir", None, utc(2023, 1, 2, 12, 15), None),
+        ("noon.txt", "file", 0, utc(2021, 7, 4, 12, 45), None),
+        ("24h clock.bin", "file", 2048, utc(2020, 11, 11, 23, 10), None),
+    ]
+    assert entries[-1] is None
+
+
+def test_mlsd_listing():
+    entries = [
+        FORTEftp.parse_mlsd_entry(name, facts) for name, facts in mlsd_records("mlsd.txt")
+    ]
+    assert [as_tuple(entry) for entry in entries if entry] == [
+        ("releases", "dir", None, utc(2024, 1, 1, 12, 0), None),
+        ("archive.zip", "file", 1048576, utc(2024, 3, 15, 10, 5, 1), None),
+        ("current", "link", None, utc(2023, 1, 1), "/var/www/current"),
+        ("dangling", "link", None, utc(2023, 1, 1), None),
+        ("leap.txt", "file", 0, utc(2024, 2, 29, 23, 59, 59), None),
+        (" leading space.txt", "file", 42, utc(2024, 1, 1), None),
+        ("numeric.txt", "file", 7, utc(2022, 1, 1), None),
+        ("no-modify.txt", "file", 5, None, None),
+    ]
+    # cdir a pdir se přeskočí
+    assert entries[:2] == [None, None]
+
+
+@pytest.mark.parametrize("line", [
+    "-rw-r--r--    1 user     group          10 Foo 15 10:05 bad-month",
+    "-rw-r--r--    1 user     group          10 Mar 45 10:05 bad-day",
+    "13-45-24  10:05AM                 1234 bad-date.txt",
+])
+def test_invalid_dates_keep_entry_without_time(line):
+    entry = FORTEftp.parse_list_line(line, NOW)
+    assert entry is not None and entry.name.startswith("bad-")
+    assert entry.mtime is None
+
+
+def test_garbage_is_skipped():
+    for line in ["", "total 0", "ls: cannot open directory", "drwx", "-" * 200]:
+        assert FORTEftp.parse_list_line(line, NOW) is None
+
+
+def test_list_tuples_drop_list_times():
+    """list_ftp_directory používá čas jen z MLSD - LIST je v lokální zóně serveru"""
+    class FakeFTP:
+        def sendcmd(self, command):
+            return "211-Features:\n UTF8\n211 End"
+
+        def cwd(self, path):
+            pass
+
+        def dir(self, callback):
+            for line in corpus_lines("unix_ls.txt"):
+                callback(line)
+
+    result = FORTEftp.list_ftp_directory(FakeFTP(), "/")
+    assert ("public_html", True, None, None) in result
+    assert ("backup.tar.gz", False, 12345, None) in result
+
+
+def test_index_keeps_list_times_for_comparison():
+    """Přibližný čas z LIST rozhodne bez MDTM, pokud není v pásmu nejistoty"""
+    class FakeFTP:
+        mdtm = []
+        path = "/"
+
+        def sendcmd(self, command):
+            return "211-Features:\n MDTM\n211 End"
+
+        def voidcmd(self, command):
+            self.mdtm.append(command)
+            return "213 20240520120000"
+
+        def cwd(self, path):
+            self.path = path
+
+        def dir(self, callback):
+            # Výpis z korpusu jen pro kořen, podsložky jsou prázdné
+            if self.path != "/www":
+                return
+            for line in corpus_lines("unix_ls.txt"):
+                callback(line)
+
+    ftp = FakeFTP()
+    index = FORTEftp.RemoteIndex.from_ftp(ftp, "/www")
+    # Unixový výpis s rokem má přesnost na den, s časem na minuty
+    assert index.list_times["backup.tar.gz"] == (utc(2021, 1, 2), 86400)
+    assert index.list_times["index.php"][1] == 60
+    assert "public_html" not in index.list_times
+
+    def compare(rel_path, local_mtime):
+        remote_entry = index.get(rel_path)
+        local_file = {'rel_path': rel_path, 'size': remote_entry[0], 'mtime': local_mtime}
+        return FORTEftp.FORTEftp.compare_with_remote(None, local_file, remote_entry, "/www", ftp, index.list_times)
+
+    listed = utc(2021, 1, 2)
+    # Zjevně novější lokální soubor i zjevně starší se rozhodnou bez MDTM
+    assert compare("backup.tar.gz", listed + 3 * 86400) == "Novější verze"
+    assert compare("backup.tar.gz", listed - 2 * 86400) is None
+    assert ftp.mdtm == []
+    # V pásmu nejistoty se čas doptá přes MDTM
+    assert compare("backup.tar.gz", listed + 3600) is None
+    assert ftp.mdtm == ["MDTM /www/backup.tar.gz"]
+
+
+def test_index_keeps_links_apart():
+    """Odkaz z LIST (i na složku) se v indexu neobjeví jako soubor a nenačítá se"""
+    class FakeFTP:
+        path = "/"
+        listed = []
+
+        def sendcmd(self, command):
+            return "211-Features:\n UTF8\n211 End"
+
+        def cwd(self, path):
+            self.path = path
+
+        def dir(self, callback):
+            self.listed.append(self.path)
+            if self.path != "/www":
+                return
+            for line in corpus_lines("unix_ls.txt"):
+                callback(line)
+
+    ftp = FakeFTP()
+    index = FORTEftp.RemoteIndex.from_ftp(ftp, "/www")
+    assert index.links == {"current"}
+    assert index.get("current") is None
+    assert "/www/current" not in ftp.listed
+    assert index.link_for("current/index.php") == "current"
+    assert index.link_for("currently.txt") is None
+
+    # find -printf '%P\t%s\t%T@\t%y' hlásí odkaz typem l
+    index = FORTEftp.RemoteIndex("/www")
+    index.add_find_record(b"current\t11\t1700000000.0\tl")
+    index.add_find_record(b"index.php\t512\t1700000000.0\tf")
+    assert index.links == {"current"}
+    assert set(index.entries) == {"index.php"}
@@ -0,0 +1,96 @@
+"""Stav Git repozitáře z git status --porcelain=v2 a git for-each-ref
+
+Výstupy jsou zachycené z git 2.39.
+Spuštění: python -m pytest tests
+"""
+
+import os
+import sys
+
+import pytest
+
+pytest.importorskip("PyQt5")
+pytest.importorskip("paramiko")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import FORTEftp  # noqa: E402
+
+OID = "38056808e2938ea5f35dcf15afbcc2f9e68901f7"
+BLOB = "78981922613b2afb6025042ff6bd878ac1994e85"
+RENAMED_BLOB = "61780798228d17af2d34fce4cfbdf35556832472"
+
+# git status --porcelain=v2 --branch -z: změna v pracovní složce, přejmenování
+# (cesta s mezerou, původní cesta jako další pole), nový soubor v indexu, nesledovaný
+STATUS = (
+    f"# branch.oid {OID}\0"
+    "# branch.head master\0"
+    "# branch.upstream origin/master\0"
+    "# branch.ab +1 -0\0"
+    f"1 .M N... 100644 100644 100644 {BLOB} {BLOB} a.txt\0"
+    f"2 R. N... 100644 100644 100644 {RENAMED_BLOB} {RENAMED_BLOB} R100 b c.txt\0b.txt\0"
+    "1 A. N... 000000 100644 100644 0000000000000000000000000000000000000000 "
+    "b4785957bc986dc39c629de9fac9df46972c00fc staged.txt\0"
+    "? new.txt\0"
+)
+
+# git for-each-ref --format=%(HEAD)%00%(refname:short)%00%(upstream:short)%00%(upstream:track)
+BRANCHES = " \0feature\0\0\n*\0master\0origin/master\0[ahead 1]\n"
+
+
+def test_parse_branch_and_changes():
+    state = FORTEftp.GitRepoState.parse(STATUS, BRANCHES)
+
+    assert state.head == "master"
+    assert state.oid == OID
+    assert state.upstream == "origin/master"
+    assert (state.ahead, state.behind) == (1, 0)
+    assert state.changes == [
+        (".M", "a.txt", None),
+        ("R.", "b c.txt", "b.txt"),
+        ("A.", "staged.txt", None),
+        ("??", "new.txt", None),
+    ]
+    assert state.branches == [("feature", None, ""), ("master", "origin/master", "[ahead 1]")]
+
+
+def test_format_status():
+    state = FORTEftp.GitRepoState.parse(STATUS, BRANCHES)
+
+    assert state.format_status().splitlines() == [
+        "## master...origin/master [ahead 1]",
+        " M a.txt",
+        "R  b.txt -> b c.txt",
+        "A  staged.txt",
+        "?? new.txt",
+    ]
+
+
+def test_parse_behind_and_conflict():
+    status = (
+        f"# branch.oid {OID}\0"
+        "# branch.head feature\0"
+        "# branch.upstream origin/feature\0"
+        "# branch.ab +0 -3\0"
+        f"u UU N... 100644 100644 100644 100644 {BLOB} {BLOB} {BLOB} src/conflict with spaces.php\0"
+    )
+    state = FORTEftp.GitRepoState.parse(status, "*\0feature\0origin/feature\0[behind 3]\n")
+
+    assert (state.ahead, state.behind) == (0, 3)
+    assert state.changes == [("UU", "src/conflict with spaces.php", None)]
+    assert state.format_status().splitlines()[0] == "## feature...origin/feature [behind 3]"
+
+
+def test_parse_detached_head():
+    status = f"# branch.oid {OID}\0# branch.head (detached)\0"
+    state = FORTEftp.GitRepoState.parse(status, " \0master\0origin/master\0\n")
+
+    assert state.detached
+    assert state.format_status() == "## HEAD (žádná větev)\nČistý stav."
+
+
+def test_parse_initial_commit():
+    state = FORTEftp.GitRepoState.parse("# branch.oid (initial)\0# branch.head main\0? a.txt\0", "")
+
+    assert state.oid is None
+    assert state.head == "main"
+    assert state.format_status().splitlines() == ["## Zatím bez commitů na main", "?? a.txt"]
@@ -0,0 +1,124 @@
+"""Stránkované čtení výstupu Gitu (StreamGate a stream_git_lines)
+
+Spuštění: python -m pytest tests
+"""
+
+import os
+import shutil
+import subprocess
+import sys
+import threading
+import time
+
+import pytest
+
+pytest.importorskip("PyQt5")
+pytest.importorskip("paramiko")
+if shutil.which("git") is None:
+    pytest.skip("git není nainstalovaný", allow_module_level=True)
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import FORTEftp  # noqa: E402
+
+
+class FakeTask:
+    """Úloha bez Qt - dávky si jen schová"""
+
+    def __init__(self):
+        self.lines = []
+        self.cancel_event = threading.Event()
+
+    def is_cancelled(self):
+        return self.cancel_event.is_set()
+
+    def check_cancelled(self):
+        if self.cancel_event.is_set():
+            raise FORTEftp.OperationCancelled()
+
+    def emit_partial(self, batch):
+        self.lines.extend(batch)
+
+
+def git(root, *args):
+    subprocess.run(
+        ["git", "-C", str(root), "-c", "user.name=Test", "-c", "user.email=test@example.com"] + list(args),
+        check=True, stdout=subprocess.DEVNULL
+    )
+
+
+@pytest.fixture
+def repo(tmp_path):
+    git(tmp_path, "init", "-q")
+    for number in range(10):
+        git(tmp_path, "commit", "-q", "--allow-empty", "-m", f"commit {number}")
+    return tmp_path
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def start_stream(task, root, args, gate):
+    result = {}
+
+    def run():
+        try:
+            result['count'] = FORTEftp.stream_git_lines(task, str(root), args, gate)
+        except BaseException as e:
+            result['error'] = e
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    return thread, result
+
+
+def test_stream_reads_only_requested_pages(repo, monkeypatch):
+    monkeypatch.setattr(FORTEftp, "GIT_VIEW_BATCH_LINES", 2)
+    task = FakeTask()
+    gate = FORTEftp.StreamGate(4)
+
+    thread, result = start_stream(task, repo, ["log", "--format=%s"], gate)
+    wait_for(lambda: len(task.lines) == 4)
+    time.sleep(0.3)
+    # Čtení stojí na bráně, dokud GUI nepožádá o další stránku
+    assert len(task.lines) == 4 and thread.is_alive()
+
+    gate.request(4)
+    wait_for(lambda: len(task.lines) == 8)
+    gate.request(100)
+    thread.join(5)
+
+    assert result == {'count': 10}
+    assert task.lines == [f"commit {number}" for number in reversed(range(10))]
+
+
+def test_stream_cancel_while_waiting(repo, monkeypatch):
+    monkeypatch.setattr(FORTEftp, "GIT_VIEW_BATCH_LINES", 2)
+    task = FakeTask()
+    gate = FORTEftp.StreamGate(2)
+
+    thread, result = start_stream(task, repo, ["log", "--format=%s"], gate)
+    wait_for(lambda: len(task.lines) == 2)
+    task.cancel_event.set()
+    thread.join(5)
+
+    assert not thread.is_alive()
+    assert isinstance(result['error'], FORTEftp.OperationCancelled)
+
+
+def test_stream_truncates_long_lines(repo, monkeypatch):
+    monkeypatch.setattr(FORTEftp, "GIT_VIEW_MAX_LINE_CHARS", 6)
+    task = FakeTask()
+
+    count = FORTEftp.stream_git_lines(task, str(repo), ["log", "-1", "--format=%s"], FORTEftp.StreamGate(100))
+
+    assert count == 1
+    assert task.lines == ["commit … (zkráceno, 8 znaků)"]
+
+
+def test_stream_reports_git_error(repo):
+    with pytest.raises(RuntimeError, match="neexistuje|unknown revision|bad revision"):
+        FORTEftp.stream_git_lines(FakeTask(), str(repo), ["log", "neexistuje"], FORTEftp.StreamGate(100))
@@ -0,0 +1,95 @@
+"""Cache hashů lokálních souborů - co se přepočítá a co ne
+
+Spuštění: python -m pytest tests
+"""
+
+import hashlib
+import os
+import sys
+
+import pytest
+
+pytest.importorskip("PyQt5")
+pytest.importorskip("paramiko")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import FORTEftp  # noqa: E402
+
+
+@pytest.fixture
+def hashed(monkeypatch):
+    """Cesty souborů, které se opravdu četly"""
+    paths = []
+    real_hash_file = FORTEftp.hash_file
+
+    def counting_hash_file(path, algorithm='blake2b'):
+        paths.append(path)
+        return real_hash_file(path, algorithm)
+
+    monkeypatch.setattr(FORTEftp, "hash_file", counting_hash_file)
+    return paths
+
+
+def file_info(path):
+    st = os.stat(path)
+    return {'path': str(path), 'size': st.st_size, 'mtime_ns': st.st_mtime_ns}
+
+
+def test_unchanged_files_are_not_read_again(tmp_path, hashed):
+    cache = FORTEftp.LocalHashCache(str(tmp_path / "cache.sqlite"))
+    a = tmp_path / "a.txt"
+    b = tmp_path / "b.txt"
+    a.write_bytes(b"alfa")
+    b.write_bytes(b"beta")
+
+    first = cache.hashes([file_info(a), file_info(b)])
+    assert first == {str(a): hashlib.blake2b(b"alfa").hexdigest(), str(b): hashlib.blake2b(b"beta").hexdigest()}
+    assert sorted(hashed) == sorted([str(a), str(b)])
+
+    hashed.clear()
+    assert cache.hashes([file_info(a), file_info(b)]) == first
+    assert hashed == []
+
+
+def test_changed_size_or_mtime_invalidates(tmp_path, hashed):
+    cache = FORTEftp.LocalHashCache(str(tmp_path / "cache.sqlite"))
+    a = tmp_path / "a.txt"
+    b = tmp_path / "b.txt"
+    a.write_bytes(b"alfa")
+    b.write_bytes(b"beta")
+    cache.hashes([file_info(a), file_info(b)])
+    hashed.clear()
+
+    # Jiná velikost
+    a.write_bytes(b"alfa 2")
+    # Stejná velikost, jiný čas změny
+    b.write_bytes(b"BETA")
+    st = os.stat(b)
+    os.utime(b, ns=(st.st_atime_ns, st.st_mtime_ns + 5_000_000_000))
+
+    result = cache.hashes([file_info(a), file_info(b)])
+
+    assert sorted(hashed) == sorted([str(a), str(b)])
+    assert result[str(a)] == hashlib.blake2b(b"alfa 2").hexdigest()
+    assert result[str(b)] == hashlib.blake2b(b"BETA").hexdigest()
+
+
+def test_algorithms_are_cached_separately(tmp_path, hashed):
+    cache = FORTEftp.LocalHashCache(str(tmp_path / "cache.sqlite"))
+    a = tmp_path / "a.txt"
+    a.write_bytes(b"alfa")
+
+    cache.hashes([file_info(a)], 'blake2b')
+    result = cache.hashes([file_info(a)], 'sha256')
+
+    assert result == {str(a): hashlib.sha256(b"alfa").hexdigest()}
+    assert len(hashed) == 2
+
+
+def test_unreadable_file_is_left_out(tmp_path):
+    cache = FORTEftp.LocalHashCache(str(tmp_path / "cache.sqlite"))
+    missing = {'path': str(tmp_path / "zmizel.txt"), 'size': 4, 'mtime_ns': 1}
+
+    assert cache.hashes([missing]) == {}
+    # Chybějící hash se neuloží, příště se zkusí znovu
+    assert cache.hashes([missing]) == {}
@@ -0,0 +1,87 @@
+"""Index vzdáleného stromu přes SSH find
+
+Spuštění: python -m pytest tests
+"""
+
+import os
+import socket
+import sys
+
+import pytest
+
+pytest.importorskip("PyQt5")
+pytest.importorskip("paramiko")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import FORTEftp  # noqa: E402
+
+
+class FakeChannel:
+    """Kanál, jehož find pokračuje až po vybrání stderr (plné okno kanálu)"""
+
+    def __init__(self, stdout, stderr_chunks, exit_status=0):
+        self.stdout = [stdout]
+        self.stderr_chunks = list(stderr_chunks)
+        self.exit_status = exit_status
+        self.timeout = None
+
+    def settimeout(self, timeout):
+        self.timeout = timeout
+
+    def recv_stderr_ready(self):
+        return bool(self.stderr_chunks)
+
+    def recv_stderr(self, size):
+        return self.stderr_chunks.pop(0)
+
+    def recv(self, size):
+        if self.stderr_chunks:
+            # find stojí na zápisu do stderr - bez timeoutu by recv visel navždy
+            assert self.timeout is not None
+            raise socket.timeout()
+        return self.stdout.pop(0) if self.stdout else b''
+
+    def recv_exit_status(self):
+        return self.exit_status
+
+    def close(self):
+        pass
+
+
+class FakeStream:
+    def __init__(self, channel, data=b''):
+        self.channel = channel
+        self.data = data
+
+    def read(self):
+        return self.data
+
+    def close(self):
+        pass
+
+
+class FakeSSH:
+    def __init__(self, channel):
+        self.channel = channel
+        self.commands = []
+
+    def exec_command(self, command):
+        self.commands.append(command)
+        return FakeStream(self.channel), FakeStream(self.channel), FakeStream(self.channel)
+
+
+def test_find_scan_drains_stderr_while_reading():
+    stdout = b"a.txt\t3\t1700000000.5\tf\0sub\t4096\t1700000000.0\td\0sub/b.txt\t5\t1700000001.0\tf\0"
+    channel = FakeChannel(stdout, [b"find: './x': Permission denied\n"] * 50, exit_status=1)
+    index = FORTEftp.RemoteIndex.from_ssh_find(FakeSSH(channel), "/www")
+
+    assert index.get("a.txt") == (3, 1700000000.5, False)
+    assert index.get("sub") == (None, 1700000000.0, True)
+    assert index.get("sub/b.txt") == (5, 1700000001.0, False)
+    # Nečitelné složky - strom není celý
+    assert index.listed == set()
+
+
+def test_find_without_printf_falls_back():
+    channel = FakeChannel(b"", [b"find: unknown predicate `-printf'\n"], exit_status=1)
+    assert FORTEftp.RemoteIndex.from_ssh_find(FakeSSH(channel), "/www") is None
@@ -0,0 +1,226 @@
+"""Přenosy přes SFTP - rozdělení na úseky, ověření součtu a zřetězený zápis
+
+Spuštění: python -m pytest tests
+"""
+
+import collections
+import os
+import sys
+
+import pytest
+
+pytest.importorskip("PyQt5")
+paramiko = pytest.importorskip("paramiko")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import FORTEftp  # noqa: E402
+
+MIB = 1024 * 1024
+
+
+class FakeRemoteFile:
+    """Vzdálený soubor nad lokálním souborem (jen to, co používají SFTP pomocníci)"""
+
+    def __init__(self, path, mode, corrupt_at=None):
+        self.file = open(path, mode)
+        self.corrupt_at = corrupt_at
+        self._reqs = collections.deque()
+
+    def __getattr__(self, name):
+        return getattr(self.file, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.file.close()
+
+    def set_pipelined(self, pipelined):
+        pass
+
+    def prefetch(self, *args):
+        pass
+
+    def stat(self):
+        return os.stat(self.file.name)
+
+    def write(self, data):
+        position = self.file.tell()
+        if self.corrupt_at is not None and position <= self.corrupt_at < position + len(data):
+            # Server zapíše jeden bajt špatně
+            index = self.corrupt_at - position
+            data = data[:index] + bytes([data[index] ^ 0xFF]) + data[index + 1:]
+        return self.file.write(data)
+
+
+class FakeTransport:
+    def open_session(self):
+        # Server jen pro SFTP - součet se spočítá čtením zpět
+        raise paramiko.SSHException("no exec")
+
+
+class FakeChannel:
+    def get_transport(self):
+        return FakeTransport()
+
+
+class FakeSFTP:
+    """SFTP klient, jehož "server" je lokální složka"""
+
+    def __init__(self, corrupt_at=None):
+        self.corrupt_at = corrupt_at
+
+    def get_channel(self):
+        return FakeChannel()
+
+    def open(self, path, mode):
+        return FakeRemoteFile(path, mode, self.corrupt_at)
+
+    def stat(self, path):
+        return os.stat(path)
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def sftp(monkeypatch):
+    client = FakeSFTP()
+    # Každá část si otevírá vlastní kanál - tady týž falešný klient
+    monkeypatch.setattr(FORTEftp, "open_tuned_sftp", lambda transport, tuning: client)
+    return client
+
+
+def write_random(path, size):
+    data = os.urandom(size)
+    with open(path, "wb") as f:
+        f.write(data)
+    return data
+
+
+@pytest.mark.parametrize("total, segments, expected", [
+    (0, 4, []),
+    (10, 4, [(0, 10)]),
+    # Každý úsek má aspoň 1 MiB - necelé 3 MiB jsou jen dva úseky
+    (3 * MIB - 1, 8, [(0, 3 * MIB // 2), (3 * MIB // 2, 3 * MIB - 1)]),
+    (4 * MIB, 2, [(0, 2 * MIB), (2 * MIB, 4 * MIB)]),
+    (9 * MIB + 1, 3, [(0, 3 * MIB + 1), (3 * MIB + 1, 6 * MIB + 2), (6 * MIB + 2, 9 * MIB + 1)]),
+])
+def test_segment_ranges(total, segments, expected):
+    assert FORTEftp.segment_ranges(total, segments) == expected
+
+
+@pytest.mark.parametrize("total, segments", [(1, 4), (5 * MIB + 123, 4), (16 * MIB, 16)])
+def test_segment_ranges_cover_file(total, segments):
+    ranges = FORTEftp.segment_ranges(total, segments)
+    assert ranges[0][0] == 0 and ranges[-1][1] == total
+    assert all(end == start for (_, end), (start, _) in zip(ranges, ranges[1:]))
+    assert len(ranges) <= segments
+
+
+def test_segmented_download(tmp_path, sftp):
+    source = tmp_path / "remote.bin"
+    dest = tmp_path / "local.bin"
+    data = write_random(source, 3 * MIB + 17)
+    progress = []
+
+    FORTEftp.transfer_segmented_sftp(sftp, "download", str(source), str(dest), 4,
+                                     lambda done, total: progress.append((done, total)))
+
+    assert dest.read_bytes() == data
+    assert max(done for done, _ in progress) == len(data)
+
+
+def test_segmented_upload(tmp_path, sftp):
+    source = tmp_path / "local.bin"
+    dest = tmp_path / "remote.bin"
+    data = write_random(source, 2 * MIB + 5)
+
+    FORTEftp.transfer_segmented_sftp(sftp, "upload", str(source), str(dest), 2)
+
+    assert dest.read_bytes() == data
+
+
+def test_segmented_upload_empty_file(tmp_path, sftp):
+    source = tmp_path / "empty.bin"
+    dest = tmp_path / "remote.bin"
+    source.write_bytes(b"")
+
+    FORTEftp.transfer_segmented_sftp(sftp, "upload", str(source), str(dest), 4)
+
+    assert dest.read_bytes() == b""
+
+
+def test_segmented_upload_checksum_mismatch(tmp_path, sftp):
+    source = tmp_path / "local.bin"
+    dest = tmp_path / "remote.bin"
+    write_random(source, 2 * MIB)
+    # Chyba ve druhém úseku
+    sftp.corrupt_at = MIB + 10
+
+    with pytest.raises(RuntimeError, match="nesouhlasí"):
+        FORTEftp.transfer_segmented_sftp(sftp, "upload", str(source), str(dest), 2)
+
+
+class PipelinedFile:
+    """Zřetězený zápis - každý write čeká na potvrzení v _reqs"""
+
+    def __init__(self):
+        self.data = b""
+        self._reqs = collections.deque()
+        self.max_pending = 0
+        self.pipelined = False
+        self.sftp = self
+
+    def set_pipelined(self, pipelined):
+        self.pipelined = pipelined
+
+    def write(self, chunk):
+        self.data += chunk
+        self._reqs.append(object())
+        self.max_pending = max(self.max_pending, len(self._reqs))
+
+    def _read_response(self, request):
+        return paramiko.sftp.CMD_STATUS, None
+
+
+def test_sftp_tuning_fills_defaults():
+    tuning = FORTEftp.sftp_tuning({'sftp_tuning': {'max_requests': 8}})
+    assert tuning == dict(FORTEftp.SFTP_DEFAULT_TUNING, max_requests=8)
+    assert FORTEftp.sftp_tuning({}) == FORTEftp.SFTP_DEFAULT_TUNING
+
+
+def test_pipelined_write_limits_pending_requests(tmp_path):
+    source = tmp_path / "local.bin"
+    data = write_random(source, 100 * 1024 + 7)
+    tuning = dict(FORTEftp.SFTP_DEFAULT_TUNING, request_size=1024, max_requests=4)
+    remote = PipelinedFile()
+    progress = []
+
+    with open(source, "rb") as f:
+        f.seek(10)
+        done = FORTEftp.sftp_write_from(f, remote, tuning, lambda done, total: progress.append(done), length=5000)
+
+    assert remote.pipelined
+    # Jeden čerstvý zápis nad limit, pak se čeká na potvrzení
+    assert remote.max_pending == 5
+    assert done == 5000 and remote.data == data[10:5010]
+    assert progress == [1024, 2048, 3072, 4096, 5000]
+
+
+def test_write_without_paramiko_internals_is_not_pipelined(tmp_path):
+    source = tmp_path / "local.bin"
+    data = write_random(source, 3000)
+    remote = PipelinedFile()
+    # Jiná verze paramiko bez fronty potvrzení
+    del remote._reqs
+    remote.pipelined = None
+    written = []
+    remote.write = written.append
+    tuning = dict(FORTEftp.SFTP_DEFAULT_TUNING, request_size=1024)
+
+    with open(source, "rb") as f:
+        assert FORTEftp.sftp_write_from(f, remote, tuning) == 3000
+
+    assert remote.pipelined is False
+    assert b"".join(written) == data
@@ -0,0 +1,168 @@
+"""Manifest nahraných souborů v dočasné SQLite databázi
+
+Spuštění: python -m pytest tests
+"""
+
+import os
+import sys
+
+import pytest
+
+pytest.importorskip("PyQt5")
+pytest.importorskip("paramiko")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import FORTEftp  # noqa: E402
+
+ENV = "Produkce"
+ROOT = "/www"
+
+
+@pytest.fixture
+def manifest(tmp_path):
+    return FORTEftp.SyncManifest(str(tmp_path / "manifest.sqlite"))
+
+
+def entry(rel_path, size=10, mtime_ns=1, content_hash=None):
+    return {'rel_path': rel_path, 'size': size, 'mtime_ns': mtime_ns, 'content_hash': content_hash}
+
+
+def test_verified_deploy_rebuilds_from_in_sync(manifest):
+    manifest.record_deploy(ENV, ROOT, [entry("old.php")], [], verified=False)
+
+    manifest.record_deploy(
+        ENV, ROOT, [entry("index.php", 20, 2, "abc")], [],
+        verified=True, in_sync=[entry("style.css")]
+    )
+
+    # Soubor, který plné porovnání nenašlo, z manifestu zmizí
+    assert manifest.load(ENV, ROOT) == {
+        "index.php": (20, 2, "abc"),
+        "style.css": (10, 1, None),
+    }
+
+
+def test_unverified_deploy_only_updates(manifest):
+    manifest.record_deploy(ENV, ROOT, [entry("a.php"), entry("b.php")], [], verified=True, in_sync=[])
+
+    manifest.record_deploy(ENV, ROOT, [entry("a.php", 11, 5)], [], verified=False)
+
+    assert manifest.load(ENV, ROOT) == {"a.php": (11, 5, None), "b.php": (10, 1, None)}
+
+
+def test_deleted_directory_removes_its_contents(manifest):
+    files = [entry("img/a.png"), entry("img/sub/b.png"), entry("img_2/c.png"), entry("imgx/d.png")]
+    manifest.record_deploy(ENV, ROOT, files, [], verified=False)
+
+    manifest.record_deploy(ENV, ROOT, [], ["img"], verified=False)
+
+    assert set(manifest.load(ENV, ROOT)) == {"img_2/c.png", "imgx/d.png"}
+
+    # "_" a "%" v názvu nejsou zástupné znaky LIKE
+    manifest.record_deploy(ENV, ROOT, [], ["img%", "img_"], verified=False)
+    assert set(manifest.load(ENV, ROOT)) == {"img_2/c.png", "imgx/d.png"}
+
+
+def test_environments_are_separate(manifest):
+    manifest.record_deploy(ENV, ROOT, [entry("a.php")], [], verified=False)
+
+    assert manifest.has_entries(ENV, ROOT)
+    assert not manifest.has_entries("Test", ROOT)
+    assert not manifest.has_entries(ENV, "/www/beta")
+    assert manifest.load("Test", ROOT) == {}
+
+
+def test_needs_verification_counts_deploys_since_last_check(manifest, monkeypatch):
+    clock = iter(range(1000, 2000))
+    monkeypatch.setattr(FORTEftp.time, "time", lambda: next(clock))
+
+    def deploy(verified):
+        manifest.record_deploy(ENV, ROOT, [], [], verified=verified, in_sync=[] if verified else None)
+
+    # Bez jediného ověření se počítají všechna nahrání
+    deploy(False)
+    assert not manifest.needs_verification(ENV, ROOT, 2)
+    deploy(False)
+    assert manifest.needs_verification(ENV, ROOT, 2)
+
+    deploy(True)
+    assert not manifest.needs_verification(ENV, ROOT, 2)
+    deploy(False)
+    assert not manifest.needs_verification(ENV, ROOT, 2)
+    deploy(False)
+    assert manifest.needs_verification(ENV, ROOT, 2)
+
+    # 0 = nikdy neověřovat, jiné prostředí má vlastní počítadlo
+    assert not manifest.needs_verification(ENV, ROOT, 0)
+    assert not manifest.needs_verification("Test", ROOT, 1)
+
+
+def test_deployed_commit(manifest):
+    assert manifest.deployed_commit(ENV, ROOT) is None
+
+    manifest.record_commit(ENV, ROOT, "abc123", {"z.txt", "a.txt"})
+
+    assert manifest.deployed_commit(ENV, ROOT) == ("abc123", ["a.txt", "z.txt"])
+
+
+def test_touch_keeps_hash(manifest):
+    manifest.record_deploy(ENV, ROOT, [entry("a.php", content_hash="abc")], [], verified=False)
+
+    manifest.touch(ENV, ROOT, [entry("a.php", mtime_ns=99)])
+
+    assert manifest.load(ENV, ROOT) == {"a.php": (10, 99, "abc")}
+
+
+def test_verified_deploy_keeps_hashes_of_unchanged_files(manifest):
+    manifest.record_deploy(
+        ENV, ROOT, [entry("a.php", content_hash="aaa"), entry("b.php", content_hash="bbb")], [],
+        verified=False
+    )
+
+    # Plné ověření bez hashů: a.php je beze změny, b.php má nový čas změny
+    manifest.record_deploy(ENV, ROOT, [], [], verified=True, in_sync=[entry("a.php"), entry("b.php", mtime_ns=7)])
+
+    assert manifest.load(ENV, ROOT) == {"a.php": (10, 1, "aaa"), "b.php": (10, 7, None)}
+
+
+class FakeTask:
+    def is_cancelled(self):
+        return False
+
+    def check_cancelled(self):
+        pass
+
+    def report(self, *args, **kwargs):
+        pass
+
+
+class SyncRecorder:
+    """Jen zápis manifestu z hlavního okna, bez Qt"""
+    add_local_hashes = FORTEftp.FORTEftp.add_local_hashes
+    record_sync_manifest = FORTEftp.FORTEftp.record_sync_manifest
+
+
+def test_verified_sync_hashes_in_sync_files(tmp_path, monkeypatch):
+    db_path = str(tmp_path / "manifest.sqlite")
+    manifest = FORTEftp.SyncManifest(db_path)
+    hash_cache = FORTEftp.LocalHashCache(db_path)
+    monkeypatch.setattr(FORTEftp, "SyncManifest", lambda: manifest)
+    monkeypatch.setattr(FORTEftp, "LocalHashCache", lambda: hash_cache)
+
+    def local(name, content):
+        path = tmp_path / name
+        path.write_bytes(content)
+        st = os.stat(path)
+        return {'rel_path': name, 'local': str(path), 'size': st.st_size, 'mtime_ns': st.st_mtime_ns}
+
+    unchanged = local("a.php", b"<?php echo 1;")
+    uploaded = local("b.php", b"<?php echo 2;")
+    SyncRecorder().record_sync_manifest(
+        FakeTask(), {'name': ENV}, ROOT,
+        {'mode': 'full', 'in_sync': [unchanged]}, [uploaded], []
+    )
+
+    # Souhlasící soubor má hash taky - git checkout, který změní jen čas, ho nenahraje znovu
+    entries = manifest.load(ENV, ROOT)
+    assert entries["a.php"][2] == FORTEftp.hash_file(unchanged['local'])
+    assert entries["b.php"][2] == FORTEftp.hash_file(uploaded['local'])